@@ -28,6 +28,11 @@ class UserManager(BaseUserManager):
 
         return self.create_user(phone_number, password, **extra_fields)
 
+    def add_storage_used(self, user_id, delta):
+        """Atomically adjust a user's storage used by delta bytes."""
+        if delta:
+            self.filter(pk=user_id).update(storage_used=models.F('storage_used') + delta)
+
 
 class User(AbstractUser):
     """Custom user model with phone_number as the primary identifier for WhatsApp OTP auth."""
@@ -63,8 +68,19 @@ class User(AbstractUser):
         """Check if user has enough storage for a new file."""
         return (self.storage_used + file_size) <= self.storage_quota
 
+    def add_storage_used(self, delta):
+        """Atomically adjust storage used by delta bytes."""
+        if delta:
+            User.objects.add_storage_used(self.pk, delta)
+            self.storage_used += delta
+
     def update_storage_used(self):
-        """Recalculate storage used based on uploaded documents."""
-        # Documents app removed - this is kept for legacy compatibility
-        self.storage_used = 0
+        """Recalculate storage used based on uploaded documents.
+
+        This is a full recomputation; uploads and deletes keep the counter
+        current through add_storage_used(). See the reconcile_storage
+        management command for repairing drift in bulk.
+        """
+        total = self.documents.aggregate(total=models.Sum('file_size'))['total']
+        self.storage_used = total or 0
         self.save(update_fields=['storage_used'])
@@ -0,0 +1,142 @@
+"""Download responses for documents.
+
+Supports conditional requests (ETag from the document checksum), single
+byte ranges for resumable downloads, and handing the transfer off to
+the front proxy with X-Sendfile or X-Accel-Redirect so Django only
+authorizes the request. Previews are cached by clients for
+DOCUMENT_PREVIEW_MAX_AGE since they never change for a document.
+"""
+import mimetypes
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header, parse_etags, quote_etag
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when a Range header does not overlap the file."""
+
+
+def parse_range(header, size):
+    """Parse a single-range Range header into an inclusive (start, end) tuple.
+
+    Returns None when the header is absent, malformed or asks for several
+    ranges, in which case the whole file is served.
+    """
+    match = RANGE_RE.match(header.replace(' ', '')) if header else None
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def iter_file_range(file, start, length):
+    """Yield length bytes of file starting at offset start."""
+    try:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def etag_matches(header, etag):
+    """Check an If-None-Match or If-Range header against an ETag."""
+    etags = parse_etags(header)
+    return '*' in etags or etag in etags
+
+
+def not_modified(request, etag):
+    """Return a 304 response if the client already holds etag, otherwise None."""
+    if etag and etag_matches(request.headers.get('If-None-Match', ''), etag):
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+    return None
+
+
+def cache_preview(response, etag):
+    """Let the client keep a preview response without revalidating it."""
+    max_age = getattr(settings, 'DOCUMENT_PREVIEW_MAX_AGE', 365 * 24 * 3600)
+    response['ETag'] = etag
+    response['Cache-Control'] = f"private, max-age={max_age}, immutable"
+    return response
+
+
+def document_download_response(request, document):
+    """Build the response that sends document's file to the client."""
+    etag = quote_etag(document.checksum) if document.checksum else None
+    response = not_modified(request, etag)
+    if response:
+        return response
+
+    accel = getattr(settings, 'DOCUMENT_DOWNLOAD_ACCEL', '')
+    if accel == 'x-sendfile':
+        response = HttpResponse()
+        response['X-Sendfile'] = document.file.path
+    elif accel == 'x-accel-redirect':
+        response = HttpResponse()
+        prefix = getattr(settings, 'DOCUMENT_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = f"{prefix}{document.file.name}"
+    else:
+        response = file_response(request, document, etag)
+
+    if accel in ('x-sendfile', 'x-accel-redirect'):
+        # Let the proxy take Content-Type from us and handle ranges itself
+        response['Content-Type'] = mimetypes.guess_type(document.name)[0] or 'application/octet-stream'
+        response['Content-Disposition'] = content_disposition_header(True, document.name)
+
+    if etag:
+        response['ETag'] = etag
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = 'private'
+    return response
+
+
+def file_response(request, document, etag):
+    """Serve the file from Django, honouring a single-range Range header."""
+    size = document.file_size
+    header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if header and if_range and not (etag and etag_matches(if_range, etag)):
+        header = None
+
+    try:
+        byte_range = parse_range(header, size)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{size}"
+        return response
+
+    if byte_range is None:
+        return FileResponse(document.file.open('rb'), as_attachment=True, filename=document.name)
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(
+        iter_file_range(document.file.open('rb'), start, length),
+        status=206,
+        content_type=mimetypes.guess_type(document.name)[0] or 'application/octet-stream',
+    )
+    response['Content-Range'] = f"bytes {start}-{end}/{size}"
+    response['Content-Length'] = str(length)
+    response['Content-Disposition'] = content_disposition_header(True, document.name)
+    return response
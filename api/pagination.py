@@ -0,0 +1,37 @@
+"""Keyset (cursor) pagination helpers for the API."""
+import base64
+
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(uploaded_at, pk):
+    """Encode an (uploaded_at, id) position as an opaque cursor string."""
+    raw = f"{uploaded_at.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor into an (uploaded_at, id) tuple.
+
+    Raises ValueError if the cursor is malformed.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        uploaded_at = parse_datetime(timestamp)
+        pk = int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+    if uploaded_at is None:
+        raise ValueError("Invalid cursor")
+    return uploaded_at, pk
+
+
+def parse_limit(value, default, maximum):
+    """Parse a page size from the query string, clamped to [1, maximum]."""
+    if value in (None, ''):
+        return default
+    limit = int(value)
+    if limit < 1:
+        raise ValueError("Limit must be positive")
+    return min(limit, maximum)
@@ -1,3 +1,417 @@
-from django.test import TestCase
+import hashlib
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from documents.models import Document, DocumentText
+from documents.previews import generate_previews, has_preview
+from documents.processing import ProcessingEngine
+from documents.testing import MediaRootMixin
+from folders.models import Folder
+from jobs.models import Job
+from jobs.worker import Worker
+
+User = get_user_model()
+
+
+class FolderListQueryCountTests(TestCase):
+    """The folder listing must cost a constant number of queries."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='+10000000001')
+        self.client.force_login(self.user)
+        self.url = reverse('api:folder_list')
+
+    def create_folders(self, count):
+        parent = Folder.objects.create(name='parent', owner=self.user)
+        folders = Folder.objects.bulk_create(
+            Folder(name=f'folder-{i}', owner=self.user, parent=parent)
+            for i in range(count)
+        )
+        Document.objects.bulk_create(
+            Document(
+                name=f'doc-{folder.pk}.txt',
+                file=f'documents/{folder.pk}.txt',
+                file_type='txt',
+                file_size=10,
+                owner=self.user,
+                folder=folder,
+            )
+            for folder in folders
+        )
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.json()['folders']
+
+    def test_query_count_is_constant(self):
+        self.create_folders(2)
+        small_count, _ = self.count_queries()
+
+        self.create_folders(200)
+        large_count, folders = self.count_queries()
+
+        self.assertEqual(len(folders), 2 + 1 + 200 + 1)
+        self.assertEqual(small_count, large_count)
+
+    def test_counts_and_sizes_are_annotated(self):
+        self.create_folders(3)
+        _, folders = self.count_queries()
+
+        by_name = {folder['name']: folder for folder in folders}
+        parent = by_name['parent']
+        self.assertEqual(parent['file_count'], 0)
+        self.assertEqual(parent['total_size'], 0)
+        self.assertIsNone(parent['parent_id'])
+        self.assertEqual(by_name['folder-0']['file_count'], 1)
+        self.assertEqual(by_name['folder-0']['total_size'], 10)
+        self.assertEqual(by_name['folder-0']['parent_id'], parent['id'])
+
+
+class DocumentListPaginationTests(TestCase):
+    """Keyset pagination and NDJSON streaming for the document listing."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='+10000000002')
+        self.client.force_login(self.user)
+        self.url = reverse('api:document_list')
+        Document.objects.bulk_create(
+            Document(
+                name=f'doc-{i}.txt',
+                file=f'documents/doc-{i}.txt',
+                file_type='txt',
+                file_size=i,
+                owner=self.user,
+            )
+            for i in range(25)
+        )
+
+    def test_cursor_walks_every_document_once(self):
+        seen = []
+        cursor = None
+        while True:
+            params = {'limit': 10}
+            if cursor:
+                params['cursor'] = cursor
+            data = self.client.get(self.url, params).json()
+            seen.extend(doc['id'] for doc in data['documents'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+
+        expected = list(
+            Document.objects.filter(owner=self.user)
+            .order_by('-uploaded_at', '-id')
+            .values_list('id', flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_ndjson_stream(self):
+        response = self.client.get(self.url, {'format': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 25)
+
+
+class FolderDetailSubtreeTests(TestCase):
+    """Recursive subtree totals for a folder."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='+10000000003')
+        self.client.force_login(self.user)
+        self.root = Folder.objects.create(name='root', owner=self.user)
+        child = Folder.objects.create(name='child', owner=self.user, parent=self.root)
+        grandchild = Folder.objects.create(name='grandchild', owner=self.user, parent=child)
+        Folder.objects.create(name='other', owner=self.user)
+        Document.objects.bulk_create(
+            Document(
+                name=f'doc-{folder.pk}.txt',
+                file=f'documents/{folder.pk}.txt',
+                file_type='txt',
+                file_size=size,
+                owner=self.user,
+                folder=folder,
+            )
+            for folder, size in [(self.root, 1), (child, 10), (grandchild, 100), (grandchild, 1000)]
+        )
+        call_command('reconcile_storage', stdout=StringIO())
+
+    def test_recursive_totals(self):
+        url = reverse('api:folder_detail', args=[self.root.pk])
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get(url, {'recursive': '1'}).json()
+        self.assertEqual(data['file_count'], 1)
+        self.assertEqual(data['total_size'], 1)
+        self.assertEqual(data['subtree_folder_count'], 3)
+        self.assertEqual(data['subtree_file_count'], 4)
+        self.assertEqual(data['subtree_total_size'], 1111)
+
+        subtree_queries = [q for q in ctx.captured_queries if '"path" LIKE' in q['sql']]
+        self.assertEqual(len(subtree_queries), 1)
+
+
+class BulkUploadTests(MediaRootMixin, TestCase):
+    """Multi-file uploads are stored as one batch."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(phone_number='+10000000004')
+        self.client.force_login(self.user)
+        self.url = reverse('api:document_list')
+
+    def make_files(self, count):
+        return [
+            SimpleUploadedFile(f'file-{i}.txt', f'contents of file {i}'.encode())
+            for i in range(count)
+        ]
+
+    def test_benchmark_500_files(self):
+        files = self.make_files(500)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(self.url, {'files': files})
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        self.assertEqual(data['uploaded'], 500)
+
+        # Session, user, quota reservation, blob references and the bulk
+        # INSERT batches (split by the backend's parameter limit); no
+        # query is issued per file.
+        self.assertLess(len(ctx.captured_queries), 15)
+
+        self.user.refresh_from_db()
+        expected_size = sum(len(f'contents of file {i}') for i in range(500))
+        self.assertEqual(self.user.storage_used, expected_size)
+
+        doc = Document.objects.get(name='file-7.txt')
+        self.assertEqual(doc.checksum, hashlib.sha256(b'contents of file 7').hexdigest())
+        self.assertEqual(doc.file_type, 'txt')
+
+        # Previews and processing are left to one background job each
+        jobs = {job.task: job for job in Job.objects.all()}
+        self.assertEqual(set(jobs), {'documents.generate_previews', 'documents.process'})
+        self.assertEqual(len(jobs['documents.process'].payload['document_ids']), 500)
+        self.assertEqual(doc.processing_status, 'pending')
+
+    def test_quota_is_checked_for_the_whole_batch(self):
+        User.objects.filter(pk=self.user.pk).update(storage_quota=30)
+        response = self.client.post(self.url, {'files': self.make_files(3)})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Storage quota exceeded')
+        self.assertFalse(Document.objects.exists())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.storage_used, 0)
+
+    def test_content_must_match_extension(self):
+        fake_pdf = SimpleUploadedFile('report.pdf', b'just some text')
+        response = self.client.post(self.url, {'files': [fake_pdf]})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Document.objects.exists())
+
+        real_pdf = SimpleUploadedFile('report.pdf', b'%PDF-1.4 minimal')
+        response = self.client.post(self.url, {'files': [real_pdf]})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(Document.objects.get().checksum, hashlib.sha256(b'%PDF-1.4 minimal').hexdigest())
+
+    @override_settings(ALLOWED_FILE_TYPES=['.txt', '.rtf'])
+    def test_allowed_extension_without_a_file_type(self):
+        response = self.client.post(self.url, {'files': [SimpleUploadedFile('notes.rtf', b'{\\rtf1}')]})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Document.objects.exists())
+
+    def test_blobs_are_written_before_the_quota_lock(self):
+        storage = Document._meta.get_field('file').storage
+        original_save = storage._save
+        locked_during_writes = []
+
+        def save(name, content):
+            locked_during_writes.append(any(
+                q['sql'].startswith('UPDATE') and 'storage_quota' in q['sql'] for q in ctx.captured_queries
+            ))
+            return original_save(name, content)
+
+        with CaptureQueriesContext(connection) as ctx, mock.patch.object(storage, '_save', side_effect=save):
+            response = self.client.post(self.url, {'files': self.make_files(3)})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(locked_during_writes, [False, False, False])
+
+
+class DocumentDownloadTests(MediaRootMixin, TestCase):
+    """Conditional, ranged and offloaded document downloads."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(phone_number='+10000000005')
+        self.client.force_login(self.user)
+        self.document = Document(
+            name='notes.txt',
+            file=SimpleUploadedFile('notes.txt', b'0123456789'),
+            owner=self.user,
+        )
+        self.document.save()
+        self.url = reverse('api:document_download', args=[self.document.pk])
+        self.etag = f'"{self.document.checksum}"'
+
+    def test_full_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_if_none_match(self):
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_ranges_of_an_empty_file(self):
+        empty = Document(name='empty.txt', file=SimpleUploadedFile('empty.txt', b''), owner=self.user)
+        empty.save()
+        url = reverse('api:document_download', args=[empty.pk])
+
+        for header in ('bytes=-3', 'bytes=0-'):
+            response = self.client.get(url, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 416)
+            self.assertEqual(response['Content-Range'], 'bytes */0')
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'')
+
+    @override_settings(DOCUMENT_DOWNLOAD_ACCEL='x-accel-redirect')
+    def test_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.document.file.name}')
+        self.assertEqual(response.content, b'')
+
+
+class DocumentPreviewTests(MediaRootMixin, TestCase):
+    """Previews are generated once per content and cached by clients."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(phone_number='+10000000009')
+        self.client.force_login(self.user)
+
+    def post_file(self, name, content):
+        response = self.client.post(reverse('api:document_list'), {
+            'files': [SimpleUploadedFile(name, content)],
+        })
+        return Document.objects.get(pk=response.json()['document_ids'][0])
+
+    def test_preview_generated_by_worker(self):
+        document = self.post_file('notes.md', b'# Notes\n\nLong   text ' + b'x' * 5000)
+        self.assertFalse(has_preview(document.checksum))
+        Worker().run(burst=True)
+        self.assertTrue(has_preview(document.checksum))
+
+        url = reverse('api:document_preview', args=[document.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['text'].startswith('# Notes\n\nLong text x'))
+        self.assertEqual(len(data['text']), 1000)
+        self.assertIsNone(data['thumbnail_url'])
+        self.assertIn('immutable', response['Cache-Control'])
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        thumbnail = self.client.get(reverse('api:document_thumbnail', args=[document.pk]))
+        self.assertEqual(thumbnail.status_code, 404)
+
+    def test_preview_shared_by_identical_content(self):
+        first = self.post_file('a.txt', b'same words')
+        response = self.client.get(reverse('api:document_preview', args=[first.pk]))
+        self.assertEqual(response.json()['text'], 'same words')
+
+        second = self.post_file('b.txt', b'same words')
+        self.assertFalse(generate_previews(second))
+
+
+class DocumentSearchTests(TestCase):
+    """Full-text search over extracted document text."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='+10000000006')
+        other = User.objects.create_user(phone_number='+10000000007')
+        self.client.force_login(self.user)
+        self.url = reverse('api:document_search')
+
+        texts = {
+            (self.user, 'loan.txt'): 'The loan application was approved for the market stall.',
+            (self.user, 'bill.txt'): 'Electricity bill for March, loan reference attached. Loan loan.',
+            (self.user, 'notes.txt'): 'Nothing relevant here.',
+            (other, 'secret.txt'): 'Another loan that belongs to someone else.',
+        }
+        documents = Document.objects.bulk_create(
+            Document(name=name, file=f'documents/{name}', file_type='txt', file_size=len(content), owner=owner)
+            for (owner, name), content in texts.items()
+        )
+        DocumentText.objects.bulk_create(
+            DocumentText(document=doc, content=content)
+            for doc, content in zip(documents, texts.values())
+        )
+
+    def test_ranked_hits_for_owner_only(self):
+        data = self.client.get(self.url, {'q': 'loan'}).json()
+        names = [hit['name'] for hit in data['results']]
+        self.assertEqual(names, ['bill.txt', 'loan.txt'])
+        self.assertIn('[loan]', data['results'][1]['snippet'].lower())
+        self.assertFalse(data['has_next'])
+
+    def test_pagination(self):
+        data = self.client.get(self.url, {'q': 'loan', 'page_size': 1}).json()
+        self.assertEqual(len(data['results']), 1)
+        self.assertTrue(data['has_next'])
+        data = self.client.get(self.url, {'q': 'loan', 'page_size': 1, 'page': 2}).json()
+        self.assertFalse(data['has_next'])
+
+    def test_query_syntax_is_literal(self):
+        response = self.client.get(self.url, {'q': 'loan" OR NOT ('})
+        self.assertEqual(response.status_code, 200)
+
+    def test_processing_indexes_text(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root):
+            doc = Document(
+                name='harvest.md',
+                file=SimpleUploadedFile('harvest.md', b'# Harvest\n\nMaize   yields rose.'),
+                owner=self.user,
+            )
+            doc.save()
+            ProcessingEngine(executor='thread').run(Document.objects.filter(pk=doc.pk))
+
+        self.assertEqual(DocumentText.objects.get(document=doc).content, '# Harvest\n\nMaize yields rose.')
+        data = self.client.get(self.url, {'q': 'maize'}).json()
+        self.assertEqual([hit['name'] for hit in data['results']], ['harvest.md'])
@@ -12,4 +12,9 @@ urlpatterns = [
     path('documents/', views.document_list, name='document_list'),
     path('documents/<int:document_id>/', views.document_detail, name='document_detail'),
     path('documents/<int:document_id>/download/', views.document_download, name='document_download'),
+    path('documents/<int:document_id>/preview/', views.document_preview, name='document_preview'),
+    path('documents/<int:document_id>/thumbnail/', views.document_thumbnail, name='document_thumbnail'),
+
+    # Search endpoints
+    path('search/', views.document_search, name='document_search'),
 ]
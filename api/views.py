@@ -1,12 +1,39 @@
-from django.http import JsonResponse, FileResponse, Http404
-from django.views.decorators.csrf import csrf_exempt
+from django.http import FileResponse, JsonResponse, Http404, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.urls import reverse
+from django.utils.http import quote_etag
 import json
 from folders.models import Folder
-from documents.models import Document
+from documents.models import Document, readable_size
+from documents.previews import (
+    PREVIEW_VERSION, generate_previews, has_thumbnail, preview_storage, read_preview_text, thumbnail_name,
+)
+from documents.search import search_documents
+from documents.uploadhandlers import hashing_upload_handlers
+from documents.uploads import StorageQuotaExceeded, create_documents
+from .downloads import cache_preview, document_download_response, not_modified
+from .pagination import decode_cursor, encode_cursor, parse_limit
+
+
+DOCUMENT_LIST_FIELDS = ('id', 'name', 'file_type', 'file_size', 'folder_id', 'uploaded_at')
+
+
+def serialize_document_row(row):
+    """Serialize a document row produced by ``.values(*DOCUMENT_LIST_FIELDS)``."""
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'file_type': row['file_type'],
+        'file_size': row['file_size'],
+        'readable_size': readable_size(row['file_size']),
+        'folder_id': row['folder_id'],
+        'uploaded_at': row['uploaded_at'].isoformat(),
+    }
 
 
 @login_required
@@ -15,15 +42,18 @@ def folder_list(request):
     """List folders or create a new folder."""
 
     if request.method == "GET":
-        folders = Folder.objects.filter(owner=request.user)
+        folders = Folder.objects.filter(owner=request.user).with_stats().values(
+            'id', 'name', 'parent_id', 'file_count', 'total_size', 'created_at',
+        )
         data = {
             'folders': [
                 {
-                    'id': folder.id,
-                    'name': folder.name,
-                    'parent_id': folder.parent.id if folder.parent else None,
-                    'file_count': folder.get_file_count(),
-                    'created_at': folder.created_at.isoformat(),
+                    'id': folder['id'],
+                    'name': folder['name'],
+                    'parent_id': folder['parent_id'],
+                    'file_count': folder['file_count'],
+                    'total_size': folder['total_size'],
+                    'created_at': folder['created_at'].isoformat(),
                 }
                 for folder in folders
             ]
@@ -57,7 +87,7 @@ def folder_list(request):
                 'folder': {
                     'id': folder.id,
                     'name': folder.name,
-                    'parent_id': folder.parent.id if folder.parent else None,
+                    'parent_id': folder.parent_id,
                 }
             })
 
@@ -78,13 +108,21 @@ def folder_detail(request, folder_id):
         return JsonResponse({'success': False, 'error': 'Folder not found'}, status=404)
 
     if request.method == "GET":
-        return JsonResponse({
+        data = {
             'id': folder.id,
             'name': folder.name,
-            'parent_id': folder.parent.id if folder.parent else None,
+            'parent_id': folder.parent_id,
             'file_count': folder.get_file_count(),
             'total_size': folder.get_total_size(),
-        })
+        }
+        if request.GET.get('recursive') in ('1', 'true'):
+            subtree = folder.get_subtree_stats()
+            data.update({
+                'subtree_folder_count': subtree['folder_count'],
+                'subtree_file_count': subtree['file_count'],
+                'subtree_total_size': subtree['total_size'],
+            })
+        return JsonResponse(data)
 
     elif request.method == "PUT":
         try:
@@ -109,9 +147,18 @@ def folder_detail(request, folder_id):
 
 @login_required
 @require_http_methods(["GET", "POST"])
+@csrf_exempt
 def document_list(request):
     """List documents or upload new documents."""
+    # Upload handlers must be swapped in before anything reads request.POST,
+    # so CSRF is checked by _document_list instead of the middleware.
+    request.upload_handlers = hashing_upload_handlers(request)
+    return _document_list(request)
+
 
+@csrf_protect
+def _document_list(request):
+    """List or create documents; CSRF-checked after the upload handlers are swapped in."""
     if request.method == "GET":
         folder_id = request.GET.get('folder_id')
 
@@ -122,19 +169,41 @@ def document_list(request):
         else:
             documents = Document.objects.filter(owner=request.user)
 
+        try:
+            limit = parse_limit(
+                request.GET.get('limit'),
+                default=getattr(settings, 'API_PAGE_SIZE', 100),
+                maximum=getattr(settings, 'API_MAX_PAGE_SIZE', 1000),
+            )
+            cursor = request.GET.get('cursor')
+            if cursor:
+                uploaded_at, pk = decode_cursor(cursor)
+                documents = documents.filter(
+                    Q(uploaded_at__lt=uploaded_at) | Q(uploaded_at=uploaded_at, id__lt=pk)
+                )
+        except ValueError as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+        documents = documents.order_by('-uploaded_at', '-id').values(*DOCUMENT_LIST_FIELDS)
+
+        if request.GET.get('format') == 'ndjson':
+            if request.GET.get('limit'):
+                documents = documents[:limit]
+            rows = documents.iterator(chunk_size=getattr(settings, 'API_STREAM_CHUNK_SIZE', 2000))
+            return StreamingHttpResponse(
+                (json.dumps(serialize_document_row(row)) + '\n' for row in rows),
+                content_type='application/x-ndjson',
+            )
+
+        rows = list(documents[:limit + 1])
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]['uploaded_at'], rows[-1]['id'])
+
         data = {
-            'documents': [
-                {
-                    'id': doc.id,
-                    'name': doc.name,
-                    'file_type': doc.file_type,
-                    'file_size': doc.file_size,
-                    'readable_size': doc.get_readable_size(),
-                    'folder_id': doc.folder.id if doc.folder else None,
-                    'uploaded_at': doc.uploaded_at.isoformat(),
-                }
-                for doc in documents
-            ]
+            'documents': [serialize_document_row(row) for row in rows],
+            'next_cursor': next_cursor,
         }
         return JsonResponse(data)
 
@@ -153,29 +222,14 @@ def document_list(request):
                 except Folder.DoesNotExist:
                     return JsonResponse({'success': False, 'error': 'Folder not found'}, status=404)
 
-            uploaded_docs = []
-            for file in files:
-                # Check file size
-                if file.size > settings.MAX_UPLOAD_SIZE:
-                    continue
-
-                # Check storage quota
-                if not request.user.has_storage_available(file.size):
-                    return JsonResponse({
-                        'success': False,
-                        'error': 'Storage quota exceeded'
-                    }, status=400)
-
-                # Create document
-                doc = Document(
-                    name=file.name,
-                    file=file,
-                    owner=request.user,
-                    folder=folder,
-                    file_size=file.size
-                )
-                doc.save()
-                uploaded_docs.append(doc.id)
+            try:
+                documents = create_documents(request.user, files, folder=folder)
+            except StorageQuotaExceeded:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Storage quota exceeded'
+                }, status=400)
+            uploaded_docs = [doc.id for doc in documents]
 
             return JsonResponse({
                 'success': True,
@@ -206,7 +260,7 @@ def document_detail(request, document_id):
             'file_type': document.file_type,
             'file_size': document.file_size,
             'readable_size': document.get_readable_size(),
-            'folder_id': document.folder.id if document.folder else None,
+            'folder_id': document.folder_id,
             'uploaded_at': document.uploaded_at.isoformat(),
         })
 
@@ -224,5 +278,100 @@ def document_download(request, document_id):
     except Document.DoesNotExist:
         raise Http404("Document not found")
 
-    response = FileResponse(document.file.open('rb'), as_attachment=True, filename=document.name)
-    return response
+    return document_download_response(request, document)
+
+
+@login_required
+@require_http_methods(["GET"])
+def document_preview(request, document_id):
+    """Get the text preview of a document and the URL of its thumbnail."""
+
+    try:
+        document = Document.objects.get(id=document_id, owner=request.user)
+    except Document.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Document not found'}, status=404)
+
+    etag = quote_etag(f"{document.checksum}-preview-v{PREVIEW_VERSION}")
+    response = not_modified(request, etag)
+    if response:
+        return response
+
+    # Normally done by a worker after upload; a no-op once the content has a preview
+    generate_previews(document)
+
+    thumbnail_url = None
+    if has_thumbnail(document.checksum):
+        thumbnail_url = reverse('api:document_thumbnail', args=[document.id])
+
+    return cache_preview(JsonResponse({
+        'id': document.id,
+        'text': read_preview_text(document.checksum),
+        'thumbnail_url': thumbnail_url,
+    }), etag)
+
+
+@login_required
+@require_http_methods(["GET"])
+def document_thumbnail(request, document_id):
+    """Get the first-page render of a document as a PNG image."""
+
+    try:
+        document = Document.objects.get(id=document_id, owner=request.user)
+    except Document.DoesNotExist:
+        raise Http404("Document not found")
+
+    etag = quote_etag(f"{document.checksum}-thumb-v{PREVIEW_VERSION}")
+    response = not_modified(request, etag)
+    if response:
+        return response
+
+    generate_previews(document)
+    if not has_thumbnail(document.checksum):
+        raise Http404("Thumbnail not available")
+
+    storage = preview_storage()
+    return cache_preview(
+        FileResponse(storage.open(thumbnail_name(document.checksum), 'rb'), content_type='image/png'),
+        etag,
+    )
+
+
+@login_required
+@require_http_methods(["GET"])
+def document_search(request):
+    """Full-text search over the user's documents, best match first."""
+
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'success': False, 'error': 'Search query is required'}, status=400)
+
+    try:
+        page = int(request.GET.get('page', 1))
+        if page < 1:
+            raise ValueError("Page must be positive")
+        page_size = parse_limit(
+            request.GET.get('page_size'),
+            default=getattr(settings, 'API_SEARCH_PAGE_SIZE', 20),
+            maximum=getattr(settings, 'API_MAX_PAGE_SIZE', 1000),
+        )
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    hits = search_documents(request.user, query, limit=page_size + 1, offset=(page - 1) * page_size)
+
+    return JsonResponse({
+        'results': [
+            {
+                'id': hit['id'],
+                'name': hit['name'],
+                'file_type': hit['file_type'],
+                'folder_id': hit['folder_id'],
+                'uploaded_at': hit['uploaded_at'].isoformat(),
+                'rank': hit['rank'],
+                'snippet': hit['snippet'],
+            }
+            for hit in hits[:page_size]
+        ],
+        'page': page,
+        'has_next': len(hits) > page_size,
+    })
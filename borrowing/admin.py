@@ -1,3 +1,17 @@
 from django.contrib import admin
+from .models import BorrowLedgerEntry
 
-# Register your models here.
+
+@admin.register(BorrowLedgerEntry)
+class BorrowLedgerEntryAdmin(admin.ModelAdmin):
+    """Read-only admin for the append-only borrow ledger."""
+
+    list_display = ('user', 'entry_type', 'amount', 'balance_after', 'created_at')
+    list_filter = ('entry_type', 'created_at')
+    search_fields = ('user__phone_number',)
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,44 @@
+"""Retrying units of work that lose a race for a user's balance.
+
+On PostgreSQL, select_for_update serializes writers per user. SQLite
+has no row locks, so a concurrent writer surfaces either as a version
+mismatch on BorrowLimit or as a "database is locked" error. Both are
+safe to retry from the start of the transaction.
+"""
+import random
+import time
+
+from django.db import OperationalError, connection
+
+MAX_ATTEMPTS = 10
+
+
+class BalanceConflict(Exception):
+    """Raised when a limit changed between reading and writing its balance."""
+
+
+def is_retryable(exc):
+    if isinstance(exc, BalanceConflict):
+        return True
+    if isinstance(exc, OperationalError):
+        message = str(exc).lower()
+        return 'locked' in message or 'deadlock' in message or 'could not serialize' in message
+    return False
+
+
+def run_with_retries(func, attempts=MAX_ATTEMPTS):
+    """Call func, retrying with jittered backoff while it loses races.
+
+    Inside an enclosing transaction a retry would only see the same
+    snapshot again, so func is run once and the outermost caller is
+    left to retry.
+    """
+    if connection.in_atomic_block:
+        return func()
+    for attempt in range(attempts):
+        try:
+            return func()
+        except Exception as e:
+            if attempt == attempts - 1 or not is_retryable(e):
+                raise
+            time.sleep(random.uniform(0, 0.005 * 2 ** attempt))
@@ -0,0 +1,140 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+from borrowing.models import BorrowLedgerEntry, BorrowLimit, BorrowTransaction
+from borrowing.services import borrow
+
+User = get_user_model()
+
+
+def quantized_totals(rows):
+    """Map (key, total) rows to cent-exact Decimals; SQLite sums decimals as floats."""
+    return {key: Decimal(total).quantize(Decimal('0.01')) for key, total in rows}
+
+
+class Command(BaseCommand):
+    help = 'Fire concurrent borrow requests at a few test users and check that nobody is overdrawn'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=20,
+            help='Number of test users sharing the requests',
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=2000,
+            help='Total number of borrow requests',
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=16,
+            help='Number of concurrent client threads',
+        )
+        parser.add_argument(
+            '--amount',
+            type=str,
+            default='3',
+            help='Amount requested by every borrow',
+        )
+        parser.add_argument(
+            '--limit',
+            type=str,
+            default='100',
+            help='Borrow limit of every test user',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the test users and their transactions afterwards',
+        )
+
+    def handle(self, *args, **options):
+        limit = Decimal(options['limit'])
+        tag = uuid.uuid4().hex[:8]
+        users = [
+            User.objects.create_user(phone_number=f"+load{tag}{i:05d}")
+            for i in range(options['users'])
+        ]
+        for user in users:
+            BorrowLimit.objects.create(user=user, max_borrow_amount=limit, available_borrow=limit, is_locked=False)
+
+        self.stdout.write(
+            f"Sending {options['requests']} request(s) for {len(users)} user(s) from {options['threads']} thread(s)"
+        )
+
+        def send(i):
+            try:
+                borrow(users[i % len(users)], options['amount'])
+                return None
+            except Exception as e:
+                return e
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            errors = [e for e in pool.map(send, range(options['requests'])) if e is not None]
+        elapsed = time.perf_counter() - started
+
+        try:
+            problems = self.find_problems(users, limit)
+            if errors:
+                problems.append(f"{len(errors)} request(s) failed, first: {errors[0]!r}")
+            approved = BorrowTransaction.objects.filter(user__in=users, status='approved').count()
+            self.stdout.write(
+                f"{options['requests']} request(s) in {elapsed:.2f}s "
+                f"({options['requests'] / elapsed:.0f} req/s), {approved} approved"
+            )
+        finally:
+            if not options['keep']:
+                User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+        if problems:
+            raise CommandError("\n".join(problems))
+        self.stdout.write(self.style.SUCCESS("No overdraw and every balance matches the ledger"))
+
+    def find_problems(self, users, limit):
+        """Return a list of consistency problems found for the test users."""
+        problems = []
+        spent = quantized_totals(
+            BorrowTransaction.objects.filter(user__in=users, status='approved')
+            .order_by().values_list('user_id').annotate(total=Sum('amount_debit'))
+        )
+        for borrow_limit in BorrowLimit.objects.filter(user__in=users):
+            expected = limit - spent.get(borrow_limit.user_id, 0)
+            if borrow_limit.available_borrow < 0:
+                problems.append(f"User {borrow_limit.user_id} overdrawn: {borrow_limit.available_borrow}")
+            if borrow_limit.available_borrow != expected:
+                problems.append(
+                    f"User {borrow_limit.user_id} has {borrow_limit.available_borrow}, expected {expected}"
+                )
+
+            # Approved requests must chain: each starts where the previous ended
+            previous = limit
+            entries = BorrowLedgerEntry.objects.filter(
+                user_id=borrow_limit.user_id, entry_type='borrow',
+            ).select_related('borrow_transaction').order_by('id')
+            for entry in entries:
+                borrow_transaction = entry.borrow_transaction
+                if borrow_transaction.amount_before != previous or borrow_transaction.amount_after != entry.balance_after:
+                    problems.append(f"Transaction {borrow_transaction.pk} breaks the balance chain")
+                previous = entry.balance_after
+
+        ledger_totals = quantized_totals(
+            BorrowLedgerEntry.objects.filter(user__in=users)
+            .order_by().values_list('user_id').annotate(total=Sum('amount'))
+        )
+        for borrow_limit in BorrowLimit.objects.filter(user__in=users):
+            if ledger_totals.get(borrow_limit.user_id) != borrow_limit.available_borrow:
+                problems.append(f"User {borrow_limit.user_id} does not match the ledger")
+
+        if BorrowTransaction.objects.filter(user__in=users, status='pending').exists():
+            problems.append("Some requests were never settled")
+        return problems
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from borrowing.models import BorrowTransaction
+from borrowing.services import settle_pending
+
+
+class Command(BaseCommand):
+    help = 'Settle pending borrow transactions in batches of users'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of users settled per transaction',
+        )
+        parser.add_argument(
+            '--quiet',
+            action='store_true',
+            help='Only print the final report',
+        )
+
+    def handle(self, *args, **options):
+        pending = BorrowTransaction.objects.filter(status='pending', processed=False).count()
+        self.stdout.write(f"Found {pending} pending transaction(s)")
+
+        def report(stats):
+            if options['quiet']:
+                return
+            settled = stats['approved'] + stats['rejected']
+            self.stdout.write(
+                f"  {stats['users']} user(s), {settled} transaction(s), "
+                f"{settled / max(stats['seconds'], 1e-9):.0f} tx/s"
+            )
+
+        stats = settle_pending(batch_size=options['batch_size'], on_batch=report)
+
+        settled = stats['approved'] + stats['rejected']
+        self.stdout.write(self.style.SUCCESS(
+            f"Settled {settled} transaction(s) for {stats['users']} user(s) in {stats['seconds']:.2f}s "
+            f"({settled / max(stats['seconds'], 1e-9):.0f} tx/s): "
+            f"{stats['approved']} approved, {stats['rejected']} rejected"
+        ))
@@ -0,0 +1,85 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, OuterRef, Subquery, Sum
+from borrowing.models import BorrowLedgerEntry, BorrowLimit
+
+
+class Command(BaseCommand):
+    help = 'Check every available borrow balance against the borrow ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Reset drifted balances to the ledger total and open missing ledgers',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of limits written per UPDATE batch',
+        )
+
+    def handle(self, *args, **options):
+        # SQLite sums decimals as floats, so round totals back to cents
+        totals = {
+            user_id: Decimal(total).quantize(Decimal('0.01'))
+            for user_id, total in BorrowLedgerEntry.objects.order_by().values_list('user_id').annotate(total=Sum('amount'))
+        }
+        last_balances = BorrowLedgerEntry.objects.filter(user_id=OuterRef('user_id')).order_by('-id')
+        limits = BorrowLimit.objects.annotate(
+            last_balance=Subquery(last_balances.values('balance_after')[:1]),
+        ).only('pk', 'user_id', 'available_borrow', 'version')
+
+        drifted = []
+        unopened = []
+        broken_chains = 0
+        checked = 0
+        for limit in limits.iterator(chunk_size=5000):
+            checked += 1
+            if limit.user_id not in totals:
+                unopened.append(limit)
+                continue
+            total = totals[limit.user_id]
+            if limit.last_balance != total:
+                broken_chains += 1
+                self.stdout.write(self.style.WARNING(
+                    f"User {limit.user_id}: last running balance {limit.last_balance} != ledger total {total}"
+                ))
+            if limit.available_borrow != total:
+                self.stdout.write(self.style.WARNING(
+                    f"User {limit.user_id}: available {limit.available_borrow} != ledger total {total}"
+                ))
+                limit.available_borrow = total
+                limit.version = F('version') + 1
+                drifted.append(limit)
+
+        self.stdout.write(
+            f"Checked {checked} limit(s): {len(drifted)} drifted, {len(unopened)} without a ledger, "
+            f"{broken_chains} with inconsistent running balances"
+        )
+
+        if not options['fix']:
+            if drifted or unopened or broken_chains:
+                raise CommandError("Borrow ledger does not match available balances")
+            self.stdout.write(self.style.SUCCESS("Borrow ledger is consistent"))
+            return
+
+        BorrowLimit.objects.bulk_update(drifted, ['available_borrow', 'version'], batch_size=options['batch_size'])
+        BorrowLedgerEntry.objects.bulk_create(
+            [
+                BorrowLedgerEntry(
+                    user_id=limit.user_id,
+                    entry_type='opening',
+                    amount=limit.available_borrow,
+                    balance_after=limit.available_borrow,
+                    notes='Opened by verify_borrow_ledger',
+                )
+                for limit in unopened
+            ],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Reset {len(drifted)} balance(s), opened {len(unopened)} ledger(s)"
+        ))
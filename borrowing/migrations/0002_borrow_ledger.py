@@ -0,0 +1,56 @@
+# Generated by Django 5.0.1 on 2026-10-17 02:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def open_ledgers(apps, schema_editor):
+    """Start every existing limit's ledger at its current available balance."""
+    BorrowLimit = apps.get_model('borrowing', 'BorrowLimit')
+    BorrowLedgerEntry = apps.get_model('borrowing', 'BorrowLedgerEntry')
+    BorrowLedgerEntry.objects.bulk_create(
+        [
+            BorrowLedgerEntry(
+                user_id=user_id,
+                entry_type='opening',
+                amount=available,
+                balance_after=available,
+                notes='Balance when the ledger was introduced',
+            )
+            for user_id, available in BorrowLimit.objects.values_list('user_id', 'available_borrow').iterator()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BorrowLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entry_type', models.CharField(choices=[('opening', 'Opening Balance'), ('borrow', 'Borrow'), ('repayment', 'Repayment'), ('limit_change', 'Limit Change'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('balance_after', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('notes', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('borrow_transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='borrowing.borrowtransaction')),
+                ('repayment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='borrowing.borrowrepayment')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='borrow_ledger', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Borrow Ledger Entry',
+                'verbose_name_plural': 'Borrow Ledger Entries',
+                'db_table': 'borrow_ledger_entry',
+                'indexes': [models.Index(fields=['user', 'id'], name='borrow_ledg_user_id_802a27_idx')],
+            },
+        ),
+        migrations.RunPython(open_ledgers, migrations.RunPython.noop),
+    ]
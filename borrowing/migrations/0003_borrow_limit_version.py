@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-17 02:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0002_borrow_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='borrowlimit',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.1 on 2026-10-17 02:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0003_borrow_limit_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='borrowtransaction',
+            index=models.Index(fields=['status', 'user', 'created_at'], name='borrow_tx_settlement_idx'),
+        ),
+    ]
@@ -1,9 +1,13 @@
-from django.db import models
+from django.db import connection, models, transaction
 from django.contrib.auth import get_user_model
-from decimal import Decimal
+from django.utils import timezone
+from decimal import Decimal, ROUND_HALF_UP
+from .concurrency import BalanceConflict, run_with_retries
 
 User = get_user_model()
 
+CENT = Decimal('0.01')
+
 
 class BorrowLimit(models.Model):
     """Determine max borrowable amount based on KYC level and score."""
@@ -12,6 +16,7 @@ class BorrowLimit(models.Model):
     max_borrow_amount = models.DecimalField(max_digits=10, decimal_places=2, default=20)
     available_borrow = models.DecimalField(max_digits=10, decimal_places=2, default=20)
     is_locked = models.BooleanField(default=True)  # Locked until KYC Level 1
+    version = models.PositiveIntegerField(default=0)  # Bumped on every balance change
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -23,15 +28,139 @@ class BorrowLimit(models.Model):
         verbose_name = 'Borrow Limit'
         verbose_name_plural = 'Borrow Limits'
 
+    def save(self, *args, **kwargs):
+        """Open the ledger of a new limit with its starting balance."""
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                BorrowLedgerEntry.objects.create(
+                    user_id=self.user_id,
+                    entry_type='opening',
+                    amount=self.available_borrow,
+                    balance_after=self.available_borrow,
+                )
+
+    @classmethod
+    def lock(cls, user_id):
+        """Return the user's limit locked for update, creating it if needed.
+
+        Must be called inside a transaction.
+        """
+        if not connection.features.has_select_for_update:
+            # SQLite: a no-op write takes the database write lock up front,
+            # so concurrent writers wait for it instead of failing later
+            cls.objects.filter(user_id=user_id).update(version=models.F('version'))
+        try:
+            return cls.objects.select_for_update().get(user_id=user_id)
+        except cls.DoesNotExist:
+            cls.objects.create(user_id=user_id)
+            return cls.objects.select_for_update().get(user_id=user_id)
+
+    def commit_balance(self, balance):
+        """Store a new available balance unless another writer got there first.
+
+        Raises BalanceConflict if the row's version no longer matches the
+        one this instance was read with.
+        """
+        updated = BorrowLimit.objects.filter(pk=self.pk, version=self.version).update(
+            available_borrow=balance,
+            version=models.F('version') + 1,
+            updated_at=timezone.now(),
+        )
+        if not updated:
+            raise BalanceConflict(f"Borrow limit {self.pk} changed concurrently")
+        self.available_borrow = balance
+        self.version += 1
+
+    @classmethod
+    def commit_balances(cls, limits, balances):
+        """Store new available balances of many limits, version-checked like commit_balance.
+
+        balances maps a user id to the new balance. One prepared UPDATE
+        per row is run through executemany; if any row's version no longer
+        matches, BalanceConflict is raised and the caller's transaction
+        must be rolled back.
+        """
+        if not limits:
+            return
+        now = timezone.now()
+        fields = {name: cls._meta.get_field(name) for name in ('available_borrow', 'version', 'updated_at')}
+        qn = connection.ops.quote_name
+        version = qn(fields['version'].column)
+        sql = "UPDATE {} SET {} = %s, {} = {} + 1, {} = %s WHERE {} = %s AND {} = %s".format(
+            qn(cls._meta.db_table),
+            qn(fields['available_borrow'].column), version, version,
+            qn(fields['updated_at'].column), qn(cls._meta.pk.column), version,
+        )
+        params = [
+            [
+                fields['available_borrow'].get_db_prep_save(balances[limit.user_id], connection),
+                fields['updated_at'].get_db_prep_save(now, connection),
+                limit.pk,
+                limit.version,
+            ]
+            for limit in limits
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+            updated = cursor.rowcount
+        if updated != len(limits):
+            raise BalanceConflict(f"{len(limits) - updated} borrow limit(s) changed concurrently")
+        for limit in limits:
+            limit.available_borrow = balances[limit.user_id]
+            limit.version += 1
+            limit.updated_at = now
+
+    @classmethod
+    def post_entry(cls, user_id, amount, entry_type, borrow_transaction=None, repayment=None, notes=''):
+        """Append a ledger entry and move the user's available balance by amount.
+
+        The limit row is locked and version-checked, so concurrent entries
+        get consecutive running balances. This is a constant amount of
+        work however long the ledger is.
+        """
+        def post():
+            with transaction.atomic():
+                limit = cls.lock(user_id)
+                limit.commit_balance(limit.available_borrow + amount)
+                return BorrowLedgerEntry.objects.create(
+                    user_id=user_id,
+                    entry_type=entry_type,
+                    amount=amount,
+                    balance_after=limit.available_borrow,
+                    borrow_transaction=borrow_transaction,
+                    repayment=repayment,
+                    notes=notes,
+                )
+        return run_with_retries(post)
+
+    def set_max_borrow_amount(self, amount):
+        """Change the limit, moving the available balance by the same difference."""
+        amount = Decimal(str(amount))
+        with transaction.atomic():
+            locked = BorrowLimit.objects.select_for_update().get(pk=self.pk)
+            delta = amount - locked.max_borrow_amount
+            BorrowLimit.objects.filter(pk=self.pk).update(max_borrow_amount=amount)
+            if delta:
+                BorrowLimit.post_entry(self.user_id, delta, 'limit_change')
+        self.refresh_from_db(fields=['max_borrow_amount', 'available_borrow', 'version', 'updated_at'])
+
     def update_available(self):
-        """Recalculate available borrow based on transactions."""
-        total_borrowed = BorrowTransaction.objects.filter(
-            user=self.user,
-            processed=True
-        ).aggregate(models.Sum('amount_debit'))['amount_debit__sum'] or 0
+        """Reset available borrow to the balance recorded in the ledger.
+
+        Normal borrows and repayments keep the balance current through
+        post_entry; this is only needed to repair drift, see the
+        verify_borrow_ledger command.
+        """
+        self.available_borrow = self.ledger_entries().aggregate(
+            total=models.Sum('amount'),
+        )['total'] or Decimal('0')
+        self.version += 1
+        self.save(update_fields=['available_borrow', 'version', 'updated_at'])
 
-        self.available_borrow = self.max_borrow_amount - Decimal(str(total_borrowed))
-        self.save()
+    def ledger_entries(self):
+        return BorrowLedgerEntry.objects.filter(user_id=self.user_id)
 
 
 class BorrowTransaction(models.Model):
@@ -67,12 +196,83 @@ class BorrowTransaction(models.Model):
         verbose_name = 'Borrow Transaction'
         verbose_name_plural = 'Borrow Transactions'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'user', 'created_at'], name='borrow_tx_settlement_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the stored status, when it was loaded."""
+        instance = super().from_db(db, field_names, values)
+        if 'status' in field_names:
+            instance._stored_status = values[field_names.index('status')]
+        return instance
+
+    def save(self, *args, **kwargs):
+        """Debit the user's available balance when the transaction is first processed.
 
-    def calculate_fee(self):
-        """Calculate fee based on percentage from settings."""
+        The row is claimed with an UPDATE that only matches while it is
+        unprocessed, so the debit is posted once however the instance was
+        loaded. A debited transaction that is rejected later is credited
+        back.
+        """
+        adding = self._state.adding
+        with transaction.atomic():
+            if adding:
+                newly_processed = self.processed
+            elif self.processed:
+                newly_processed = bool(
+                    BorrowTransaction.objects.filter(pk=self.pk, processed=False).update(processed=True)
+                )
+            else:
+                newly_processed = False
+            super().save(*args, **kwargs)
+            if newly_processed and self.status != 'rejected':
+                BorrowLimit.post_entry(self.user_id, -self.amount_debit, 'borrow', borrow_transaction=self)
+            elif self.status == 'rejected' and getattr(self, '_stored_status', None) != 'rejected':
+                debited = self.debited_amount()
+                if debited:
+                    BorrowLimit.post_entry(
+                        self.user_id, debited, 'adjustment', borrow_transaction=self,
+                        notes=f"Reversal of rejected transaction {self.pk}",
+                    )
+        self._stored_status = self.status
+
+    def delete(self, *args, **kwargs):
+        """Reverse any outstanding debit of the transaction before deleting it."""
+        with transaction.atomic():
+            debited = self.debited_amount()
+            if debited:
+                BorrowLimit.post_entry(
+                    self.user_id, debited, 'adjustment', notes=f"Reversal of transaction {self.pk}",
+                )
+            return super().delete(*args, **kwargs)
+
+    def debited_amount(self):
+        """Return how much the ledger entries of this transaction have taken from the balance."""
+        total = BorrowLedgerEntry.objects.filter(borrow_transaction=self).aggregate(total=models.Sum('amount'))['total']
+        return -(total or 0)
+
+    @staticmethod
+    def fee_rate():
+        """Return the borrow fee as a fraction of the requested amount."""
         from django.conf import settings
         fee_percent = getattr(settings, 'BORROW_FEE_PERCENT', 5)
-        return Decimal(str(self.amount_requested)) * (Decimal(str(fee_percent)) / Decimal('100'))
+        return Decimal(str(fee_percent)) / Decimal('100')
+
+    def calculate_fee(self, rate=None):
+        """Calculate fee based on percentage from settings, rounded to the cent."""
+        if rate is None:
+            rate = self.fee_rate()
+        return (Decimal(str(self.amount_requested)) * rate).quantize(CENT, rounding=ROUND_HALF_UP)
+
+    @classmethod
+    def apply_fees(cls, transactions):
+        """Set borrow_fee and amount_debit on many transactions using one fee rate."""
+        rate = cls.fee_rate()
+        for borrow_transaction in transactions:
+            borrow_transaction.borrow_fee = borrow_transaction.calculate_fee(rate)
+            borrow_transaction.amount_debit = borrow_transaction.amount_requested + borrow_transaction.borrow_fee
 
 
 class BorrowRepayment(models.Model):
@@ -86,7 +286,73 @@ class BorrowRepayment(models.Model):
     def __str__(self):
         return f"Repayment - {self.amount_paid}"
 
+    def save(self, *args, **kwargs):
+        """Credit the repaid amount back to the user's available balance."""
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                BorrowLimit.post_entry(
+                    self.transaction.user_id, self.amount_paid, 'repayment', repayment=self,
+                )
+
+    def delete(self, *args, **kwargs):
+        """Reverse the credit of a repayment before deleting it."""
+        with transaction.atomic():
+            BorrowLimit.post_entry(
+                self.transaction.user_id, -self.amount_paid, 'adjustment', notes=f"Reversal of repayment {self.pk}",
+            )
+            return super().delete(*args, **kwargs)
+
     class Meta:
         db_table = 'borrow_repayment'
         verbose_name = 'Borrow Repayment'
         verbose_name_plural = 'Borrow Repayments'
+
+
+class BorrowLedgerEntry(models.Model):
+    """Append-only record of every change to a user's available borrow balance.
+
+    The sum of a user's entries is their available balance, and each
+    entry stores the running balance after it was applied.
+    """
+
+    ENTRY_TYPES = [
+        ('opening', 'Opening Balance'),
+        ('borrow', 'Borrow'),
+        ('repayment', 'Repayment'),
+        ('limit_change', 'Limit Change'),
+        ('adjustment', 'Adjustment'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='borrow_ledger')
+    entry_type = models.CharField(max_length=20, choices=ENTRY_TYPES)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)  # Signed change to available
+    balance_after = models.DecimalField(max_digits=12, decimal_places=2)
+    borrow_transaction = models.ForeignKey(
+        BorrowTransaction, on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_entries',
+    )
+    repayment = models.ForeignKey(
+        BorrowRepayment, on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_entries',
+    )
+    notes = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user_id} {self.entry_type} {self.amount} -> {self.balance_after}"
+
+    class Meta:
+        db_table = 'borrow_ledger_entry'
+        verbose_name = 'Borrow Ledger Entry'
+        verbose_name_plural = 'Borrow Ledger Entries'
+        indexes = [
+            models.Index(fields=['user', 'id']),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Ledger entries cannot be changed; post an adjustment instead.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Ledger entries cannot be deleted; post an adjustment instead.")
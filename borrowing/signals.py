@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent with user_ids after pending borrow requests of those users were
+# settled in bulk, since bulk writes do not send post_save
+borrow_settled = Signal()
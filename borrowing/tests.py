@@ -1,3 +1,261 @@
-from django.test import TestCase
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import connection, models, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from dashboard.models import DashboardSummary
+
+from . import services
+from .concurrency import BalanceConflict
+from .models import BorrowLedgerEntry, BorrowLimit, BorrowRepayment, BorrowTransaction
+
+User = get_user_model()
+
+
+class BorrowLedgerTests(TestCase):
+    """Available balances are maintained through an append-only ledger."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='+10000000200')
+        self.limit = BorrowLimit.objects.create(user=self.user)
+
+    def borrow(self, amount, **kwargs):
+        fields = dict(
+            user=self.user,
+            amount_before=0,
+            amount_requested=amount,
+            borrow_fee=0,
+            amount_debit=amount,
+            amount_after=0,
+            status='approved',
+        )
+        fields.update(kwargs)
+        return BorrowTransaction.objects.create(**fields)
+
+    def balances(self):
+        return list(BorrowLedgerEntry.objects.filter(user=self.user).order_by('id').values_list('entry_type', 'balance_after'))
+
+    def test_borrow_and_repay(self):
+        transaction = self.borrow(Decimal('5.25'))
+        self.borrow(3, status='pending')  # Not processed, no entry
+        transaction.processed = True
+        transaction.save()
+        transaction.save()  # Saving again does not debit twice
+        BorrowRepayment.objects.create(transaction=transaction, amount_paid=2)
+
+        self.limit.refresh_from_db()
+        self.assertEqual(self.limit.available_borrow, Decimal('16.75'))
+        self.assertEqual(self.balances(), [
+            ('opening', Decimal('20')),
+            ('borrow', Decimal('14.75')),
+            ('repayment', Decimal('16.75')),
+        ])
+
+    def test_deferred_load_does_not_debit_again(self):
+        transaction = self.borrow(5, processed=True)
+        loaded = BorrowTransaction.objects.only('id', 'user', 'status').get(pk=transaction.pk)
+        loaded.status = 'completed'
+        loaded.save()
+
+        self.limit.refresh_from_db()
+        self.assertEqual(self.limit.available_borrow, Decimal('15'))
+        self.assertEqual(BorrowLedgerEntry.objects.filter(entry_type='borrow').count(), 1)
+
+    def test_rejecting_a_debited_transaction_credits_it_back(self):
+        transaction = self.borrow(5, processed=True)
+        transaction.status = 'rejected'
+        transaction.save()
+        transaction.save()  # Credited once
+        self.limit.refresh_from_db()
+        self.assertEqual(self.limit.available_borrow, Decimal('20'))
+
+        # Deleting it afterwards has nothing left to reverse
+        BorrowTransaction.objects.get(pk=transaction.pk).delete()
+        self.limit.refresh_from_db()
+        self.assertEqual(self.limit.available_borrow, Decimal('20'))
+        self.assertEqual(self.balances(), [
+            ('opening', Decimal('20')),
+            ('borrow', Decimal('15')),
+            ('adjustment', Decimal('20')),
+        ])
+        call_command('verify_borrow_ledger', stdout=StringIO())
+
+    def test_entry_cost_does_not_grow_with_the_ledger(self):
+        with CaptureQueriesContext(connection) as first:
+            self.borrow(1, processed=True)
+        for _ in range(10):
+            self.borrow(1, processed=True)
+        with CaptureQueriesContext(connection) as later:
+            self.borrow(1, processed=True)
+        self.assertEqual(len(later.captured_queries), len(first.captured_queries))
+
+    def test_limit_change_and_reversal(self):
+        self.limit.set_max_borrow_amount(50)
+        self.assertEqual(self.limit.available_borrow, Decimal('50'))
+
+        transaction = self.borrow(10, processed=True)
+        transaction.delete()
+        self.limit.refresh_from_db()
+        self.assertEqual(self.limit.available_borrow, Decimal('50'))
+        self.assertIsNone(BorrowLedgerEntry.objects.filter(entry_type='borrow').get().borrow_transaction)
+
+    def test_entries_are_append_only(self):
+        entry = BorrowLedgerEntry.objects.get()
+        with self.assertRaises(ValueError):
+            entry.save()
+        with self.assertRaises(ValueError):
+            entry.delete()
+
+    def test_verify_detects_and_fixes_drift(self):
+        self.borrow(4, processed=True)
+        call_command('verify_borrow_ledger', stdout=StringIO())
+
+        BorrowLimit.objects.filter(pk=self.limit.pk).update(available_borrow=99)
+        with self.assertRaises(CommandError):
+            call_command('verify_borrow_ledger', stdout=StringIO())
+
+        call_command('verify_borrow_ledger', '--fix', stdout=StringIO())
+        self.limit.refresh_from_db()
+        self.assertEqual(self.limit.available_borrow, Decimal('16'))
+        call_command('verify_borrow_ledger', stdout=StringIO())
+
+
+class BorrowServiceTests(TestCase):
+    """Pending requests are settled in order under the user's lock."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='+10000000201')
+        BorrowLimit.objects.create(user=self.user, max_borrow_amount=10, available_borrow=10, is_locked=False)
+
+    def test_requests_settle_in_order_without_overdraw(self):
+        requests = [services.request_borrow(self.user, amount) for amount in (4, 4, 4, 1)]
+        self.assertEqual(requests[0].amount_debit, Decimal('4.20'))
+
+        stats = services.settle_pending()
+        self.assertEqual((stats['approved'], stats['rejected']), (3, 1))
+        statuses = [
+            (borrow.status, borrow.amount_before, borrow.amount_after)
+            for borrow in BorrowTransaction.objects.order_by('id')
+        ]
+        self.assertEqual(statuses, [
+            ('approved', Decimal('10.00'), Decimal('5.80')),
+            ('approved', Decimal('5.80'), Decimal('1.60')),
+            ('rejected', Decimal('1.60'), Decimal('1.60')),
+            ('approved', Decimal('1.60'), Decimal('0.55')),
+        ])
+        self.assertEqual(BorrowLimit.objects.get(user=self.user).available_borrow, Decimal('0.55'))
+        call_command('verify_borrow_ledger', stdout=StringIO())
+
+    def test_locked_limit_rejects(self):
+        BorrowLimit.objects.filter(user=self.user).update(is_locked=True)
+        self.assertEqual(services.borrow(self.user, 1).status, 'rejected')
+
+    def test_stale_version_conflicts(self):
+        limit = BorrowLimit.objects.get(user=self.user)
+        BorrowLimit.post_entry(self.user.pk, -1, 'adjustment')
+        with self.assertRaises(BalanceConflict):
+            limit.commit_balance(Decimal('5'))
+
+    def test_invalid_amount(self):
+        with self.assertRaises(services.InvalidBorrowAmount):
+            services.request_borrow(self.user, 0)
+
+
+class SettlementTests(TestCase):
+    """End-of-day settlement works in batches of users with bulk writes."""
+
+    def setUp(self):
+        self.users = [User.objects.create_user(phone_number=f'+1000000030{i}') for i in range(6)]
+        for user in self.users:
+            BorrowLimit.objects.create(user=user, max_borrow_amount=10, available_borrow=10, is_locked=False)
+        # Rows written without fees, as an import or admin edit would
+        BorrowTransaction.objects.bulk_create([
+            BorrowTransaction(
+                user=user,
+                amount_before=0,
+                amount_requested=Decimal('3.33'),
+                borrow_fee=0,
+                amount_debit=0,
+                amount_after=0,
+            )
+            for user in self.users
+            for _ in range(4)
+        ])
+
+    def test_settle_borrows(self):
+        out = StringIO()
+        with CaptureQueriesContext(connection) as ctx:
+            call_command('settle_borrows', '--batch-size', '3', stdout=out)
+        self.assertIn('Settled 24 transaction(s) for 6 user(s)', out.getvalue())
+        self.assertIn('12 approved, 12 rejected', out.getvalue())
+
+        # Per batch: lookup, locks, pending rows and bulk writes; nothing per row
+        self.assertLess(len(ctx.captured_queries), 30)
+
+        borrow = BorrowTransaction.objects.filter(status='approved').first()
+        self.assertEqual((borrow.borrow_fee, borrow.amount_debit), (Decimal('0.17'), Decimal('3.50')))
+        self.assertEqual(BorrowLimit.objects.get(user=self.users[0]).available_borrow, Decimal('3.00'))
+        call_command('verify_borrow_ledger', stdout=StringIO())
+
+    def test_limits_are_locked_in_primary_key_order(self):
+        user_ids = [user.pk for user in reversed(self.users)]
+        with CaptureQueriesContext(connection) as ctx, transaction.atomic():
+            limits = services.lock_limits(user_ids)
+        self.assertEqual(set(limits), set(user_ids))
+        select = next(query['sql'] for query in ctx.captured_queries if query['sql'].startswith('SELECT'))
+        self.assertIn('ORDER BY "borrow_limit"."id" ASC', select)
+
+    def test_batch_conflict_is_rolled_back(self):
+        lock_limits = services.lock_limits
+        user_ids = [user.pk for user in self.users[:3]]
+
+        def lock_then_lose_race(user_ids):
+            limits = lock_limits(user_ids)
+            # Another writer bumps one limit between our read and write
+            BorrowLimit.objects.filter(user=self.users[1]).update(version=models.F('version') + 1)
+            return limits
+
+        with mock.patch.object(services, 'lock_limits', lock_then_lose_race):
+            with self.assertRaises(BalanceConflict), transaction.atomic():
+                services.settle_users(user_ids)
+        self.assertFalse(BorrowTransaction.objects.filter(processed=True).exists())
+        self.assertFalse(BorrowLedgerEntry.objects.filter(entry_type='borrow').exists())
+
+        # The retry reads the new version and settles the batch
+        self.assertEqual(services.settle_users(user_ids), {'approved': 6, 'rejected': 6})
+        self.assertEqual(BorrowLimit.objects.get(user=self.users[1]).version, 1)
+
+    def test_dashboards_refresh_after_commit(self):
+        summary = DashboardSummary.objects.for_user(self.users[0])
+        with self.captureOnCommitCallbacks() as callbacks:
+            services.settle_users([self.users[0].pk])
+        summary.refresh_from_db()
+        self.assertEqual(summary.total_borrowed, 0)
+
+        for callback in callbacks:
+            callback()
+        summary.refresh_from_db()
+        self.assertEqual(summary.total_borrowed, Decimal('7.00'))
+        self.assertEqual(summary.available_borrow, Decimal('3.00'))
+
+
+class BorrowLoadTests(TransactionTestCase):
+    """Concurrent requests never overdraw a user."""
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("Shared-cache in-memory SQLite fails concurrent readers instead of waiting for locks")
+
+    def test_load_harness(self):
+        out = StringIO()
+        call_command(
+            'borrow_load_test', '--users', '3', '--requests', '60', '--threads', '3',
+            '--amount', '3', '--limit', '50', stdout=out,
+        )
+        self.assertIn('No overdraw', out.getvalue())
+        self.assertFalse(User.objects.exists())
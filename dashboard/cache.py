@@ -0,0 +1,55 @@
+"""Per-user versions for the dashboard's cached template fragments.
+
+Fragments are cached under the user's current version, so bumping the
+version makes every cached fragment of that user stale at once without
+having to know their keys.
+
+A process-local backend such as the LocMemCache default cannot see
+versions bumped by other processes, so fragments are only cached there
+when DASHBOARD_CACHE_LOCAL says the site runs in a single process.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+VERSION_KEY = 'dashboard:version:{}'
+
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def fragments_cacheable():
+    """Return whether dashboard fragments may be cached by the default backend."""
+    if getattr(settings, 'DASHBOARD_CACHE_LOCAL', False):
+        return True
+    return not isinstance(caches['default'], PROCESS_LOCAL_BACKENDS)
+
+
+def get_dashboard_version(user_id):
+    """Return the user's current fragment version, starting one if needed."""
+    key = VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock so a version lost to eviction is never reused
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_dashboard_version(user_id):
+    """Invalidate every cached dashboard fragment of a user once the transaction commits.
+
+    Bumping earlier would let a concurrent request cache fragments of the
+    uncommitted state under the new version.
+    """
+    transaction.on_commit(lambda: _incr_version(user_id))
+
+
+def _incr_version(user_id):
+    try:
+        cache.incr(VERSION_KEY.format(user_id))
+    except ValueError:
+        pass  # No version yet; the next read starts a fresh one
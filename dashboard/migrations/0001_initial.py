@@ -0,0 +1,38 @@
+# Generated by Django 5.0.1 on 2026-10-17 02:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('accounts', '0002_remove_user_email_remove_user_is_email_verified_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='dashboard_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('kyc_level', models.IntegerField(default=0)),
+                ('score', models.IntegerField(default=0)),
+                ('aid_recipient', models.BooleanField(default=True)),
+                ('max_borrow_amount', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('available_borrow', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('borrow_locked', models.BooleanField(default=True)),
+                ('total_borrowed', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('recent_transactions', models.JSONField(blank=True, default=list)),
+                ('referrals_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Dashboard Summary',
+                'verbose_name_plural': 'Dashboard Summaries',
+                'db_table': 'dashboard_summary',
+            },
+        ),
+    ]
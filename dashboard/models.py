@@ -1,3 +1,133 @@
 from django.db import models
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from borrowing.models import BorrowLimit, BorrowTransaction
+from kyc.models import KYCProfile
+from scoring.models import ReferralStats
 
-# Create your models here.
+User = get_user_model()
+
+RECENT_TRANSACTIONS = 5
+
+
+class DashboardSummaryManager(models.Manager):
+    """Build and refresh the per-user dashboard read model."""
+
+    def profile_fields(self, user_id):
+        user = User.objects.only('kyc_level', 'score', 'aid_recipient').get(pk=user_id)
+        return {'kyc_level': user.kyc_level, 'score': user.score, 'aid_recipient': user.aid_recipient}
+
+    def limit_fields(self, user_id):
+        limit = BorrowLimit.objects.filter(user_id=user_id).first()
+        if limit is None:
+            return {}
+        return {
+            'max_borrow_amount': limit.max_borrow_amount,
+            'available_borrow': limit.available_borrow,
+            'borrow_locked': limit.is_locked,
+        }
+
+    def transaction_fields(self, user_id):
+        transactions = BorrowTransaction.objects.filter(user_id=user_id)
+        total = transactions.filter(
+            processed=True,
+            status__in=['approved', 'completed'],
+        ).aggregate(total=models.Sum('amount_debit'))['total'] or 0
+        recent = transactions.order_by('-created_at').values(
+            'id', 'status', 'amount_debit', 'created_at',
+        )[:RECENT_TRANSACTIONS]
+        return {
+            'total_borrowed': total,
+            'recent_transactions': [
+                {
+                    'id': row['id'],
+                    'status': row['status'],
+                    'amount_debit': str(row['amount_debit']),
+                    'created_at': row['created_at'].isoformat(),
+                }
+                for row in recent
+            ],
+        }
+
+    def referral_fields(self, user_id):
+        stats = ReferralStats.objects.filter(pk=user_id).values_list('invites_count', flat=True)
+        return {'referrals_count': stats.first() or 0}
+
+    PARTS = {
+        'profile': 'profile_fields',
+        'limit': 'limit_fields',
+        'transactions': 'transaction_fields',
+        'referrals': 'referral_fields',
+    }
+
+    def refresh(self, user_id, *parts):
+        """Recompute parts of an existing summary; users without one are skipped.
+
+        Summaries are created on first use by for_user, so signals never
+        build one for a user who has not opened the dashboard.
+        """
+        fields = {}
+        for part in parts:
+            fields.update(getattr(self, self.PARTS[part])(user_id))
+        if fields:
+            self.filter(pk=user_id).update(updated_at=timezone.now(), **fields)
+
+    def build(self, user_id):
+        """Create or overwrite the summary of a user from the source tables."""
+        fields = {}
+        for method in self.PARTS.values():
+            fields.update(getattr(self, method)(user_id))
+        summary, _ = self.update_or_create(user_id=user_id, defaults=fields)
+        return summary
+
+    def for_user(self, user):
+        """Return the user's summary, building it on first use."""
+        try:
+            return self.get(pk=user.pk)
+        except self.model.DoesNotExist:
+            KYCProfile.objects.get_or_create(user=user)
+            BorrowLimit.objects.get_or_create(user=user)
+            return self.build(user.pk)
+
+
+class DashboardSummary(models.Model):
+    """Denormalized per-user dashboard data, kept current by signals."""
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='dashboard_summary')
+
+    kyc_level = models.IntegerField(default=0)
+    score = models.IntegerField(default=0)
+    aid_recipient = models.BooleanField(default=True)
+
+    max_borrow_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    available_borrow = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    borrow_locked = models.BooleanField(default=True)
+
+    total_borrowed = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    recent_transactions = models.JSONField(default=list, blank=True)
+    referrals_count = models.PositiveIntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = DashboardSummaryManager()
+
+    class Meta:
+        db_table = 'dashboard_summary'
+        verbose_name = 'Dashboard Summary'
+        verbose_name_plural = 'Dashboard Summaries'
+
+    def __str__(self):
+        return f"Dashboard - {self.user_id}"
+
+    def get_recent_transactions(self):
+        """Return the stored recent transactions ready for display."""
+        statuses = dict(BorrowTransaction.STATUS_CHOICES)
+        return [
+            {
+                **row,
+                'status_display': statuses.get(row['status'], row['status']),
+                'created_at': parse_datetime(row['created_at']),
+            }
+            for row in self.recent_transactions
+        ]
@@ -0,0 +1,91 @@
+"""Keep DashboardSummary in step with the tables it is built from.
+
+Every change also bumps the user's dashboard version, which retires the
+user's cached dashboard fragments.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from borrowing.models import BorrowLedgerEntry, BorrowLimit, BorrowTransaction
+from borrowing.signals import borrow_settled
+from kyc.models import KYCProfile
+from scoring.signals import points_awarded, referral_stats_changed, scores_recomputed
+from .cache import bump_dashboard_version
+from .models import DashboardSummary
+
+User = get_user_model()
+
+PROFILE_FIELDS = {'kyc_level', 'score', 'aid_recipient'}
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and not PROFILE_FIELDS.intersection(update_fields)):
+        return
+    DashboardSummary.objects.refresh(instance.pk, 'profile')
+    bump_dashboard_version(instance.pk)
+
+
+@receiver(post_save, sender=KYCProfile)
+def kyc_profile_saved(sender, instance, **kwargs):
+    # Completing a KYC level updates the user's kyc_level alongside the profile
+    DashboardSummary.objects.refresh(instance.user_id, 'profile')
+    bump_dashboard_version(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=BorrowLimit)
+def borrow_limit_changed(sender, instance, **kwargs):
+    DashboardSummary.objects.refresh(instance.user_id, 'limit')
+    bump_dashboard_version(instance.user_id)
+
+
+@receiver(post_save, sender=BorrowLedgerEntry)
+def borrow_ledger_entry_posted(sender, instance, **kwargs):
+    # Ledger entries move the available balance with an UPDATE, not a save
+    DashboardSummary.objects.refresh(instance.user_id, 'limit')
+    bump_dashboard_version(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=BorrowTransaction)
+def borrow_transaction_changed(sender, instance, **kwargs):
+    DashboardSummary.objects.refresh(instance.user_id, 'transactions')
+    bump_dashboard_version(instance.user_id)
+
+
+@receiver(borrow_settled)
+def borrow_requests_settled(sender, user_ids, **kwargs):
+    # Settlement holds the batch's limit locks; refresh once they are released
+    transaction.on_commit(lambda: refresh_settled_summaries(user_ids))
+
+
+def refresh_settled_summaries(user_ids):
+    # Settlement covers many users at once; only refresh existing summaries
+    for user_id in DashboardSummary.objects.filter(pk__in=user_ids).values_list('pk', flat=True):
+        DashboardSummary.objects.refresh(user_id, 'limit', 'transactions')
+        bump_dashboard_version(user_id)
+
+
+@receiver([scores_recomputed, points_awarded])
+def user_scores_changed(sender, user_ids, **kwargs):
+    # Score writes can cover every user; copy the scores in one UPDATE
+    summaries = DashboardSummary.objects.filter(pk__in=user_ids)
+    summary_ids = list(summaries.values_list('pk', flat=True))
+    if not summary_ids:
+        return
+    summaries.update(
+        score=Subquery(User.objects.filter(pk=OuterRef('pk')).values('score')[:1]),
+        updated_at=timezone.now(),
+    )
+    for user_id in summary_ids:
+        bump_dashboard_version(user_id)
+
+
+@receiver(referral_stats_changed)
+def referral_stats_updated(sender, user_ids, **kwargs):
+    for user_id in DashboardSummary.objects.filter(pk__in=user_ids).values_list('pk', flat=True):
+        DashboardSummary.objects.refresh(user_id, 'referrals')
+        bump_dashboard_version(user_id)
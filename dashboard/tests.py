@@ -1,3 +1,98 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from borrowing.models import BorrowLimit, BorrowTransaction
+from kyc.models import KYCProfile
+from scoring.models import Referral
+from .models import DashboardSummary
+
+User = get_user_model()
+
+
+class DashboardSummaryTests(TestCase):
+    """The dashboard renders from a summary kept current by signals."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(phone_number='+10000000100')
+        self.client.force_login(self.user)
+        self.url = reverse('dashboard:index')
+
+    def borrow(self, amount, status='approved'):
+        return BorrowTransaction.objects.create(
+            user=self.user,
+            amount_before=20,
+            amount_requested=amount,
+            borrow_fee=0,
+            amount_debit=amount,
+            amount_after=20 - amount,
+            status=status,
+            processed=True,
+        )
+
+    def test_first_visit_builds_summary(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(KYCProfile.objects.filter(user=self.user).exists())
+        self.assertTrue(BorrowLimit.objects.filter(user=self.user).exists())
+        summary = DashboardSummary.objects.get(pk=self.user.pk)
+        self.assertEqual(summary.max_borrow_amount, Decimal('20'))
+
+    def test_signals_keep_summary_current(self):
+        self.client.get(self.url)
+
+        self.borrow(5)
+        self.borrow(3, status='rejected')
+        Referral.objects.create(referrer=self.user, referral_code='abc12345', referred_phone='+1999')
+        self.user.score = 75
+        self.user.save()
+        BorrowLimit.objects.filter(user=self.user).get().save()
+
+        summary = DashboardSummary.objects.get(pk=self.user.pk)
+        self.assertEqual(summary.total_borrowed, Decimal('5'))
+        self.assertEqual(len(summary.recent_transactions), 2)
+        self.assertEqual(summary.referrals_count, 1)
+        self.assertEqual(summary.score, 75)
+
+        transaction = BorrowTransaction.objects.get(status='approved')
+        transaction.delete()
+        summary.refresh_from_db()
+        self.assertEqual(summary.total_borrowed, 0)
+
+    def test_page_renders_from_one_lookup(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.borrow(5)
+
+        # Session, user and the summary row
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Approved')
+        self.assertContains(response, '5.00')
+
+    @override_settings(DASHBOARD_CACHE_LOCAL=True)
+    def test_repeat_views_use_cached_fragments(self):
+        self.client.get(self.url)
+
+        # Session and user only; the panels come from the cache
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'You have invited 0 people')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Referral.objects.create(referrer=self.user, referral_code='abc12345', referred_phone='+1999')
+        response = self.client.get(self.url)
+        self.assertContains(response, 'You have invited 1 people')
+
+    def test_process_local_cache_is_not_used_for_fragments(self):
+        self.client.get(self.url)
+
+        # Another process would not see this process's version bump
+        DashboardSummary.objects.filter(pk=self.user.pk).update(referrals_count=4)
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'You have invited 4 people')
@@ -1,9 +1,9 @@
+from django.conf import settings
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from django.db.models import Sum
-from kyc.models import KYCProfile
-from borrowing.models import BorrowLimit, BorrowTransaction
-from scoring.models import Referral
+from django.utils.functional import SimpleLazyObject
+from .cache import fragments_cacheable, get_dashboard_version
+from .models import DashboardSummary
 
 
 @login_required
@@ -12,35 +12,16 @@ def index(request):
 
     user = request.user
 
-    # Get or create KYC profile
-    kyc_profile, _ = KYCProfile.objects.get_or_create(user=user)
-
-    # Get or create borrow limit
-    borrow_limit, _ = BorrowLimit.objects.get_or_create(user=user)
-
-    # Get recent transactions
-    recent_transactions = BorrowTransaction.objects.filter(user=user).order_by('-created_at')[:5]
-
-    # Get referrals made
-    referrals_count = Referral.objects.filter(referrer=user).count()
-
-    # Calculate total borrowed
-    total_borrowed = BorrowTransaction.objects.filter(
-        user=user,
-        processed=True,
-        status__in=['approved', 'completed']
-    ).aggregate(total=Sum('amount_debit'))['total'] or 0
-
-    context = {
-        'user': user,
-        'kyc_profile': kyc_profile,
-        'kyc_level': user.kyc_level,
-        'score': user.score,
-        'aid_recipient': user.aid_recipient,
-        'borrow_limit': borrow_limit,
-        'recent_transactions': recent_transactions,
-        'referrals_count': referrals_count,
-        'total_borrowed': total_borrowed,
-    }
+    # Everything on the page comes from the user's precomputed summary,
+    # which is only loaded when a cached fragment has to be re-rendered
+    summary = SimpleLazyObject(lambda: DashboardSummary.objects.for_user(user))
+
+    context = {'user': user, 'summary': summary}
+    if fragments_cacheable():
+        context['dashboard_version'] = get_dashboard_version(user.pk)
+        context['cache_timeout'] = getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 600)
+    else:
+        # Rendered every time: a timeout of 0 expires the fragment at once
+        context['cache_timeout'] = 0
 
     return render(request, 'dashboard/index.html', context)
@@ -42,6 +42,10 @@ INSTALLED_APPS = [
     # Local apps
     'accounts',
     'dashboard',
+    'folders',
+    'documents',
+    'api',
+    'jobs',
     # New lending platform apps
     'whatsapp_auth',
     'kyc',
@@ -91,6 +95,18 @@ DATABASES = {
 }
 
 
+# Cache
+# Defaults to per-process memory; point CACHE_BACKEND/CACHE_LOCATION at a
+# shared cache (e.g. django.core.cache.backends.redis.RedisCache) in production
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -153,10 +169,46 @@ DEFAULT_FROM_EMAIL = 'noreply@documentmanager.com'
 # File upload settings
 MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB
 ALLOWED_FILE_TYPES = ['.txt', '.md', '.pdf', '.doc', '.docx']
+DATA_UPLOAD_MAX_NUMBER_FILES = 1000  # Files accepted in one multi-file upload
+
+# Download offloading: '' (serve from Django), 'x-sendfile' (Apache/lighttpd)
+# or 'x-accel-redirect' (nginx, with an internal location at the prefix below)
+DOCUMENT_DOWNLOAD_ACCEL = config('DOCUMENT_DOWNLOAD_ACCEL', default='')
+DOCUMENT_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Document previews, generated once per file content
+DOCUMENT_PREVIEW_CHARS = 1000
+DOCUMENT_THUMBNAIL_WIDTH = 320  # Pixels; PDF first-page renders need pypdfium2
+DOCUMENT_PREVIEW_MAX_AGE = 365 * 24 * 3600  # Previews never change for a document
 
 # Storage settings
 DEFAULT_STORAGE_QUOTA = 1024 * 1024 * 1024  # 1GB
 
+# API listing settings
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+API_STREAM_CHUNK_SIZE = 2000  # Rows fetched per round trip when streaming NDJSON
+API_SEARCH_PAGE_SIZE = 20
+
+# Background jobs (run with `python manage.py run_workers`)
+JOBS_RETRY_BACKOFF = 10  # Seconds before the first retry, doubled after each failure
+JOBS_RETRY_MAX_DELAY = 3600
+JOBS_LOCK_TIMEOUT = 3600  # Running jobs older than this are requeued on worker start
+
+# Dashboard settings
+DASHBOARD_CACHE_TIMEOUT = 600  # Seconds a rendered dashboard fragment is kept
+# Fragments are not cached in a process-local backend (LocMemCache) unless the
+# site runs in a single process; point CACHE_BACKEND at Redis or Memcached instead
+DASHBOARD_CACHE_LOCAL = config('DASHBOARD_CACHE_LOCAL', default=False, cast=bool)
+
+# Referral codes are a keyed permutation of a database sequence. Never change
+# the key once codes have been issued, or new codes may repeat old ones; the
+# sequence records the key's fingerprint and code generation stops with
+# CodeKeyChanged if it differs. Set a dedicated key so rotating SECRET_KEY
+# does not change it.
+REFERRAL_CODE_KEY = config('REFERRAL_CODE_KEY', default=SECRET_KEY)
+REFERRAL_CODE_BLOCK_SIZE = 100  # Sequence values each process reserves at a time
+
 # Security settings
 SESSION_COOKIE_AGE = 1209600  # 2 weeks
 PASSWORD_RESET_TIMEOUT = 3600  # 1 hour
@@ -193,6 +245,7 @@ KYC_LEVEL_2_REQUIRES = ['business_registration', 'electricity_bill']
 
 # Scoring Settings
 BASE_REFERRAL_POINTS = 50
+SCORE_RULES_CACHE_TTL = 60  # Seconds a process keeps the active scoring rules without reloading
 PHONE_BILL_UPLOAD_POINTS = 25
 
 # Borrowing Settings
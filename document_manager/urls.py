@@ -24,6 +24,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('auth/', include('whatsapp_auth.urls')),
     path('dashboard/', include('dashboard.urls')),
+    path('api/', include('api.urls')),
     path('', RedirectView.as_view(url='/auth/request-otp/', permanent=False)),
 ]
 
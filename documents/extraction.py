@@ -0,0 +1,66 @@
+"""Text extraction for documents.
+
+extract_text() returns the normalized plain text of a document file.
+PDF and DOCX support needs the optional ``pypdf`` and ``python-docx``
+packages; without them extraction of those types raises
+ExtractionUnavailable.
+"""
+import re
+import unicodedata
+
+from .readers import DocumentReader
+
+WHITESPACE_RE = re.compile(r'[ \t\r\f\v]+')
+BLANK_LINES_RE = re.compile(r'\n\s*\n+')
+
+
+class ExtractionUnavailable(Exception):
+    """Raised when a file type cannot be extracted in this environment."""
+
+
+def normalize_text(text):
+    """Normalize Unicode, collapse runs of spaces and blank lines, and trim."""
+    text = unicodedata.normalize('NFKC', text).replace('\x00', '')
+    text = WHITESPACE_RE.sub(' ', text)
+    text = BLANK_LINES_RE.sub('\n\n', text)
+    return '\n'.join(line.strip() for line in text.split('\n')).strip()
+
+
+def extract_plain_text(path):
+    """Decode a text file in chunks, detecting its encoding."""
+    with DocumentReader(path) as reader:
+        return ''.join(reader.iter_text())
+
+
+def extract_pdf_text(path):
+    try:
+        import pypdf
+    except ImportError:
+        raise ExtractionUnavailable("Install pypdf to extract text from PDFs")
+    reader = pypdf.PdfReader(path)
+    return '\n\n'.join(page.extract_text() or '' for page in reader.pages)
+
+
+def extract_docx_text(path):
+    try:
+        import docx
+    except ImportError:
+        raise ExtractionUnavailable("Install python-docx to extract text from Word documents")
+    document = docx.Document(path)
+    return '\n'.join(paragraph.text for paragraph in document.paragraphs)
+
+
+EXTRACTORS = {
+    'txt': extract_plain_text,
+    'md': extract_plain_text,
+    'pdf': extract_pdf_text,
+    'docx': extract_docx_text,
+}
+
+
+def extract_text(path, file_type):
+    """Return the normalized text of a document file."""
+    extractor = EXTRACTORS.get(file_type)
+    if extractor is None:
+        raise ExtractionUnavailable(f"Text extraction is not supported for {file_type} files")
+    return normalize_text(extractor(path))
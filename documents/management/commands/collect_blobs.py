@@ -0,0 +1,112 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from documents.models import Blob, Document
+from documents.previews import delete_previews
+from documents.storage import BLOB_PREFIX
+
+
+class Command(BaseCommand):
+    help = 'Delete content-addressed blobs that no document references'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report what would be deleted',
+        )
+        parser.add_argument(
+            '--recount',
+            action='store_true',
+            help='Recompute blob reference counts from documents before collecting',
+        )
+        parser.add_argument(
+            '--orphans',
+            action='store_true',
+            help='Also delete blob files on disk that have no Blob row',
+        )
+        parser.add_argument(
+            '--grace-hours',
+            type=float,
+            default=24,
+            help='Minimum age of orphaned files before they are deleted (default: 24)',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        storage = Blob._meta.get_field('file').storage
+
+        if options['recount']:
+            self.recount(dry_run)
+
+        collected = 0
+        freed = 0
+        for blob in Blob.objects.filter(ref_count__lte=0).iterator(chunk_size=1000):
+            if dry_run:
+                self.stdout.write(f"Would delete {blob.file.name}")
+                collected += 1
+                freed += blob.size
+                continue
+            with transaction.atomic():
+                deleted, _ = Blob.objects.filter(pk=blob.pk, ref_count__lte=0).delete()
+                if deleted:
+                    storage.delete(blob.file.name)
+                    delete_previews(blob.checksum)
+                    collected += 1
+                    freed += blob.size
+
+        self.stdout.write(self.style.SUCCESS(f"Collected {collected} blob(s), {freed} bytes"))
+
+        if options['orphans']:
+            self.collect_orphans(storage, options['grace_hours'] * 3600, dry_run)
+
+    def recount(self, dry_run):
+        """Reset every blob's ref_count to the number of documents using it."""
+        counts = dict(
+            Document.objects.filter(file__startswith=BLOB_PREFIX)
+            .order_by().values_list('checksum').annotate(count=Count('id'))
+        )
+        drifted = []
+        for blob in Blob.objects.only('pk', 'checksum', 'ref_count').iterator(chunk_size=5000):
+            expected = counts.get(blob.checksum, 0)
+            if blob.ref_count != expected:
+                blob.ref_count = expected
+                drifted.append(blob)
+
+        self.stdout.write(f"Blobs with wrong reference count: {len(drifted)}")
+        if not dry_run:
+            Blob.objects.bulk_update(drifted, ['ref_count'], batch_size=1000)
+
+    def collect_orphans(self, storage, grace_seconds, dry_run):
+        """Delete blob and preview files that are not tracked by any Blob row."""
+        root = storage.path(BLOB_PREFIX)
+        cutoff = time.time() - grace_seconds
+        removed = 0
+
+        for dirpath, _, filenames in os.walk(root):
+            candidates = {
+                name: os.path.join(dirpath, name)
+                for name in filenames
+                if os.path.getmtime(os.path.join(dirpath, name)) < cutoff
+            }
+            if not candidates:
+                continue
+            # Previews are named after their blob: <checksum>.<kind>
+            checksums = {
+                name: name if name.endswith('.tmp') else name.split('.')[0]
+                for name in candidates
+            }
+            known = set(Blob.objects.filter(checksum__in=set(checksums.values())).values_list('checksum', flat=True))
+            for name, path in candidates.items():
+                if checksums[name] in known:
+                    continue
+                if dry_run:
+                    self.stdout.write(f"Would delete orphan {path}")
+                else:
+                    os.remove(path)
+                removed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} orphaned file(s)"))
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from documents.models import Document
+from documents.processing import ProcessingEngine
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -10,9 +11,9 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument(
-            '--user-email',
+            '--phone-number',
             type=str,
-            help='Process documents for a specific user email',
+            help='Process documents for a specific user phone number',
         )
         parser.add_argument(
             '--file-type',
@@ -24,66 +25,93 @@ class Command(BaseCommand):
             action='store_true',
             help='Only list documents without processing',
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Number of worker processes (default: number of CPUs)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Documents fetched and checkpointed per batch',
+        )
+        parser.add_argument(
+            '--executor',
+            choices=['process', 'thread'],
+            default='process',
+            help='Run workers as processes (CPU-bound extraction) or threads',
+        )
+        parser.add_argument(
+            '--reprocess',
+            action='store_true',
+            help='Process documents again even if they are already done',
+        )
 
     def handle(self, *args, **options):
         # Filter documents
         documents = Document.objects.all()
 
-        if options['user_email']:
+        if options['phone_number']:
             try:
-                user = User.objects.get(email=options['user_email'])
+                user = User.objects.get(phone_number=options['phone_number'])
                 documents = documents.filter(owner=user)
-                self.stdout.write(f"Filtering documents for user: {user.email}")
+                self.stdout.write(f"Filtering documents for user: {user.phone_number}")
             except User.DoesNotExist:
-                self.stdout.write(self.style.ERROR(f"User not found: {options['user_email']}"))
+                self.stdout.write(self.style.ERROR(f"User not found: {options['phone_number']}"))
                 return
 
         if options['file_type']:
             documents = documents.filter(file_type=options['file_type'])
             self.stdout.write(f"Filtering by file type: {options['file_type']}")
 
-        total_docs = documents.count()
-        self.stdout.write(self.style.SUCCESS(f"\nFound {total_docs} document(s)\n"))
-
-        # List documents
-        for doc in documents:
-            self.stdout.write("-" * 80)
-            self.stdout.write(f"ID: {doc.id}")
-            self.stdout.write(f"Name: {doc.name}")
-            self.stdout.write(f"Type: {doc.file_type}")
-            self.stdout.write(f"Size: {doc.get_readable_size()}")
-            self.stdout.write(f"Owner: {doc.owner.email}")
-
-            # Show full folder path
-            if doc.folder:
-                folder_path = doc.folder.get_full_path()
-                self.stdout.write(f"Folder: {folder_path}")
-            else:
-                self.stdout.write(f"Folder: My Documents (Root)")
-
-            self.stdout.write(f"File Path: {doc.file.path}")
-            self.stdout.write(f"Uploaded: {doc.uploaded_at}")
-
-            if not options['list_only']:
-                # Process the document here
-                self.stdout.write(f"\n{self.style.WARNING('Processing...')}")
-
-                # Example: Read file content
-                try:
-                    if doc.file_type in ['txt', 'md']:
-                        with open(doc.file.path, 'r', encoding='utf-8') as f:
-                            content = f.read()
-                            self.stdout.write(f"Content preview (first 200 chars):")
-                            self.stdout.write(content[:200])
-                    elif doc.file_type == 'pdf':
-                        self.stdout.write("PDF file - use PyPDF2 or pdfplumber to extract text")
-                    elif doc.file_type in ['doc', 'docx']:
-                        self.stdout.write("Word file - use python-docx to extract text")
-
-                    self.stdout.write(self.style.SUCCESS("✓ Processed successfully"))
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(f"✗ Error processing: {str(e)}"))
-
-            self.stdout.write("")
-
-        self.stdout.write(self.style.SUCCESS(f"\nTotal processed: {total_docs}"))
+        engine = ProcessingEngine(
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            executor=options['executor'],
+            reprocess=options['reprocess'],
+        )
+
+        if options['list_only']:
+            total_docs = documents.count()
+            self.stdout.write(self.style.SUCCESS(f"\nFound {total_docs} document(s)\n"))
+            for batch in engine.batches(documents):
+                for doc in batch:
+                    self.stdout.write(
+                        f"{doc.id}\t{doc.processing_status}\t{doc.get_readable_size()}\t{doc.name}"
+                    )
+            return
+
+        pending = engine.pending(documents).count()
+        self.stdout.write(self.style.SUCCESS(f"\nFound {pending} document(s) to process\n"))
+
+        stats = engine.run(documents, on_result=self.report)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\nTotal processed: {stats['processed']}, reused: {stats['reused']}, "
+            f"skipped: {stats['skipped']}, failed: {stats['failed']}"
+        ))
+
+    def report(self, doc, folder_path, result):
+        """Print the outcome for one document."""
+        self.stdout.write("-" * 80)
+        self.stdout.write(f"ID: {doc.id}")
+        self.stdout.write(f"Name: {doc.name}")
+        self.stdout.write(f"Type: {doc.file_type}")
+        self.stdout.write(f"Size: {doc.get_readable_size()}")
+        self.stdout.write(f"Owner: {doc.owner.phone_number}")
+        self.stdout.write(f"Folder: {folder_path or 'My Documents (Root)'}")
+
+        if 'error' in result:
+            self.stdout.write(self.style.ERROR(f"✗ Error processing: {result['error']}"))
+            return
+
+        if 'skipped' in result:
+            self.stdout.write(self.style.WARNING(f"- Skipped: {result['skipped']}"))
+            return
+
+        if 'text' in result:
+            self.stdout.write(f"Content preview (first 200 chars):")
+            self.stdout.write(result['text'][:200])
+        self.stdout.write(self.style.SUCCESS("✓ Processed successfully"))
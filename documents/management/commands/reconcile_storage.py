@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Sum
+from documents.models import Document
+from folders.models import Folder
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Recompute user and folder storage counters and repair any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report drift without writing corrections',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rows written per UPDATE batch',
+        )
+
+    def handle(self, *args, **options):
+        user_usage = dict(
+            Document.objects.order_by().values_list('owner').annotate(total=Sum('file_size'))
+        )
+        folder_usage = dict(
+            Document.objects.exclude(folder=None).order_by().values_list('folder').annotate(total=Sum('file_size'))
+        )
+
+        users = self.find_drift(User.objects.all(), user_usage)
+        folders = self.find_drift(Folder.objects.all(), folder_usage)
+
+        self.stdout.write(f"Users with drift: {len(users)}")
+        self.stdout.write(f"Folders with drift: {len(folders)}")
+
+        if options['dry_run']:
+            for obj in users + folders:
+                self.stdout.write(f"  {obj._meta.model_name} {obj.pk}: {obj.stale_value} -> {obj.storage_used}")
+            return
+
+        with transaction.atomic():
+            User.objects.bulk_update(users, ['storage_used'], batch_size=options['batch_size'])
+            Folder.objects.bulk_update(folders, ['storage_used'], batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f"Repaired {len(users)} user(s) and {len(folders)} folder(s)"))
+
+    def find_drift(self, queryset, usage):
+        """Return instances whose storage_used differs from the computed usage."""
+        drifted = []
+        for obj in queryset.only('pk', 'storage_used').order_by().iterator(chunk_size=5000):
+            expected = usage.get(obj.pk, 0)
+            if obj.storage_used != expected:
+                obj.stale_value = obj.storage_used
+                obj.storage_used = expected
+                drifted.append(obj)
+        return drifted
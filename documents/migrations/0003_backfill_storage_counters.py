@@ -0,0 +1,37 @@
+# Generated by Django 5.0.1 on 2026-10-17 02:28
+
+from django.db import migrations
+from django.db.models import Sum
+
+
+def backfill_storage_counters(apps, schema_editor):
+    Document = apps.get_model('documents', 'Document')
+    Folder = apps.get_model('folders', 'Folder')
+    User = apps.get_model('accounts', 'User')
+
+    user_usage = Document.objects.values_list('owner').annotate(total=Sum('file_size'))
+    User.objects.bulk_update(
+        [User(pk=pk, storage_used=total) for pk, total in user_usage],
+        ['storage_used'],
+        batch_size=500,
+    )
+
+    folder_usage = Document.objects.exclude(folder=None).values_list('folder').annotate(total=Sum('file_size'))
+    Folder.objects.bulk_update(
+        [Folder(pk=pk, storage_used=total) for pk, total in folder_usage],
+        ['storage_used'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_remove_user_email_remove_user_is_email_verified_and_more'),
+        ('documents', '0002_document_owner_uploaded_index'),
+        ('folders', '0003_folder_storage_used'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_storage_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.0.1 on 2026-10-17 02:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+SQLITE_FTS = [
+    """CREATE VIRTUAL TABLE documents_documenttext_fts USING fts5(
+        content, content='documents_documenttext', content_rowid='document_id'
+    )""",
+    """CREATE TRIGGER documents_documenttext_ai AFTER INSERT ON documents_documenttext BEGIN
+        INSERT INTO documents_documenttext_fts(rowid, content) VALUES (new.document_id, new.content);
+    END""",
+    """CREATE TRIGGER documents_documenttext_ad AFTER DELETE ON documents_documenttext BEGIN
+        INSERT INTO documents_documenttext_fts(documents_documenttext_fts, rowid, content)
+        VALUES ('delete', old.document_id, old.content);
+    END""",
+    """CREATE TRIGGER documents_documenttext_au AFTER UPDATE ON documents_documenttext BEGIN
+        INSERT INTO documents_documenttext_fts(documents_documenttext_fts, rowid, content)
+        VALUES ('delete', old.document_id, old.content);
+        INSERT INTO documents_documenttext_fts(rowid, content) VALUES (new.document_id, new.content);
+    END""",
+]
+
+SQLITE_FTS_DROP = [
+    "DROP TRIGGER IF EXISTS documents_documenttext_au",
+    "DROP TRIGGER IF EXISTS documents_documenttext_ad",
+    "DROP TRIGGER IF EXISTS documents_documenttext_ai",
+    "DROP TABLE IF EXISTS documents_documenttext_fts",
+]
+
+POSTGRESQL_FTS = [
+    """CREATE INDEX documents_documenttext_search_idx ON documents_documenttext
+        USING GIN (to_tsvector('english', content))""",
+]
+
+POSTGRESQL_FTS_DROP = [
+    "DROP INDEX IF EXISTS documents_documenttext_search_idx",
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0005_document_processing_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentText',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='text', serialize=False, to='documents.document')),
+                ('content', models.TextField()),
+                ('extracted_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(
+            run_for_vendor({'sqlite': SQLITE_FTS, 'postgresql': POSTGRESQL_FTS}),
+            run_for_vendor({'sqlite': SQLITE_FTS_DROP, 'postgresql': POSTGRESQL_FTS_DROP}),
+        ),
+    ]
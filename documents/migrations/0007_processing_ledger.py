@@ -0,0 +1,53 @@
+# Generated by Django 5.0.1 on 2026-10-17 02:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_processed_documents(apps, schema_editor):
+    # Documents already processed by the current extraction count as version 1
+    Document = apps.get_model('documents', 'Document')
+    Document.objects.filter(processing_status='done').update(processed_version=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0006_document_text'),
+        ('folders', '0003_folder_storage_used'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessingResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checksum', models.CharField(max_length=64)),
+                ('processor_version', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('done', 'Done'), ('failed', 'Failed')], max_length=20)),
+                ('text', models.TextField(blank=True, null=True)),
+                ('message', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='document',
+            name='documents_d_process_052924_idx',
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='processed_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['processing_status', 'processed_version'], name='documents_d_process_4a3b1a_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='processingresult',
+            unique_together={('checksum', 'processor_version')},
+        ),
+        migrations.RunPython(mark_processed_documents, migrations.RunPython.noop),
+    ]
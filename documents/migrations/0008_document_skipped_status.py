@@ -0,0 +1,32 @@
+# Generated by Django 5.0.1 on 2026-10-17 03:31
+
+from django.db import migrations, models
+
+
+def mark_skipped(apps, schema_editor):
+    # Results without text were extraction skips recorded as done
+    ProcessingResult = apps.get_model('documents', 'ProcessingResult')
+    Document = apps.get_model('documents', 'Document')
+    ProcessingResult.objects.filter(status='done', text=None).update(status='skipped')
+    Document.objects.filter(processing_status='done', text=None).update(processing_status='skipped')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_processing_ledger'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='document',
+            name='processing_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('skipped', 'Skipped'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='processingresult',
+            name='status',
+            field=models.CharField(choices=[('done', 'Done'), ('skipped', 'Skipped'), ('failed', 'Failed')], max_length=20),
+        ),
+        migrations.RunPython(mark_skipped, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,15 @@
-from django.db import models
+from django.db import connections, models, transaction
 from django.conf import settings
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
 from django.core.exceptions import ValidationError
 import hashlib
 import os
 
+from .readers import DocumentReader
+from .storage import ContentAddressedStorage, blob_name, is_blob_name
+
 
 def user_directory_path(instance, filename):
     """Generate upload path for document files."""
@@ -18,6 +24,102 @@ def user_directory_path(instance, filename):
     return f'documents/{instance.owner.id}/{folder_id}/{unique_filename}'
 
 
+def blob_upload_path(instance, filename):
+    """Generate the content-addressed upload path for a document file."""
+    return blob_name(instance.checksum)
+
+
+EXTENSION_FILE_TYPES = {
+    '.txt': 'txt',
+    '.md': 'md',
+    '.pdf': 'pdf',
+    '.doc': 'doc',
+    '.docx': 'docx',
+}
+
+
+def readable_size(size):
+    """Return a human-readable representation of a size in bytes."""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024.0:
+            return f"{size:.2f} {unit}"
+        size /= 1024.0
+    return f"{size:.2f} TB"
+
+
+class BlobManager(models.Manager):
+    """Reference counting helpers for Blob."""
+
+    def acquire(self, blobs):
+        """Add references to blobs.
+
+        ``blobs`` maps a checksum to ``(name, size, count)``; missing blob
+        rows are created and every ref_count is raised. Backends with
+        INSERT ... ON CONFLICT do both in one prepared upsert per row run
+        through executemany; others insert the missing rows and then raise
+        every ref_count in one UPDATE.
+        """
+        if not blobs:
+            return
+        connection = connections[self.db]
+        if connection.features.supports_update_conflicts_with_target:
+            qn = connection.ops.quote_name
+            table = qn(self.model._meta.db_table)
+            columns = ['checksum', 'file', 'size', 'ref_count', 'created_at']
+            sql = "INSERT INTO {} ({}) VALUES ({}) ON CONFLICT ({}) DO UPDATE SET {} = {}.{} + excluded.{}".format(
+                table,
+                ", ".join(qn(column) for column in columns),
+                ", ".join(["%s"] * len(columns)),
+                qn('checksum'),
+                qn('ref_count'), table, qn('ref_count'), qn('ref_count'),
+            )
+            created_at = self.model._meta.get_field('created_at').get_db_prep_save(timezone.now(), connection)
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, [
+                    [checksum, name, size, count, created_at] for checksum, (name, size, count) in blobs.items()
+                ])
+            return
+        self.bulk_create(
+            [Blob(checksum=checksum, file=name, size=size) for checksum, (name, size, _) in blobs.items()],
+            ignore_conflicts=True,
+        )
+        self._adjust({checksum: count for checksum, (_, _, count) in blobs.items()})
+
+    def release(self, counts):
+        """Drop references to blobs; ``counts`` maps a checksum to a count."""
+        self._adjust({checksum: -count for checksum, count in counts.items() if count})
+
+    def _adjust(self, deltas):
+        if not deltas:
+            return
+        self.filter(checksum__in=deltas).update(
+            ref_count=models.F('ref_count') + models.Case(
+                *[models.When(checksum=checksum, then=models.Value(delta)) for checksum, delta in deltas.items()],
+                default=models.Value(0),
+            )
+        )
+
+
+class Blob(models.Model):
+    """A stored file shared by every document with the same content."""
+
+    checksum = models.CharField(max_length=64, unique=True)
+    file = models.FileField(storage=ContentAddressedStorage())
+    size = models.BigIntegerField()
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = BlobManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ref_count']),
+        ]
+
+    def __str__(self):
+        return self.checksum
+
+
 class Document(models.Model):
     """Model representing an uploaded document."""
 
@@ -29,8 +131,15 @@ class Document(models.Model):
         ('docx', 'Word Document (DOCX)'),
     ]
 
+    PROCESSING_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('skipped', 'Skipped'),
+        ('failed', 'Failed'),
+    ]
+
     name = models.CharField(max_length=255)
-    file = models.FileField(upload_to=user_directory_path)
+    file = models.FileField(upload_to=blob_upload_path, storage=ContentAddressedStorage())
     file_type = models.CharField(max_length=10, choices=FILE_TYPE_CHOICES)
     file_size = models.BigIntegerField()
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='documents')
@@ -39,11 +148,19 @@ class Document(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     checksum = models.CharField(max_length=64, blank=True)
 
+    # Processing state, maintained by documents.processing
+    processing_status = models.CharField(max_length=20, choices=PROCESSING_STATUS_CHOICES, default='pending')
+    processed_at = models.DateTimeField(null=True, blank=True)
+    processing_error = models.TextField(blank=True)
+    processed_version = models.PositiveIntegerField(default=0)
+
     class Meta:
         ordering = ['-uploaded_at']
         indexes = [
             models.Index(fields=['owner', 'folder']),
             models.Index(fields=['file_type']),
+            models.Index(fields=['owner', '-uploaded_at', '-id']),
+            models.Index(fields=['processing_status', 'processed_version']),
         ]
 
     def __str__(self):
@@ -61,14 +178,11 @@ class Document(models.Model):
                 raise ValidationError(f"File type {ext} is not allowed.")
 
             # Set file type based on extension
-            ext_to_type = {
-                '.txt': 'txt',
-                '.md': 'md',
-                '.pdf': 'pdf',
-                '.doc': 'doc',
-                '.docx': 'docx',
-            }
-            self.file_type = ext_to_type.get(ext, 'txt')
+            self.file_type = EXTENSION_FILE_TYPES.get(ext, 'txt')
+
+            # Use the checksum computed by the upload handler when available
+            if not self.checksum and not self.file._committed:
+                self.checksum = getattr(self.file.file, 'checksum', '')
 
             # Calculate checksum
             if not self.checksum:
@@ -79,36 +193,76 @@ class Document(models.Model):
                 self.checksum = file_hash.hexdigest()
                 self.file.seek(0)
 
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            adding = self._state.adding
+            if adding and self.file:
+                # Reference the blob before the file field writes it
+                name = self.file.name if self.file._committed else blob_name(self.checksum)
+                if is_blob_name(name):
+                    Blob.objects.acquire({self.checksum: (name, self.file_size, 1)})
+            super().save(*args, **kwargs)
+            self._update_storage_counters(adding)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the stored folder and size so save() can apply deltas."""
+        instance = super().from_db(db, field_names, values)
+        stored = dict(zip(field_names, values))
+        if 'folder_id' in stored and 'file_size' in stored:
+            instance._stored_usage = (stored['folder_id'], stored['file_size'])
+        return instance
+
+    def _update_storage_counters(self, adding):
+        """Apply this save's size change to the owner and folder counters."""
+        from folders.models import Folder
+
+        if adding:
+            self._add_owner_storage(self.file_size)
+            Folder.add_storage_used(self.folder_id, self.file_size)
+        elif hasattr(self, '_stored_usage'):
+            old_folder_id, old_size = self._stored_usage
+            self._add_owner_storage(self.file_size - old_size)
+            if old_folder_id != self.folder_id:
+                Folder.add_storage_used(old_folder_id, -old_size)
+                Folder.add_storage_used(self.folder_id, self.file_size)
+            else:
+                Folder.add_storage_used(self.folder_id, self.file_size - old_size)
+        self._stored_usage = (self.folder_id, self.file_size)
 
-        # Update user's storage usage
-        if self.owner:
-            self.owner.update_storage_used()
+    def _add_owner_storage(self, delta):
+        """Adjust the owner's storage counter, keeping a loaded owner in sync."""
+        if Document.owner.is_cached(self):
+            self.owner.add_storage_used(delta)
+        else:
+            Document.owner.field.related_model.objects.add_storage_used(self.owner_id, delta)
 
     def delete(self, *args, **kwargs):
         """Override delete to update user storage and remove file."""
-        # Delete the file from storage
-        if self.file:
-            self.file.delete(save=False)
+        from folders.models import Folder
 
-        super().delete(*args, **kwargs)
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            self._add_owner_storage(-self.file_size)
+            Folder.add_storage_used(self.folder_id, -self.file_size)
 
-        # Update user's storage usage
-        if self.owner:
-            self.owner.update_storage_used()
+            # Shared blobs are released by document_deleted and removed by
+            # collect_blobs once unreferenced; files stored before content
+            # addressing belong to this document alone
+            if self.file and not is_blob_name(self.file.name):
+                self.file.delete(save=False)
+        return result
 
     def get_file_extension(self):
         """Get the file extension."""
-        return os.path.splitext(self.file.name)[1].lower()
+        return os.path.splitext(self.name or self.file.name)[1].lower()
 
     def get_readable_size(self):
         """Return human-readable file size."""
-        size = self.file_size
-        for unit in ['B', 'KB', 'MB', 'GB']:
-            if size < 1024.0:
-                return f"{size:.2f} {unit}"
-            size /= 1024.0
-        return f"{size:.2f} TB"
+        return readable_size(self.file_size)
+
+    def open_reader(self, encoding=None):
+        """Return a DocumentReader over the stored file, for use in a with block."""
+        return DocumentReader(self.file.path, encoding=encoding)
 
     def get_icon_class(self):
         """Return icon class based on file type."""
@@ -120,3 +274,71 @@ class Document(models.Model):
             'docx': 'file-word',
         }
         return icons.get(self.file_type, 'file')
+
+
+@receiver(post_delete, sender=Document)
+def document_deleted(sender, instance, **kwargs):
+    # Runs for cascades and QuerySet.delete() too, not only Document.delete()
+    if is_blob_name(instance.file.name):
+        Blob.objects.release({instance.checksum: 1})
+
+
+class DocumentText(models.Model):
+    """Normalized text extracted from a document, indexed for full-text search."""
+
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, primary_key=True, related_name='text')
+    content = models.TextField()
+    extracted_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Text of {self.document_id}"
+
+
+class ProcessingResult(models.Model):
+    """Ledger of processing results keyed by content checksum and processor version.
+
+    Documents with identical content share one entry, so each distinct
+    file is processed once per processor version.
+    """
+
+    STATUS_CHOICES = [
+        ('done', 'Done'),
+        ('skipped', 'Skipped'),
+        ('failed', 'Failed'),
+    ]
+
+    checksum = models.CharField(max_length=64)
+    processor_version = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    text = models.TextField(null=True, blank=True)
+    message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['checksum', 'processor_version']
+
+    def __str__(self):
+        return f"{self.checksum} v{self.processor_version} ({self.status})"
+
+    @classmethod
+    def from_result(cls, checksum, processor_version, result):
+        """Build a ledger entry from a processing result dict."""
+        if 'error' in result:
+            return cls(checksum=checksum, processor_version=processor_version, status='failed', message=result['error'])
+        if 'skipped' in result:
+            return cls(checksum=checksum, processor_version=processor_version, status='skipped', message=result['skipped'])
+        return cls(
+            checksum=checksum,
+            processor_version=processor_version,
+            status='done',
+            text=result.get('text'),
+        )
+
+    def as_result(self):
+        """Rebuild the processing result dict stored in this entry."""
+        if self.status == 'failed':
+            return {'error': self.message}
+        if self.status == 'skipped':
+            return {'skipped': self.message}
+        return {'text': self.text}
@@ -0,0 +1,140 @@
+"""Precomputed document previews.
+
+A preview is a short text snippet plus, for PDFs, a PNG render of the
+first page. Previews depend only on file content, so they are generated
+once per checksum and stored next to the blob. The text snippet is
+written last and marks the preview as complete. First-page renders need
+the optional ``pypdfium2`` and ``Pillow`` packages.
+"""
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from .extraction import ExtractionUnavailable, normalize_text
+from .models import Document
+from .readers import DocumentReader
+from .storage import blob_name
+
+# Bump when the output of generate_previews changes; names include it
+PREVIEW_VERSION = 1
+
+
+def preview_text_name(checksum):
+    return f"{blob_name(checksum)}.preview-v{PREVIEW_VERSION}.txt"
+
+
+def thumbnail_name(checksum):
+    return f"{blob_name(checksum)}.thumb-v{PREVIEW_VERSION}.png"
+
+
+def preview_storage():
+    return Document._meta.get_field('file').storage
+
+
+def text_snippet(path, file_type, max_chars):
+    """Return up to max_chars of normalized text from the start of a file."""
+    if file_type in ('txt', 'md'):
+        with DocumentReader(path) as reader:
+            # Read ahead a little since normalizing drops repeated whitespace
+            return normalize_text(reader.preview(max_chars * 2))[:max_chars]
+    try:
+        if file_type == 'pdf':
+            text = first_pdf_page_text(path)
+        elif file_type == 'docx':
+            text = leading_docx_text(path, max_chars)
+        else:
+            return ''
+    except ExtractionUnavailable:
+        return ''
+    return normalize_text(text)[:max_chars]
+
+
+def first_pdf_page_text(path):
+    try:
+        import pypdf
+    except ImportError:
+        raise ExtractionUnavailable("Install pypdf to extract text from PDFs")
+    reader = pypdf.PdfReader(path)
+    if not reader.pages:
+        return ''
+    return reader.pages[0].extract_text() or ''
+
+
+def leading_docx_text(path, max_chars):
+    try:
+        import docx
+    except ImportError:
+        raise ExtractionUnavailable("Install python-docx to extract text from Word documents")
+    parts = []
+    length = 0
+    for paragraph in docx.Document(path).paragraphs:
+        parts.append(paragraph.text)
+        length += len(paragraph.text) + 1
+        if length >= max_chars:
+            break
+    return '\n'.join(parts)
+
+
+def render_first_page(path, file_type, width):
+    """Return the first page of a PDF as PNG bytes, or None if it cannot be rendered."""
+    if file_type != 'pdf':
+        return None
+    try:
+        import pypdfium2
+    except ImportError:
+        return None
+    pdf = pypdfium2.PdfDocument(path)
+    try:
+        if not len(pdf):
+            return None
+        page = pdf[0]
+        image = page.render(scale=width / page.get_width()).to_pil()
+    finally:
+        pdf.close()
+    output = io.BytesIO()
+    image.save(output, format='PNG', optimize=True)
+    return output.getvalue()
+
+
+def has_preview(checksum):
+    return preview_storage().exists(preview_text_name(checksum))
+
+
+def has_thumbnail(checksum):
+    return preview_storage().exists(thumbnail_name(checksum))
+
+
+def generate_previews(document):
+    """Store the preview of document's content unless its checksum already has one.
+
+    Returns True if a preview was generated.
+    """
+    if not document.checksum or has_preview(document.checksum):
+        return False
+    storage = preview_storage()
+    path = document.file.path
+
+    png = render_first_page(path, document.file_type, getattr(settings, 'DOCUMENT_THUMBNAIL_WIDTH', 320))
+    if png:
+        storage.save(thumbnail_name(document.checksum), ContentFile(png))
+    text = text_snippet(path, document.file_type, getattr(settings, 'DOCUMENT_PREVIEW_CHARS', 1000))
+    storage.save(preview_text_name(document.checksum), ContentFile(text.encode('utf-8')))
+    return True
+
+
+def read_preview_text(checksum):
+    with preview_storage().open(preview_text_name(checksum), 'rb') as f:
+        return f.read().decode('utf-8')
+
+
+def delete_previews(checksum):
+    """Delete every stored preview of a blob, whatever its version."""
+    storage = preview_storage()
+    directory, name = os.path.split(blob_name(checksum))
+    if not storage.exists(directory):
+        return
+    for filename in storage.listdir(directory)[1]:
+        if filename.startswith(f"{name}.") and not filename.endswith('.tmp'):
+            storage.delete(f"{directory}/{filename}")
@@ -0,0 +1,184 @@
+"""Document processing engine.
+
+Pending documents are fetched in primary-key ordered batches together
+with their owner and folder, and each batch is handed to a worker pool.
+Workers only see file paths, so text extraction can run in separate
+processes; the extracted text is stored as DocumentText, which feeds
+the full-text index. The status of every document is saved after each
+batch, which makes the batch the checkpoint: an interrupted run picks
+up at the first document that is not marked done.
+
+Results are also recorded in the ProcessingResult ledger keyed by file
+checksum and PROCESSOR_VERSION, so a run only processes new or changed
+content and documents with identical content share one result.
+
+Documents whose text could not be extracted here (an optional library is
+missing, or the type has no extractor) are marked skipped rather than
+done, so a later run picks them up again.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+
+from folders.models import Folder
+from .extraction import ExtractionUnavailable, extract_text
+from .models import Document, DocumentText, ProcessingResult
+
+# Bump when process_file changes so existing results are recomputed
+PROCESSOR_VERSION = 2
+
+
+def process_file(path, file_type):
+    """Process a single document file and return a result dict.
+
+    Runs inside a worker, so it must not touch the database. The result
+    holds the normalized text when the file type can be extracted.
+    """
+    try:
+        result = {}
+        try:
+            result['text'] = extract_text(path, file_type)
+        except ExtractionUnavailable as e:
+            result['skipped'] = str(e)
+        return result
+    except Exception as e:
+        return {'error': str(e)}
+
+
+class ProcessingEngine:
+    """Run process_file over documents with a pool of workers."""
+
+    def __init__(self, workers=None, batch_size=100, executor='process', reprocess=False):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.executor = executor
+        self.reprocess = reprocess
+
+    def pending(self, queryset):
+        """Limit queryset to the documents this run should process.
+
+        That is every document not done with the current processor
+        version, including failed and skipped ones.
+        """
+        if not self.reprocess:
+            queryset = queryset.filter(
+                ~Q(processing_status='done') | Q(processed_version__lt=PROCESSOR_VERSION)
+            )
+        return queryset
+
+    def batches(self, queryset):
+        """Yield lists of documents in primary key order, one query per batch."""
+        queryset = queryset.select_related('owner', 'folder').order_by('pk')
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:self.batch_size])
+            if not batch:
+                return
+            last_pk = batch[-1].pk
+            yield batch
+
+    def make_pool(self):
+        if self.executor == 'process':
+            # Forked workers must not inherit open database connections
+            connections.close_all()
+            return ProcessPoolExecutor(max_workers=self.workers)
+        return ThreadPoolExecutor(max_workers=self.workers)
+
+    def run(self, queryset, on_result=None):
+        """Process every pending document in queryset.
+
+        on_result, if given, is called as on_result(document, folder_path, result)
+        for each document. Returns a dict counting documents that were
+        processed, reused an existing ledger result, were skipped, or failed.
+        """
+        stats = {'processed': 0, 'reused': 0, 'skipped': 0, 'failed': 0}
+        with self.make_pool() as pool:
+            for batch in self.batches(self.pending(queryset)):
+                paths = Folder.objects.full_paths({doc.folder_id: doc.folder for doc in batch}.values())
+                results, processed = self.process_batch(pool, batch)
+                for doc, result in zip(batch, results):
+                    self.record(doc, result)
+                    if 'error' in result:
+                        stats['failed'] += 1
+                    elif 'skipped' in result:
+                        stats['skipped'] += 1
+                    else:
+                        stats['processed' if doc.pk in processed else 'reused'] += 1
+                    if on_result:
+                        on_result(doc, paths.get(doc.folder_id), result)
+
+                Document.objects.bulk_update(
+                    batch, ['processing_status', 'processed_at', 'processing_error', 'processed_version'],
+                )
+                self.save_texts(batch, results)
+        return stats
+
+    def process_batch(self, pool, batch):
+        """Return the results for a batch and the ids of documents that were actually processed.
+
+        Each distinct checksum is processed at most once; results already
+        in the ledger for the current processor version are reused.
+        """
+        keys = [doc.checksum or f"document:{doc.pk}" for doc in batch]
+        known = {} if self.reprocess else {
+            entry.checksum: entry.as_result()
+            for entry in ProcessingResult.objects.filter(
+                checksum__in={doc.checksum for doc in batch if doc.checksum},
+                processor_version=PROCESSOR_VERSION,
+                status='done',
+            )
+        }
+
+        todo = {}
+        for key, doc in zip(keys, batch):
+            if key not in known and key not in todo:
+                todo[key] = doc
+        fresh = dict(zip(todo, pool.map(
+            process_file,
+            [doc.file.path for doc in todo.values()],
+            [doc.file_type for doc in todo.values()],
+        )))
+        self.save_ledger({key: result for key, result in fresh.items() if not key.startswith('document:')})
+
+        known.update(fresh)
+        return [known[key] for key in keys], {doc.pk for doc in todo.values()}
+
+    def save_ledger(self, results):
+        """Record fresh results in the ledger, keyed by checksum and processor version."""
+        ProcessingResult.objects.bulk_create(
+            [ProcessingResult.from_result(checksum, PROCESSOR_VERSION, result) for checksum, result in results.items()],
+            update_conflicts=True,
+            unique_fields=['checksum', 'processor_version'],
+            update_fields=['status', 'text', 'message', 'updated_at'],
+        )
+
+    def save_texts(self, batch, results):
+        """Insert or refresh the extracted text of a batch in one statement."""
+        texts = [
+            DocumentText(document=doc, content=result['text'])
+            for doc, result in zip(batch, results)
+            if 'text' in result
+        ]
+        DocumentText.objects.bulk_create(
+            texts,
+            update_conflicts=True,
+            unique_fields=['document'],
+            update_fields=['content', 'extracted_at'],
+        )
+
+    def record(self, document, result):
+        """Copy a worker result onto the document's processing fields."""
+        document.processed_at = timezone.now()
+        document.processed_version = PROCESSOR_VERSION
+        if 'error' in result:
+            document.processing_status = 'failed'
+            document.processing_error = result['error']
+        elif 'skipped' in result:
+            document.processing_status = 'skipped'
+            document.processing_error = result['skipped']
+        else:
+            document.processing_status = 'done'
+            document.processing_error = ''
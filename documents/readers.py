@@ -0,0 +1,143 @@
+"""Readers for large document files.
+
+DocumentReader memory-maps a file so callers can read byte ranges,
+stream decoded text or iterate lines without loading the whole file.
+Only the pages that are actually touched are read from disk.
+"""
+import codecs
+import io
+import mmap
+import os
+
+READ_CHUNK_SIZE = 1024 * 1024
+ENCODING_SAMPLE_SIZE = 64 * 1024
+
+BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+
+def detect_encoding(sample):
+    """Guess the text encoding of a file from its first bytes.
+
+    A byte order mark wins; otherwise the sample is checked as UTF-8,
+    allowing a multi-byte sequence cut off at the end of the sample.
+    Anything else is read as Latin-1, which decodes every byte.
+    """
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+    except UnicodeDecodeError:
+        return 'latin-1'
+    return 'utf-8'
+
+
+class DocumentReader:
+    """Random and sequential access to a document file through a memory map.
+
+    Use as a context manager::
+
+        with document.open_reader() as reader:
+            for line in reader.iter_lines():
+                ...
+    """
+
+    def __init__(self, path, encoding=None, chunk_size=READ_CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self._encoding = encoding
+        self._file = None
+        self._map = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def open(self):
+        self._file = open(self.path, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        # Empty files cannot be mapped; every read then returns nothing
+        if self.size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def encoding(self):
+        if self._encoding is None:
+            self._encoding = detect_encoding(self.read_range(0, ENCODING_SAMPLE_SIZE))
+        return self._encoding
+
+    def read_range(self, start, end=None):
+        """Return the bytes from start up to, but not including, end."""
+        if self._map is None:
+            return b''
+        end = self.size if end is None else min(end, self.size)
+        return self._map[start:end]
+
+    def iter_chunks(self, start=0, end=None):
+        """Yield the bytes of a range in chunks of at most chunk_size."""
+        end = self.size if end is None else min(end, self.size)
+        for offset in range(start, end, self.chunk_size):
+            yield self.read_range(offset, min(offset + self.chunk_size, end))
+
+    def iter_text(self):
+        """Yield the decoded text of the file chunk by chunk."""
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors='replace')
+        for chunk in self.iter_chunks():
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+        text = decoder.decode(b'', final=True)
+        if text:
+            yield text
+
+    def iter_lines(self):
+        """Yield decoded lines, without their line endings."""
+        if self._map is None:
+            return
+        self._map.seek(0)
+        stream = io.TextIOWrapper(
+            io.BufferedReader(_MapStream(self._map), buffer_size=self.chunk_size),
+            encoding=self.encoding,
+            errors='replace',
+        )
+        for line in stream:
+            yield line.rstrip('\r\n')
+
+    def preview(self, max_chars=500):
+        """Return up to max_chars characters from the start of the file."""
+        # Four bytes per character covers every UTF-8 sequence
+        sample = self.read_range(0, max_chars * 4)
+        text = codecs.getincrementaldecoder(self.encoding)(errors='replace').decode(sample)
+        return text[:max_chars]
+
+
+class _MapStream(io.RawIOBase):
+    """Raw stream over a memory map, so it can be wrapped for text decoding."""
+
+    def __init__(self, mapping):
+        self._mapping = mapping
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._mapping.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
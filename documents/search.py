@@ -0,0 +1,79 @@
+"""Full-text search over extracted document text.
+
+Uses the FTS5 table on SQLite and a GIN-indexed tsvector expression on
+PostgreSQL (both created by migration 0006). Other backends fall back
+to a case-insensitive substring match.
+"""
+from django.db import connection
+
+from .models import Document
+
+SEARCH_CONFIG = 'english'
+
+SQLITE_SEARCH_SQL = """
+    SELECT d.id, d.name, d.file_type, d.folder_id, d.uploaded_at,
+           bm25(documents_documenttext_fts) AS rank,
+           snippet(documents_documenttext_fts, 0, '[', ']', '...', 12) AS snippet
+    FROM documents_documenttext_fts
+    JOIN documents_document d ON d.id = documents_documenttext_fts.rowid
+    WHERE documents_documenttext_fts MATCH %s AND d.owner_id = %s
+    ORDER BY rank
+    LIMIT %s OFFSET %s
+"""
+
+POSTGRESQL_SEARCH_SQL = """
+    SELECT d.id, d.name, d.file_type, d.folder_id, d.uploaded_at,
+           ts_rank(to_tsvector('english', t.content), q) AS rank,
+           ts_headline('english', t.content, q, 'StartSel=[, StopSel=], MaxFragments=1') AS snippet
+    FROM documents_documenttext t
+    JOIN documents_document d ON d.id = t.document_id,
+         plainto_tsquery('english', %s) q
+    WHERE to_tsvector('english', t.content) @@ q AND d.owner_id = %s
+    ORDER BY rank DESC
+    LIMIT %s OFFSET %s
+"""
+
+HIT_COLUMNS = ('id', 'name', 'file_type', 'folder_id', 'uploaded_at', 'rank', 'snippet')
+
+
+def fts5_query(query):
+    """Quote each term so user input is matched literally by FTS5."""
+    terms = query.split()
+    return ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+
+def search_documents(user, query, limit=20, offset=0):
+    """Return ranked hits for query among user's documents.
+
+    Each hit is a dict with the HIT_COLUMNS keys, best match first.
+    """
+    if not query.strip():
+        return []
+
+    if connection.vendor == 'sqlite':
+        sql, params = SQLITE_SEARCH_SQL, [fts5_query(query), user.pk, limit, offset]
+    elif connection.vendor == 'postgresql':
+        sql, params = POSTGRESQL_SEARCH_SQL, [query, user.pk, limit, offset]
+    else:
+        return fallback_search(user, query, limit, offset)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    hits = [dict(zip(HIT_COLUMNS, row)) for row in rows]
+    uploaded_at = Document._meta.get_field('uploaded_at')
+    for hit in hits:
+        # Raw SQL returns the backend's representation (text on SQLite)
+        hit['uploaded_at'] = uploaded_at.to_python(hit['uploaded_at'])
+    return hits
+
+
+def fallback_search(user, query, limit, offset):
+    """Unranked substring search for backends without full-text support."""
+    documents = (
+        Document.objects.filter(owner=user, text__content__icontains=query)
+        .order_by('-uploaded_at', '-id')
+        .values('id', 'name', 'file_type', 'folder_id', 'uploaded_at')[offset:offset + limit]
+    )
+    return [dict(doc, rank=None, snippet='') for doc in documents]
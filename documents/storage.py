@@ -0,0 +1,66 @@
+"""Content-addressed storage for document files.
+
+Every document file is stored once under a name derived from its
+SHA-256 checksum, so identical uploads share a single file on disk.
+Which documents use a blob is tracked by ``documents.models.Blob``.
+"""
+import os
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+
+BLOB_PREFIX = 'blobs/'
+INCOMING_PREFIX = f"{BLOB_PREFIX}incoming/"
+
+
+def blob_name(checksum):
+    """Return the storage name of the blob with the given checksum."""
+    return f"{BLOB_PREFIX}{checksum[:2]}/{checksum[2:4]}/{checksum}"
+
+
+def incoming_name():
+    """Return a fresh temporary name for content whose checksum is not known yet.
+
+    Files left behind by a crash are removed by ``collect_blobs --orphans``.
+    """
+    return f"{INCOMING_PREFIX}{uuid.uuid4().hex}.tmp"
+
+
+def is_blob_name(name):
+    """Check whether a storage name refers to a content-addressed blob."""
+    return bool(name) and name.startswith(BLOB_PREFIX)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Filesystem storage where a name identifies its content.
+
+    Saving to a name that already exists is a no-op, so a duplicate
+    upload costs no write I/O. New blobs are written to a temporary name
+    and renamed into place, which keeps concurrent writers of the same
+    content safe.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        if not is_blob_name(name) or name.startswith(INCOMING_PREFIX):
+            return super()._save(name, content)
+        if self.exists(name):
+            return name
+
+        temp_name = super()._save(self.get_alternative_name(name, '.tmp'), content)
+        os.replace(self.path(temp_name), self.path(name))
+        return name
+
+    def promote(self, temp_name, name):
+        """Move a fully written incoming file to its blob name.
+
+        The incoming file is discarded when the blob is already stored.
+        """
+        if self.exists(name):
+            self.delete(temp_name)
+            return name
+        os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+        os.replace(self.path(temp_name), self.path(name))
+        return name
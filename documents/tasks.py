@@ -0,0 +1,20 @@
+from jobs.tasks import task
+from .models import Document
+from .previews import generate_previews
+from .processing import ProcessingEngine
+
+
+@task('documents.process')
+def process_documents(document_ids):
+    """Extract and index newly uploaded documents."""
+    ProcessingEngine(workers=1, executor='thread').run(Document.objects.filter(pk__in=document_ids))
+
+
+@task('documents.generate_previews')
+def generate_document_previews(document_ids):
+    """Generate previews for the distinct contents among the given documents."""
+    seen = set()
+    for document in Document.objects.filter(pk__in=document_ids).order_by('pk'):
+        if document.checksum not in seen:
+            seen.add(document.checksum)
+            generate_previews(document)
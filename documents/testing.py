@@ -0,0 +1,25 @@
+"""Helpers shared by tests that store document files."""
+import shutil
+import tempfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+
+from .models import Document
+
+
+class MediaRootMixin:
+    """Store files written by a test in a temporary MEDIA_ROOT."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def upload(self, owner, name, content, folder=None):
+        return Document.objects.create(
+            name=name, owner=owner, folder=folder, file=SimpleUploadedFile(name, content),
+        )
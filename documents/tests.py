@@ -1,3 +1,348 @@
-from django.test import TestCase
+import os
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from folders.models import Folder
+from .extraction import extract_plain_text
+from .models import Blob, Document, ProcessingResult
+from .processing import PROCESSOR_VERSION, ProcessingEngine, process_file
+from .storage import blob_name
+from .testing import MediaRootMixin
+from .uploads import create_documents
+from .readers import DocumentReader, detect_encoding
+
+User = get_user_model()
+
+
+class DocumentReaderTests(SimpleTestCase):
+    """Readers only touch the bytes they are asked for."""
+
+    def write(self, data):
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_detect_encoding(self):
+        self.assertEqual(detect_encoding('héllo'.encode('utf-8')), 'utf-8')
+        self.assertEqual(detect_encoding('héllo'.encode('utf-8')[:2]), 'utf-8')
+        self.assertEqual(detect_encoding(b'\xef\xbb\xbfhi'), 'utf-8-sig')
+        self.assertEqual(detect_encoding('hi'.encode('utf-16')), 'utf-16')
+        self.assertEqual(detect_encoding('héllo'.encode('latin-1')), 'latin-1')
+
+    def test_ranges_and_chunks(self):
+        path = self.write(b'0123456789' * 10)
+        with DocumentReader(path, chunk_size=30) as reader:
+            self.assertEqual(reader.size, 100)
+            self.assertEqual(reader.read_range(10, 15), b'01234')
+            self.assertEqual(reader.read_range(95, 200), b'56789')
+            self.assertEqual([len(chunk) for chunk in reader.iter_chunks()], [30, 30, 30, 10])
+
+    def test_lines_text_and_preview(self):
+        text = ''.join(f'línea {i}\r\n' for i in range(1000))
+        path = self.write(text.encode('utf-16'))
+        with DocumentReader(path, chunk_size=100) as reader:
+            self.assertEqual(reader.encoding, 'utf-16')
+            lines = list(reader.iter_lines())
+            self.assertEqual(len(lines), 1000)
+            self.assertEqual(lines[999], 'línea 999')
+            self.assertEqual(''.join(reader.iter_text()), text)
+            self.assertEqual(reader.preview(8), 'línea 0\r')
+
+    def test_empty_file(self):
+        with DocumentReader(self.write(b'')) as reader:
+            self.assertEqual(reader.read_range(0), b'')
+            self.assertEqual(list(reader.iter_lines()), [])
+            self.assertEqual(reader.preview(), '')
+
+
+class StorageCounterTests(MediaRootMixin, TestCase):
+    """Document saves and deletes move the storage counters by deltas."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(phone_number='+10000000410')
+        self.folder = Folder.objects.create(name='a', owner=self.user)
+        self.other_folder = Folder.objects.create(name='b', owner=self.user)
+
+    def usage(self):
+        self.user.refresh_from_db()
+        self.folder.refresh_from_db()
+        self.other_folder.refresh_from_db()
+        return self.user.storage_used, self.folder.storage_used, self.other_folder.storage_used
+
+    def test_save_move_and_delete(self):
+        document = self.upload(self.user, 'a.txt', b'0123456789', folder=self.folder)
+        self.upload(self.user, 'b.txt', b'abc')
+        self.assertEqual(self.usage(), (13, 10, 0))
+
+        document = Document.objects.get(pk=document.pk)
+        document.folder = self.other_folder
+        document.save()
+        self.assertEqual(self.usage(), (13, 0, 10))
+
+        document.delete()
+        self.assertEqual(self.usage(), (3, 0, 0))
+
+    def test_folder_delete_releases_its_subtree(self):
+        child = Folder.objects.create(name='child', owner=self.user, parent=self.folder)
+        self.upload(self.user, 'a.txt', b'0123456789', folder=self.folder)
+        self.upload(self.user, 'b.txt', b'abc', folder=child)
+        self.upload(self.user, 'c.txt', b'xy', folder=self.other_folder)
+        self.folder.delete()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.storage_used, 2)
+
+    def test_unindexed_folder_delete_only_releases_its_own_documents(self):
+        stranger = User.objects.create_user(phone_number='+10000000411')
+        self.upload(stranger, 'theirs.txt', b'x' * 999, folder=Folder.objects.create(name='c', owner=stranger))
+        unindexed = Folder.objects.bulk_create([Folder(name='bulk', owner=self.user)])[0]
+        self.upload(self.user, 'mine.txt', b'abcd', folder=unindexed)
+        self.upload(self.user, 'kept.txt', b'xy', folder=self.folder)
+
+        unindexed.delete()
+        self.assertEqual(self.usage(), (2, 2, 0))
+        stranger.refresh_from_db()
+        self.assertEqual(stranger.storage_used, 999)
+
+    def test_reconcile_storage_repairs_drift(self):
+        self.upload(self.user, 'a.txt', b'0123456789', folder=self.folder)
+        User.objects.filter(pk=self.user.pk).update(storage_used=-5)
+        Folder.objects.filter(pk=self.other_folder.pk).update(storage_used=7)
+
+        out = StringIO()
+        call_command('reconcile_storage', dry_run=True, stdout=out)
+        self.assertIn('Users with drift: 1', out.getvalue())
+        self.assertEqual(self.usage(), (-5, 10, 7))
+
+        call_command('reconcile_storage', stdout=StringIO())
+        self.assertEqual(self.usage(), (10, 10, 0))
+
+
+class BlobTests(MediaRootMixin, TestCase):
+    """Identical content is stored once and reference counted."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(phone_number='+10000000420')
+        self.stranger = User.objects.create_user(phone_number='+10000000421')
+        self.storage = Document._meta.get_field('file').storage
+
+    def stored_files(self):
+        root = self.storage.path('blobs')
+        return sorted(
+            os.path.relpath(os.path.join(dirpath, name), root)
+            for dirpath, _, names in os.walk(root) for name in names
+        )
+
+    def ref_counts(self):
+        return dict(Blob.objects.values_list('checksum', 'ref_count'))
+
+    def test_identical_uploads_share_one_blob(self):
+        reads = []
+        file = SimpleUploadedFile('a.txt', b'same content')
+        original_chunks = file.chunks
+        file.chunks = lambda *args, **kwargs: reads.append(1) or original_chunks(*args, **kwargs)
+
+        documents = create_documents(self.user, [file, SimpleUploadedFile('b.txt', b'same content')])
+        theirs = self.upload(self.stranger, 'c.txt', b'same content')
+        checksum = documents[0].checksum
+
+        self.assertEqual(len(reads), 1)  # Hashed in the pass that stored it
+        self.assertEqual({doc.file.name for doc in [*documents, theirs]}, {blob_name(checksum)})
+        self.assertEqual(self.ref_counts(), {checksum: 3})
+        self.assertEqual(self.stored_files(), [os.path.relpath(blob_name(checksum), 'blobs')])
+
+    def test_deletes_release_references_and_collect_removes_the_blob(self):
+        document = self.upload(self.user, 'a.txt', b'shared')
+        other = self.upload(self.stranger, 'b.txt', b'shared')
+        document.delete()
+        self.assertEqual(self.ref_counts(), {other.checksum: 1})
+
+        call_command('collect_blobs', stdout=StringIO())
+        self.assertTrue(self.storage.exists(other.file.name))
+
+        other.delete()
+        call_command('collect_blobs', stdout=StringIO())
+        self.assertEqual(self.ref_counts(), {})
+        self.assertEqual(self.stored_files(), [])
+
+    def test_unindexed_folder_delete_keeps_other_users_blobs(self):
+        theirs = self.upload(self.stranger, 'theirs.txt', b'theirs', folder=Folder.objects.create(name='a', owner=self.stranger))
+        unindexed = Folder.objects.bulk_create([Folder(name='bulk', owner=self.user)])[0]
+        mine = self.upload(self.user, 'mine.txt', b'mine', folder=unindexed)
+
+        unindexed.delete()
+        self.assertEqual(self.ref_counts(), {theirs.checksum: 1, mine.checksum: 0})
+        call_command('collect_blobs', stdout=StringIO())
+        self.assertTrue(self.storage.exists(theirs.file.name))
+        self.assertFalse(self.storage.exists(mine.file.name))
+
+    def test_user_and_queryset_deletes_release_references(self):
+        shared = self.upload(self.user, 'a.txt', b'shared')
+        self.upload(self.stranger, 'b.txt', b'shared')
+        folder = Folder.objects.create(name='f', owner=self.user)
+        own = self.upload(self.user, 'c.txt', b'only mine', folder=folder)
+
+        Document.objects.filter(owner=self.stranger).delete()
+        self.assertEqual(self.ref_counts(), {shared.checksum: 1, own.checksum: 1})
+
+        self.user.delete()
+        self.assertEqual(self.ref_counts(), {shared.checksum: 0, own.checksum: 0})
+        call_command('collect_blobs', stdout=StringIO())
+        self.assertEqual(self.ref_counts(), {})
+        self.assertEqual(self.stored_files(), [])
+
+    def test_recount(self):
+        document = self.upload(self.user, 'a.txt', b'counted')
+        Blob.objects.update(ref_count=0)
+        out = StringIO()
+        call_command('collect_blobs', recount=True, dry_run=True, stdout=out)
+        self.assertIn('Blobs with wrong reference count: 1', out.getvalue())
+        self.assertEqual(self.ref_counts(), {document.checksum: 0})
+
+        call_command('collect_blobs', recount=True, stdout=StringIO())
+        self.assertEqual(self.ref_counts(), {document.checksum: 1})
+        self.assertTrue(self.storage.exists(document.file.name))
+
+    def test_orphans(self):
+        document = self.upload(self.user, 'a.txt', b'tracked')
+        old_orphan = self.storage.save(blob_name('ab' * 32), SimpleUploadedFile('x', b'old'))
+        new_orphan = self.storage.save(blob_name('cd' * 32), SimpleUploadedFile('x', b'new'))
+        two_days_ago = time.time() - 48 * 3600
+        os.utime(self.storage.path(old_orphan), (two_days_ago, two_days_ago))
+        os.utime(self.storage.path(document.file.name), (two_days_ago, two_days_ago))
+
+        call_command('collect_blobs', orphans=True, stdout=StringIO())
+        self.assertFalse(self.storage.exists(old_orphan))
+        self.assertTrue(self.storage.exists(new_orphan))  # Within the grace period
+        self.assertTrue(self.storage.exists(document.file.name))
+
+
+class Interrupted(Exception):
+    pass
+
+
+class ProcessingEngineTests(MediaRootMixin, TestCase):
+    """Documents are processed in batches that checkpoint their status."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(phone_number='+10000000430')
+        self.documents = [self.upload(self.user, f'{i}.txt', f'document {i}'.encode()) for i in range(5)]
+        self.engine = ProcessingEngine(executor='thread', workers=2, batch_size=2)
+
+    def statuses(self):
+        return list(Document.objects.order_by('pk').values_list('processing_status', flat=True))
+
+    def test_batches(self):
+        batches = list(self.engine.batches(Document.objects.all()))
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual([doc.pk for batch in batches for doc in batch], [doc.pk for doc in self.documents])
+
+        with self.assertNumQueries(4):  # One per batch and the empty one that ends the loop
+            for batch in self.engine.batches(Document.objects.all()):
+                [(doc.owner.phone_number, doc.folder) for doc in batch]
+
+    def test_status_is_saved(self):
+        failing = self.documents[-1]
+        os.remove(failing.file.path)
+
+        stats = self.engine.run(Document.objects.all())
+
+        self.assertEqual(stats, {'processed': 4, 'reused': 0, 'skipped': 0, 'failed': 1})
+        self.assertEqual(self.statuses(), ['done'] * 4 + ['failed'])
+        failing.refresh_from_db()
+        self.assertNotEqual(failing.processing_error, '')
+        done = Document.objects.get(pk=self.documents[0].pk)
+        self.assertEqual(done.processed_version, PROCESSOR_VERSION)
+        self.assertIsNotNone(done.processed_at)
+
+    def test_interrupted_run_resumes_after_the_last_batch(self):
+        seen = []
+
+        def interrupt(document, folder_path, result):
+            seen.append(document.pk)
+            if len(seen) == 3:
+                raise Interrupted
+
+        with self.assertRaises(Interrupted):
+            self.engine.run(Document.objects.all(), on_result=interrupt)
+        self.assertEqual(self.statuses(), ['done', 'done', 'pending', 'pending', 'pending'])
+
+        stats = self.engine.run(Document.objects.all())
+        self.assertEqual(stats['processed'] + stats['reused'], 3)
+        self.assertEqual(self.statuses(), ['done'] * 5)
+        self.assertEqual(self.engine.run(Document.objects.all()), {'processed': 0, 'reused': 0, 'skipped': 0, 'failed': 0})
+
+    def test_skipped_documents_are_retried(self):
+        legacy = self.upload(self.user, 'legacy.doc', b'plain words')
+        self.engine.run(Document.objects.all())
+
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.processing_status, 'skipped')
+        self.assertIn('not supported', legacy.processing_error)
+        self.assertEqual(ProcessingResult.objects.get(checksum=legacy.checksum).status, 'skipped')
+        self.assertEqual(list(self.engine.pending(Document.objects.all())), [legacy])
+
+        # Once an extractor is available the document is processed, not reused
+        with mock.patch.dict('documents.extraction.EXTRACTORS', {'doc': extract_plain_text}):
+            stats = self.engine.run(Document.objects.all())
+        self.assertEqual(stats, {'processed': 1, 'reused': 0, 'skipped': 0, 'failed': 0})
+        legacy.refresh_from_db()
+        self.assertEqual((legacy.processing_status, legacy.text.content), ('done', 'plain words'))
+
+
+class ProcessingLedgerTests(MediaRootMixin, TestCase):
+    """Each distinct content is processed once per processor version."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(phone_number='+10000000440')
+        self.stranger = User.objects.create_user(phone_number='+10000000441')
+        self.engine = ProcessingEngine(executor='thread', workers=1)
+
+    def run_engine(self):
+        with mock.patch('documents.processing.process_file', wraps=process_file) as processed:
+            stats = self.engine.run(Document.objects.all())
+        return stats, sorted(os.path.basename(call.args[0]) for call in processed.call_args_list)
+
+    def test_identical_content_is_reused_across_documents_and_users(self):
+        first = self.upload(self.user, 'a.txt', b'the same words')
+        self.upload(self.user, 'b.txt', b'the same words')
+        stats, processed = self.run_engine()
+        self.assertEqual(stats, {'processed': 1, 'reused': 1, 'skipped': 0, 'failed': 0})
+        self.assertEqual(processed, [first.checksum])
+
+        theirs = self.upload(self.stranger, 'c.md', b'the same words')
+        stats, processed = self.run_engine()
+        self.assertEqual(stats, {'processed': 0, 'reused': 1, 'skipped': 0, 'failed': 0})
+        self.assertEqual(processed, [])
+        self.assertEqual(Document.objects.get(pk=theirs.pk).text.content, 'the same words')
+        self.assertEqual(ProcessingResult.objects.count(), 1)
+
+    def test_version_bump_reprocesses_everything(self):
+        document = self.upload(self.user, 'a.txt', b'versioned')
+        self.upload(self.stranger, 'b.txt', b'versioned')
+        self.run_engine()
+
+        with mock.patch('documents.processing.PROCESSOR_VERSION', PROCESSOR_VERSION + 1):
+            self.assertEqual(self.engine.pending(Document.objects.all()).count(), 2)
+            stats, processed = self.run_engine()
+        self.assertEqual(stats, {'processed': 1, 'reused': 1, 'skipped': 0, 'failed': 0})
+        self.assertEqual(processed, [document.checksum])
+        self.assertEqual(
+            set(Document.objects.values_list('processed_version', flat=True)), {PROCESSOR_VERSION + 1},
+        )
+        self.assertEqual(
+            sorted(ProcessingResult.objects.values_list('processor_version', flat=True)),
+            [PROCESSOR_VERSION, PROCESSOR_VERSION + 1],
+        )
@@ -0,0 +1,66 @@
+"""Upload handlers that fingerprint document uploads as they stream in.
+
+The handlers compute each file's SHA-256 checksum and sniff its type
+from the leading bytes while Django receives the chunks, and attach the
+results to the uploaded file as ``checksum`` and ``sniffed_type``. The
+upload pipeline and ``Document.save`` use them instead of re-reading
+the file.
+"""
+import hashlib
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+SNIFF_BYTES = 8
+
+FILE_SIGNATURES = [
+    (b'%PDF-', 'pdf'),
+    (b'PK\x03\x04', 'docx'),
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'doc'),
+]
+
+
+def sniff_file_type(head):
+    """Guess a document file type from its first bytes."""
+    for signature, file_type in FILE_SIGNATURES:
+        if head.startswith(signature):
+            return file_type
+    return 'txt'
+
+
+class HashingUploadMixin:
+    """Fingerprint the chunks a wrapped upload handler consumes."""
+
+    def new_file(self, *args, **kwargs):
+        # Reset first: the memory handler's new_file raises StopFutureHandlers
+        self.sha256 = hashlib.sha256()
+        self.head = b''
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        remaining = super().receive_data_chunk(raw_data, start)
+        if remaining is None:
+            # This handler consumed the chunk, so it owns the fingerprint
+            self.sha256.update(raw_data)
+            if len(self.head) < SNIFF_BYTES:
+                self.head += raw_data[:SNIFF_BYTES - len(self.head)]
+        return remaining
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.checksum = self.sha256.hexdigest()
+            file.sniffed_type = sniff_file_type(self.head)
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    """Keep small uploads in memory, fingerprinting them on the way in."""
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    """Stream large uploads to a temporary file, fingerprinting them on the way in."""
+
+
+def hashing_upload_handlers(request):
+    """Return the upload handler chain used for document uploads."""
+    return [HashingMemoryFileUploadHandler(request), HashingTemporaryFileUploadHandler(request)]
@@ -0,0 +1,168 @@
+"""Batch upload pipeline for documents.
+
+``create_documents`` stores a whole multi-file upload as one unit: each
+file is written to content-addressed storage only if its blob does not
+exist yet, then the quota is reserved once for the total payload and
+all rows are inserted with a single ``bulk_create`` inside one
+transaction.
+Preview generation and processing of the new documents are queued as
+background jobs in the same transaction.
+"""
+import hashlib
+import os
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.files.base import File
+from django.db import models, transaction
+
+from folders.models import Folder
+from jobs.tasks import enqueue_many
+from .models import Blob, Document, EXTENSION_FILE_TYPES
+from .storage import blob_name, incoming_name
+
+User = get_user_model()
+
+
+class StorageQuotaExceeded(Exception):
+    """Raised when an upload does not fit in the owner's storage quota."""
+
+
+class HashingFile(File):
+    """File wrapper that computes a SHA-256 digest as storage reads its chunks."""
+
+    def __init__(self, file):
+        super().__init__(file, name=file.name)
+        self.sha256 = hashlib.sha256()
+
+    def chunks(self, chunk_size=None):
+        for chunk in self.file.chunks(chunk_size):
+            self.sha256.update(chunk)
+            yield chunk
+
+
+def store_blob(storage, file):
+    """Write an uploaded file to content-addressed storage; returns its checksum.
+
+    Files received through the hashing upload handlers already carry their
+    checksum and go straight to their blob (a no-op if it is stored). Other
+    files are hashed while they are copied to an incoming name and then
+    moved to their blob, so every file is read once.
+    """
+    checksum = getattr(file, 'checksum', None)
+    if checksum:
+        storage.save(blob_name(checksum), file)
+        return checksum
+    content = HashingFile(file)
+    temp_name = storage.save(incoming_name(), content)
+    checksum = content.sha256.hexdigest()
+    storage.promote(temp_name, blob_name(checksum))
+    return checksum
+
+
+def matches_sniffed_type(file, file_type):
+    """Check an extension's file type against the type sniffed during upload."""
+    sniffed = getattr(file, 'sniffed_type', None)
+    if sniffed is None:
+        return True
+    if file_type in ('txt', 'md'):
+        return sniffed == 'txt'
+    return sniffed == file_type
+
+
+def reserve_storage(user, size):
+    """Atomically add size bytes to the user's usage if it fits in the quota.
+
+    Raises StorageQuotaExceeded if the reservation would exceed the quota.
+    """
+    reserved = User.objects.filter(
+        pk=user.pk,
+        storage_used__lte=models.F('storage_quota') - size,
+    ).update(storage_used=models.F('storage_used') + size)
+    if not reserved:
+        raise StorageQuotaExceeded("Storage quota exceeded")
+    user.storage_used += size
+
+
+def create_documents(owner, files, folder=None):
+    """Store uploaded files and create their Document rows in one transaction.
+
+    Files larger than MAX_UPLOAD_SIZE are skipped. Raises ValidationError
+    for disallowed file types or content that does not match the file's
+    extension, and StorageQuotaExceeded if the batch does not fit in the
+    owner's quota; in both cases no document is created.
+
+    Blobs are written before the transaction opens, so the database write
+    lock is only held for the quota reservation and the inserts. Blobs
+    written for an upload that then fails are left to
+    ``collect_blobs --orphans``.
+    """
+    files = [file for file in files if file.size <= settings.MAX_UPLOAD_SIZE]
+    file_types = []
+    for file in files:
+        ext = os.path.splitext(file.name)[1].lower()
+        file_type = EXTENSION_FILE_TYPES.get(ext)
+        if ext not in settings.ALLOWED_FILE_TYPES or file_type is None:
+            raise ValidationError(f"File type {ext} is not allowed.")
+        if not matches_sniffed_type(file, file_type):
+            raise ValidationError(f"File {file.name} does not look like a {ext} file.")
+        file_types.append(file_type)
+    if not files:
+        return []
+
+    total_size = sum(file.size for file in files)
+    if owner.storage_used + total_size > owner.storage_quota:
+        # Fail before any I/O; reserve_storage below is the authoritative check
+        raise StorageQuotaExceeded("Storage quota exceeded")
+
+    storage = Document._meta.get_field('file').storage
+    checksums = []
+    first_files = {}
+    for file in files:
+        checksum = store_blob(storage, file)
+        checksums.append(checksum)
+        first_files.setdefault(checksum, file)
+
+    blobs = {}
+    for file, checksum in zip(files, checksums):
+        name, size, count = blobs.get(checksum, (blob_name(checksum), file.size, 0))
+        blobs[checksum] = (name, size, count + 1)
+
+    with transaction.atomic():
+        reserve_storage(owner, total_size)
+        Blob.objects.acquire(blobs)
+
+        # collect_blobs may have removed an unreferenced blob between the
+        # write above and acquire(); once referenced it can no longer go
+        for checksum, file in first_files.items():
+            if not storage.exists(blob_name(checksum)):
+                file.seek(0)
+                storage.save(blob_name(checksum), file)
+
+        documents = Document.objects.bulk_create(
+            [
+                Document(
+                    name=file.name,
+                    file=blob_name(checksum),
+                    file_type=file_type,
+                    file_size=file.size,
+                    checksum=checksum,
+                    owner=owner,
+                    folder=folder,
+                )
+                for file, checksum, file_type in zip(files, checksums, file_types)
+            ],
+            batch_size=500,
+        )
+        Folder.add_storage_used(folder.pk if folder else None, total_size)
+
+        # Previews, extraction and indexing run in a worker, not in the request
+        document_ids = [doc.pk for doc in documents]
+        enqueue_many([
+            {'name': 'documents.generate_previews', 'payload': {'document_ids': document_ids}, 'priority': 10},
+            {'name': 'documents.process', 'payload': {'document_ids': document_ids}},
+        ])
+
+    return documents
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from folders.models import Folder
+from folders.tree import build_paths
+
+
+class Command(BaseCommand):
+    help = 'Verify or rebuild the materialized path index of the folder hierarchy'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report folders whose stored path is out of date',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of folders written per UPDATE batch',
+        )
+
+    def handle(self, *args, **options):
+        paths = build_paths(Folder.objects.values_list('id', 'parent_id'))
+
+        stale = [
+            Folder(id=pk, path=paths[pk][0], depth=paths[pk][1])
+            for pk, path, depth in Folder.objects.values_list('id', 'path', 'depth').iterator()
+            if paths[pk] != (path, depth)
+        ]
+
+        self.stdout.write(f"Checked {len(paths)} folder(s), {len(stale)} out of date")
+
+        if options['check']:
+            if stale:
+                raise CommandError(f"Folder tree index is out of date for {len(stale)} folder(s)")
+            self.stdout.write(self.style.SUCCESS("Folder tree index is consistent"))
+            return
+
+        Folder.objects.bulk_update(stale, ['path', 'depth'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(stale)} folder path(s)"))
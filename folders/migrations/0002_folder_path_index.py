@@ -0,0 +1,33 @@
+# Generated by Django 5.0.1 on 2026-10-17 02:26
+
+from django.db import migrations, models
+
+from folders.tree import build_paths
+
+
+def backfill_paths(apps, schema_editor):
+    Folder = apps.get_model('folders', 'Folder')
+    paths = build_paths(Folder.objects.values_list('id', 'parent_id'))
+    folders = [Folder(id=pk, path=path, depth=depth) for pk, (path, depth) in paths.items()]
+    Folder.objects.bulk_update(folders, ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('folders', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folder',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=1024),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+    ]
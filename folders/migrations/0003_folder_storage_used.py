@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-17 02:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('folders', '0002_folder_path_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folder',
+            name='storage_used',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -1,5 +1,31 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Coalesce, Concat, Substr
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+
+from .tree import make_path, path_depth, path_ids
+
+
+class FolderQuerySet(models.QuerySet):
+    """QuerySet helpers for Folder."""
+
+    def with_stats(self):
+        """Annotate each folder with its direct file count and total size."""
+        return self.annotate(
+            file_count=models.Count('documents'),
+            total_size=Coalesce(models.Sum('documents__file_size'), 0),
+        )
+
+    def full_paths(self, folders):
+        """Map each folder's id to its full path, loading all ancestor names in one query."""
+        folders = [folder for folder in folders if folder is not None]
+        ancestor_ids = {pk for folder in folders for pk in folder.get_ancestor_ids()}
+        names = dict(self.filter(pk__in=ancestor_ids).values_list('pk', 'name')) if ancestor_ids else {}
+        return {
+            folder.pk: '/'.join([names[pk] for pk in folder.get_ancestor_ids()] + [folder.name])
+            for folder in folders
+        }
 
 
 class Folder(models.Model):
@@ -11,6 +37,15 @@ class Folder(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Materialized path index, maintained by save(); see folders/tree.py
+    path = models.CharField(max_length=1024, blank=True, db_index=True, editable=False)
+    depth = models.PositiveIntegerField(default=0, editable=False)
+
+    # Cached size of the documents directly in this folder, maintained by Document
+    storage_used = models.BigIntegerField(default=0, editable=False)
+
+    objects = FolderQuerySet.as_manager()
+
     class Meta:
         ordering = ['name']
         unique_together = ['owner', 'parent', 'name']
@@ -18,11 +53,72 @@ class Folder(models.Model):
     def __str__(self):
         return self.get_full_path()
 
+    def save(self, *args, **kwargs):
+        """Override save to keep the materialized path of this folder and its subtree current."""
+        ids = [pk for pk in (self.pk, self.parent_id) if pk]
+        stored = dict(Folder.objects.filter(pk__in=ids).values_list('pk', 'path')) if ids else {}
+        old_path = stored.get(self.pk, '')
+        parent_path = stored.get(self.parent_id, '') if self.parent_id else ''
+
+        if old_path and parent_path.startswith(old_path):
+            raise ValidationError("A folder cannot be moved into itself or one of its subfolders.")
+
+        # Never write back a stale in-memory path; the subtree update below owns it
+        self.path = old_path
+        self.depth = path_depth(old_path) if old_path else 0
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            new_path = make_path(parent_path, self.pk)
+            if new_path != old_path:
+                self._move_subtree(old_path, new_path)
+
+    def _move_subtree(self, old_path, new_path):
+        """Rewrite the path prefix of this folder and all of its descendants."""
+        new_depth = path_depth(new_path)
+        if old_path:
+            Folder.objects.filter(path__startswith=old_path).update(
+                path=Concat(models.Value(new_path), Substr('path', len(old_path) + 1)),
+                depth=models.F('depth') + (new_depth - path_depth(old_path)),
+            )
+        else:
+            Folder.objects.filter(pk=self.pk).update(path=new_path, depth=new_depth)
+        self.path = new_path
+        self.depth = new_depth
+
+    def delete(self, *args, **kwargs):
+        """Override delete to release the storage of every document in the subtree.
+
+        Blob references are released by the documents' post_delete receiver.
+        """
+        with transaction.atomic():
+            released = self.get_subtree_documents().aggregate(total=Coalesce(models.Sum('file_size'), 0))['total']
+            result = super().delete(*args, **kwargs)
+            get_user_model().objects.add_storage_used(self.owner_id, -released)
+        return result
+
+    @staticmethod
+    def add_storage_used(folder_id, delta):
+        """Atomically adjust the cached size of a folder by delta bytes."""
+        if folder_id and delta:
+            Folder.objects.filter(pk=folder_id).update(storage_used=models.F('storage_used') + delta)
+
+    def get_ancestor_ids(self):
+        """Get the ids of all ancestor folders, root first."""
+        return path_ids(self.path)[:-1]
+
+    def get_ancestors(self):
+        """Get all ancestor folders, root first."""
+        return Folder.objects.filter(pk__in=self.get_ancestor_ids()).order_by('depth')
+
     def get_full_path(self):
         """Get the full path of the folder including parent folders."""
-        if self.parent:
-            return f"{self.parent.get_full_path()}/{self.name}"
-        return self.name
+        ancestor_ids = self.get_ancestor_ids()
+        if not ancestor_ids:
+            return self.name
+        names = dict(Folder.objects.filter(pk__in=ancestor_ids).values_list('pk', 'name'))
+        return '/'.join([names[pk] for pk in ancestor_ids] + [self.name])
 
     def get_children(self):
         """Get all child folders."""
@@ -34,20 +130,35 @@ class Folder(models.Model):
 
     def get_total_size(self):
         """Get the total size of all files in this folder."""
-        total = self.documents.aggregate(total=models.Sum('file_size'))['total']
-        return total or 0
+        return self.storage_used
+
+    def get_subtree_stats(self):
+        """Get folder count, file count and total size for this folder and all of its descendants."""
+        if not self.path:
+            # Not indexed yet; an empty prefix would match every folder
+            return {'folder_count': 0, 'file_count': 0, 'total_size': 0}
+        stats = Folder.objects.filter(owner_id=self.owner_id, path__startswith=self.path).aggregate(
+            folder_count=models.Count('id', distinct=True),
+            file_count=models.Count('documents'),
+            total_size=Coalesce(models.Sum('documents__file_size'), 0),
+        )
+        return stats
+
+    def get_subtree_documents(self):
+        """Get the owner's documents in this folder and all of its descendants."""
+        from documents.models import Document
+
+        if not self.path:
+            # Not indexed yet; an empty prefix would match every folder
+            return Document.objects.filter(owner_id=self.owner_id, folder_id=self.pk)
+        return Document.objects.filter(owner_id=self.owner_id, folder__path__startswith=self.path)
 
     def get_all_descendants(self):
-        """Get all descendant folders recursively."""
-        descendants = list(self.children.all())
-        for child in list(descendants):
-            descendants.extend(child.get_all_descendants())
-        return descendants
+        """Get all descendant folders."""
+        if not self.path:
+            return Folder.objects.none()
+        return Folder.objects.filter(owner_id=self.owner_id, path__startswith=self.path, depth__gt=self.depth)
 
     def is_ancestor_of(self, folder):
         """Check if this folder is an ancestor of the given folder."""
-        if folder.parent is None:
-            return False
-        if folder.parent == self:
-            return True
-        return self.is_ancestor_of(folder.parent)
+        return bool(self.path) and folder.pk != self.pk and folder.path.startswith(self.path)
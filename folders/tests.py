@@ -1,3 +1,105 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
 from django.test import TestCase
 
-# Create your tests here.
+from documents.models import Document
+from .models import Folder
+
+User = get_user_model()
+
+
+class FolderTreeTests(TestCase):
+    """save() keeps the materialized path of folders and their subtrees current."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='+10000000400')
+        self.root = Folder.objects.create(name='root', owner=self.user)
+        self.child = Folder.objects.create(name='child', owner=self.user, parent=self.root)
+        self.grandchild = Folder.objects.create(name='grandchild', owner=self.user, parent=self.child)
+        self.other = Folder.objects.create(name='other', owner=self.user)
+
+    def paths(self):
+        return {
+            name: (path, depth)
+            for name, path, depth in Folder.objects.values_list('name', 'path', 'depth')
+        }
+
+    def test_path_and_depth_on_create(self):
+        root, child, grandchild = self.root.pk, self.child.pk, self.grandchild.pk
+        self.assertEqual(self.paths(), {
+            'root': (f"{root}/", 0),
+            'child': (f"{root}/{child}/", 1),
+            'grandchild': (f"{root}/{child}/{grandchild}/", 2),
+            'other': (f"{self.other.pk}/", 0),
+        })
+        self.assertEqual(list(self.root.get_all_descendants()), [self.child, self.grandchild])
+        self.assertEqual(self.grandchild.get_full_path(), 'root/child/grandchild')
+
+    def test_move_rewrites_the_subtree(self):
+        self.child.parent = self.other
+        self.child.save()
+        other, child, grandchild = self.other.pk, self.child.pk, self.grandchild.pk
+        self.assertEqual(self.paths()['child'], (f"{other}/{child}/", 1))
+        self.assertEqual(self.paths()['grandchild'], (f"{other}/{child}/{grandchild}/", 2))
+        self.assertEqual(list(self.root.get_all_descendants()), [])
+
+        self.child.parent = None
+        self.child.save()
+        self.assertEqual(self.paths()['grandchild'], (f"{child}/{grandchild}/", 1))
+
+    def test_cycles_are_rejected(self):
+        for parent in (self.root, self.grandchild):
+            self.root.parent = parent
+            with self.assertRaises(ValidationError):
+                self.root.save()
+        self.root.refresh_from_db()
+        self.assertIsNone(self.root.parent_id)
+        self.assertEqual(self.paths()['grandchild'][1], 2)
+
+    def test_rebuild_folder_tree(self):
+        call_command('rebuild_folder_tree', check=True, stdout=StringIO())
+
+        Folder.objects.filter(pk=self.grandchild.pk).update(path='', depth=0)
+        Folder.objects.filter(pk=self.child.pk).update(depth=7)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_folder_tree', check=True, stdout=StringIO())
+
+        out = StringIO()
+        call_command('rebuild_folder_tree', stdout=out)
+        self.assertIn('Rebuilt 2 folder path(s)', out.getvalue())
+        call_command('rebuild_folder_tree', check=True, stdout=StringIO())
+        self.assertEqual(self.paths()['grandchild'][1], 2)
+
+
+class FolderSubtreeStatsTests(TestCase):
+    """Subtree totals only ever cover the folder's own subtree."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='+10000000401')
+        self.root = Folder.objects.create(name='root', owner=self.user)
+        child = Folder.objects.create(name='child', owner=self.user, parent=self.root)
+        stranger = User.objects.create_user(phone_number='+10000000402')
+        strange = Folder.objects.create(name='strange', owner=stranger)
+        Document.objects.bulk_create(
+            Document(name=f'{i}.txt', file=f'documents/{i}.txt', file_type='txt', file_size=size, owner=folder.owner, folder=folder)
+            for i, (folder, size) in enumerate([(self.root, 1), (child, 10), (strange, 999)])
+        )
+
+    def test_subtree_stats(self):
+        self.assertEqual(
+            self.root.get_subtree_stats(),
+            {'folder_count': 2, 'file_count': 2, 'total_size': 11},
+        )
+
+    def test_unindexed_folder_has_no_subtree(self):
+        # bulk_create skips save(), so the path is never filled in
+        unindexed = Folder.objects.bulk_create([Folder(name='bulk', owner=self.user)])[0]
+        self.assertEqual(unindexed.path, '')
+        self.assertEqual(
+            unindexed.get_subtree_stats(),
+            {'folder_count': 0, 'file_count': 0, 'total_size': 0},
+        )
+        self.assertEqual(list(unindexed.get_all_descendants()), [])
@@ -0,0 +1,55 @@
+"""Helpers for the materialized-path index on Folder.
+
+Each folder stores ``path``, the ids of its ancestors and itself joined
+by ``PATH_SEPARATOR`` with a trailing separator (e.g. ``"3/17/42/"``),
+and ``depth``, its distance from the root (0 for top-level folders).
+Descendant lookups become a single indexed prefix match on ``path``.
+"""
+from collections import defaultdict
+
+PATH_SEPARATOR = '/'
+
+
+def make_path(parent_path, pk):
+    """Build the path for folder ``pk`` under a parent with ``parent_path``."""
+    return f"{parent_path}{pk}{PATH_SEPARATOR}"
+
+
+def path_depth(path):
+    """Return the depth encoded in a path."""
+    return path.count(PATH_SEPARATOR) - 1
+
+
+def path_ids(path):
+    """Return the folder ids encoded in a path, root first."""
+    return [int(pk) for pk in path.split(PATH_SEPARATOR) if pk]
+
+
+def build_paths(rows):
+    """Compute ``{id: (path, depth)}`` from an iterable of ``(id, parent_id)``.
+
+    Folders whose parent is missing or that sit on a parent cycle are
+    treated as roots so that every folder receives a path.
+    """
+    parents = dict(rows)
+    children = defaultdict(list)
+    for pk, parent_id in parents.items():
+        children[parent_id].append(pk)
+
+    paths = {}
+
+    def walk(root_ids):
+        stack = [(pk, '') for pk in root_ids]
+        while stack:
+            pk, parent_path = stack.pop()
+            if pk in paths:
+                continue
+            path = make_path(parent_path, pk)
+            paths[pk] = (path, path_depth(path))
+            stack.extend((child, path) for child in children[pk])
+
+    walk(pk for pk, parent_id in parents.items() if parent_id is None or parent_id not in parents)
+    for pk in parents:
+        if pk not in paths:
+            walk([pk])
+    return paths
@@ -0,0 +1,11 @@
+from django.contrib import admin
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """Admin configuration for Job model."""
+
+    list_display = ('task', 'status', 'priority', 'attempts', 'run_at', 'created_at')
+    list_filter = ('status', 'task')
+    readonly_fields = ('attempts', 'locked_at', 'locked_by', 'last_error', 'created_at', 'finished_at')
@@ -0,0 +1,69 @@
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from jobs.models import Job
+from jobs.worker import Worker
+
+
+class Command(BaseCommand):
+    help = 'Run background job workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of worker threads in this process',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait before polling an empty queue again',
+        )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Exit once there are no runnable jobs left',
+        )
+        parser.add_argument(
+            '--max-jobs',
+            type=int,
+            default=None,
+            help='Exit after each worker has run this many jobs',
+        )
+
+    def handle(self, *args, **options):
+        stale = Job.objects.requeue_stale()
+        if stale:
+            self.stdout.write(self.style.WARNING(f"Requeued {stale} stale job(s)"))
+
+        # Each worker takes its name from the thread it runs in
+        workers = [Worker(poll_interval=options['poll_interval']) for _ in range(options['workers'])]
+        self.stdout.write(f"Starting {len(workers)} worker(s)")
+
+        def work(worker):
+            try:
+                worker.run(burst=options['burst'], max_jobs=options['max_jobs'])
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=work, args=(worker,)) for worker in workers[1:]]
+        for thread in threads:
+            thread.start()
+        try:
+            # The first worker runs in the main thread so Ctrl-C reaches it
+            workers[0].run(burst=options['burst'], max_jobs=options['max_jobs'])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping workers after their current job")
+        finally:
+            for worker in workers:
+                worker.stop()
+            for thread in threads:
+                thread.join()
+
+        processed = sum(worker.processed for worker in workers)
+        failed = sum(worker.failed for worker in workers)
+        self.stdout.write(self.style.SUCCESS(f"Jobs done: {processed}, failed: {failed}"))
@@ -0,0 +1,100 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+class JobManager(models.Manager):
+    """Queue operations that must stay atomic across concurrent workers."""
+
+    def claim(self, worker, limit=10):
+        """Lock the next runnable job for worker and return it, or None.
+
+        Candidates are read highest priority first, then taken with a
+        conditional UPDATE, so two workers never claim the same job and
+        no database-specific row locking is needed.
+        """
+        now = timezone.now()
+        candidates = self.filter(status='queued', run_at__lte=now).order_by(
+            '-priority', 'run_at', 'id',
+        ).values_list('id', flat=True)[:limit]
+        for pk in candidates:
+            claimed = self.filter(pk=pk, status='queued').update(
+                status='running',
+                locked_at=now,
+                locked_by=worker,
+                attempts=models.F('attempts') + 1,
+            )
+            if claimed:
+                return self.get(pk=pk)
+        return None
+
+    def requeue_stale(self, timeout=None):
+        """Put jobs back in the queue whose worker stopped without finishing them."""
+        if timeout is None:
+            timeout = getattr(settings, 'JOBS_LOCK_TIMEOUT', 3600)
+        return self.filter(
+            status='running',
+            locked_at__lt=timezone.now() - timedelta(seconds=timeout),
+        ).update(status='queued', locked_at=None, locked_by='')
+
+
+class Job(models.Model):
+    """A unit of background work stored in the database."""
+
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    task = models.CharField(max_length=255)
+    payload = models.JSONField(default=dict, blank=True)
+    priority = models.IntegerField(default=0, help_text="Higher priority jobs run first")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=255, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    objects = JobManager()
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_at'], name='job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
+
+    def retry_delay(self):
+        """Seconds to wait before the next attempt, doubling after every failure."""
+        base = getattr(settings, 'JOBS_RETRY_BACKOFF', 10)
+        maximum = getattr(settings, 'JOBS_RETRY_MAX_DELAY', 3600)
+        return min(base * 2 ** max(self.attempts - 1, 0), maximum)
+
+    def mark_done(self):
+        self.status = 'done'
+        self.finished_at = timezone.now()
+        self.locked_at = None
+        self.last_error = ''
+        self.save(update_fields=['status', 'finished_at', 'locked_at', 'last_error'])
+
+    def mark_failed(self, error):
+        """Schedule a retry with backoff, or fail for good after max_attempts."""
+        self.last_error = error
+        self.locked_at = None
+        if self.attempts < self.max_attempts:
+            self.status = 'queued'
+            self.run_at = timezone.now() + timedelta(seconds=self.retry_delay())
+        else:
+            self.status = 'failed'
+            self.finished_at = timezone.now()
+        self.save(update_fields=['status', 'run_at', 'finished_at', 'locked_at', 'last_error'])
@@ -0,0 +1,64 @@
+"""Task registry and enqueueing.
+
+Functions decorated with ``@task`` are registered under a dotted name
+and run by ``run_workers`` with the job payload as keyword arguments.
+Each app keeps its tasks in a ``tasks`` module, which is imported when
+the jobs app is ready.
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import Job
+
+registry = {}
+
+
+class UnknownTask(Exception):
+    """Raised when a job names a task that is not registered."""
+
+
+def task(name):
+    """Register the decorated function as the task called name."""
+    def decorator(func):
+        registry[name] = func
+        return func
+    return decorator
+
+
+def get_task(name):
+    try:
+        return registry[name]
+    except KeyError:
+        raise UnknownTask(f"No task registered as {name}")
+
+
+def enqueue(name, payload=None, priority=0, delay=0, max_attempts=3):
+    """Queue a job for the named task and return it.
+
+    The job row is written in the caller's transaction, so work queued
+    from inside ``transaction.atomic`` only becomes visible to workers
+    once the data it refers to has been committed.
+    """
+    job = build_job(name, payload, priority, delay, max_attempts)
+    job.save(force_insert=True)
+    return job
+
+
+def enqueue_many(jobs):
+    """Queue several jobs with one INSERT and return them.
+
+    ``jobs`` is a list of dicts of ``enqueue`` arguments.
+    """
+    return Job.objects.bulk_create([build_job(**job) for job in jobs])
+
+
+def build_job(name, payload=None, priority=0, delay=0, max_attempts=3):
+    get_task(name)
+    return Job(
+        task=name,
+        payload=payload or {},
+        priority=priority,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts,
+    )
@@ -0,0 +1,98 @@
+import threading
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import Job
+from .tasks import enqueue, enqueue_many, task
+from .worker import Worker
+
+calls = []
+
+
+@task('jobs.tests.record')
+def record(value):
+    calls.append(value)
+
+
+@task('jobs.tests.fail')
+def fail():
+    raise RuntimeError("boom")
+
+
+class JobQueueTests(TestCase):
+    """Jobs are claimed by priority and retried with backoff."""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_priority_order(self):
+        enqueue('jobs.tests.record', {'value': 'low'})
+        enqueue('jobs.tests.record', {'value': 'high'}, priority=10)
+        enqueue('jobs.tests.record', {'value': 'later'}, priority=20, delay=60)
+
+        Worker().run(burst=True)
+
+        self.assertEqual(calls, ['high', 'low'])
+        self.assertEqual(Job.objects.filter(status='done').count(), 2)
+        self.assertEqual(Job.objects.get(status='queued').payload, {'value': 'later'})
+
+    def test_enqueue_many(self):
+        with self.assertNumQueries(1):
+            jobs = enqueue_many([
+                {'name': 'jobs.tests.record', 'payload': {'value': 'second'}},
+                {'name': 'jobs.tests.record', 'payload': {'value': 'first'}, 'priority': 10},
+            ])
+        self.assertEqual([job.priority for job in jobs], [0, 10])
+
+        Worker().run(burst=True)
+        self.assertEqual(calls, ['first', 'second'])
+
+    def test_job_is_claimed_once(self):
+        job = enqueue('jobs.tests.record', {'value': 1})
+        self.assertEqual(Job.objects.claim('a'), job)
+        self.assertIsNone(Job.objects.claim('b'))
+
+    @override_settings(JOBS_RETRY_BACKOFF=10)
+    def test_retry_with_backoff_then_fail(self):
+        job = enqueue('jobs.tests.fail', max_attempts=2)
+
+        with self.assertLogs('jobs.worker', 'ERROR'):
+            Worker().run(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertIn('boom', job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=5))
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        with self.assertLogs('jobs.worker', 'ERROR'):
+            Worker().run(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+
+    def test_workers_are_named_by_their_thread(self):
+        workers = [Worker(), Worker()]
+        running = threading.Barrier(len(workers))  # Keep both threads alive, as run_workers does
+        threads = [
+            threading.Thread(target=lambda worker: (worker.name, running.wait()), args=(worker,))
+            for worker in workers
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertNotEqual(workers[0].name, workers[1].name)
+        self.assertEqual(Worker(name='fixed').name, 'fixed')
+
+    def test_stale_jobs_are_requeued(self):
+        job = enqueue('jobs.tests.record', {'value': 'stale'})
+        Job.objects.claim('gone')
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=2))
+
+        out = StringIO()
+        call_command('run_workers', '--burst', stdout=out)
+        self.assertEqual(calls, ['stale'])
+        self.assertIn('Requeued 1 stale job(s)', out.getvalue())
@@ -0,0 +1,75 @@
+"""Database-backed job worker.
+
+A Worker repeatedly claims the next runnable job, runs its task and
+records the outcome. Failed jobs are retried with exponential backoff
+until they run out of attempts. Several workers, in one process or
+many, can share the queue because claiming is atomic.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+
+from django.db import close_old_connections
+
+from .models import Job
+from .tasks import get_task
+
+logger = logging.getLogger(__name__)
+
+
+class Worker:
+    """Claim and run jobs until stopped or, in burst mode, until the queue is empty."""
+
+    def __init__(self, name=None, poll_interval=1.0):
+        self._name = name
+        self.poll_interval = poll_interval
+        self.stopped = threading.Event()
+        self.processed = 0
+        self.failed = 0
+
+    @property
+    def name(self):
+        """The name jobs are locked by.
+
+        Unless given, it is taken from the thread that first claims a job,
+        so workers created together but run in separate threads differ.
+        """
+        if self._name is None:
+            self._name = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        return self._name
+
+    def stop(self):
+        self.stopped.set()
+
+    def run_job(self, job):
+        """Run one claimed job and record whether it succeeded."""
+        try:
+            get_task(job.task)(**job.payload)
+        except Exception:
+            logger.exception("Job %s failed", job)
+            job.mark_failed(traceback.format_exc())
+            self.failed += 1
+        else:
+            job.mark_done()
+            self.processed += 1
+
+    def run_once(self):
+        """Run the next runnable job. Returns False if there was none."""
+        close_old_connections()
+        job = Job.objects.claim(self.name)
+        if job is None:
+            return False
+        self.run_job(job)
+        return True
+
+    def run(self, burst=False, max_jobs=None):
+        while not self.stopped.is_set():
+            if max_jobs is not None and self.processed + self.failed >= max_jobs:
+                break
+            if not self.run_once():
+                if burst:
+                    break
+                self.stopped.wait(self.poll_interval)
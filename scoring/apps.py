@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ScoringConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'scoring'
+
+    def ready(self):
+        from . import referrals, rules  # noqa: F401
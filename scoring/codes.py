@@ -0,0 +1,184 @@
+"""Referral codes.
+
+A code is a value of the 'referral' CodeSequence passed through a keyed
+permutation of [0, 2**45) and written as 9 Crockford base32 characters.
+Sequence values are never reused and the permutation is a bijection, so
+codes are unique without checking the database or retrying, yet
+consecutive codes look unrelated. Legacy codes are 8 hex characters and
+can never equal a new code.
+
+Uniqueness only holds while the key stays the same, so the sequence row
+records a fingerprint of REFERRAL_CODE_KEY and reserving values with a
+different key raises CodeKeyChanged instead of issuing codes that may
+repeat old ones.
+
+Each thread keeps a pool of sequence values reserved a block at a time
+(REFERRAL_CODE_BLOCK_SIZE), so bursts of invitations touch the counter
+row once per block instead of once per code.
+"""
+import functools
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.db.models import Case, F, Value, When
+
+from .models import CodeSequence
+from .services import can_return_from_update
+
+CODE_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'  # Crockford base32
+CODE_LENGTH = 9
+CODE_BITS = 5 * CODE_LENGTH
+
+# Feistel network over 2 * HALF_BITS bits; results outside CODE_BITS are
+# permuted again ("cycle walking") until they fall inside
+HALF_BITS = (CODE_BITS + 1) // 2
+HALF_MASK = (1 << HALF_BITS) - 1
+ROUNDS = 8
+
+SEQUENCE = 'referral'
+
+
+class CodeKeyChanged(ImproperlyConfigured):
+    """Raised when REFERRAL_CODE_KEY differs from the key a sequence's codes were issued with."""
+
+
+def code_key():
+    return getattr(settings, 'REFERRAL_CODE_KEY', settings.SECRET_KEY)
+
+
+def key_id(key):
+    """Return the fingerprint of key stored alongside the sequence."""
+    return hashlib.sha256(f"{key}:referral-code-key".encode()).hexdigest()[:16]
+
+
+@functools.lru_cache(maxsize=4)
+def round_keys(key):
+    return [hashlib.sha256(f"{key}:referral-code:{i}".encode()).digest() for i in range(ROUNDS)]
+
+
+def permute(value, key=None):
+    """Map value in [0, 2**CODE_BITS) to a distinct value in the same range."""
+    if not 0 <= value < 1 << CODE_BITS:
+        raise ValueError(f"{value} is outside the code space")
+    keys = round_keys(key or code_key())
+    while True:
+        left, right = value >> HALF_BITS, value & HALF_MASK
+        for round_key in keys:
+            digest = hashlib.blake2b(right.to_bytes(4, 'big'), key=round_key, digest_size=4).digest()
+            left, right = right, left ^ (int.from_bytes(digest, 'big') & HALF_MASK)
+        value = (left << HALF_BITS) | right
+        if value < 1 << CODE_BITS:
+            return value
+
+
+def encode(value):
+    """Write value as CODE_LENGTH base32 characters."""
+    chars = []
+    for _ in range(CODE_LENGTH):
+        value, index = divmod(value, 32)
+        chars.append(CODE_ALPHABET[index])
+    return ''.join(reversed(chars))
+
+
+def reserve_sql():
+    """UPDATE ... RETURNING that reserves values and reads back the key fingerprint."""
+    qn = connection.ops.quote_name
+    next_value, key, name = (
+        qn(CodeSequence._meta.get_field(field).column) for field in ('next_value', 'key_id', 'name')
+    )
+    # A sequence from before keys were recorded adopts the current key
+    return (
+        "UPDATE {table} SET {next_value} = {next_value} + %s, "
+        "{key} = CASE WHEN {key} = '' THEN %s ELSE {key} END "
+        "WHERE {name} = %s RETURNING {next_value}, {key}"
+    ).format(table=qn(CodeSequence._meta.db_table), next_value=next_value, key=key, name=name)
+
+
+def reserve_block(size, name=SEQUENCE):
+    """Reserve size consecutive values of a sequence; returns the first one.
+
+    Raises CodeKeyChanged, reserving nothing, if the sequence was used
+    with another key.
+    """
+    current = key_id(code_key())
+    with transaction.atomic():
+        if can_return_from_update():
+            with connection.cursor() as cursor:
+                cursor.execute(reserve_sql(), [size, current, name])
+                row = cursor.fetchone()
+        else:
+            sequence = CodeSequence.objects.filter(pk=name)
+            sequence.update(
+                next_value=F('next_value') + size,
+                key_id=Case(When(key_id='', then=Value(current)), default=F('key_id')),
+            )
+            row = sequence.values_list('next_value', 'key_id').first()
+        if row is None:
+            CodeSequence.objects.get_or_create(name=name, defaults={'key_id': current})
+            return reserve_block(size, name)
+        end, stored = row
+        if stored != current:
+            raise CodeKeyChanged(
+                f"REFERRAL_CODE_KEY differs from the key the {name!r} codes were issued with; "
+                "restore it, or new codes may repeat existing ones"
+            )
+    return end - size
+
+
+class CodePool(threading.local):
+    """Sequence values reserved ahead of time, handed out as codes."""
+
+    def __init__(self, block_size=None):
+        self.block_size = block_size or getattr(settings, 'REFERRAL_CODE_BLOCK_SIZE', 100)
+        self.next = self.end = 0
+        self.pid = None
+
+    def reserve(self, size):
+        start = reserve_block(size)
+        self.next, self.end, self.pid = start, start + size, os.getpid()
+
+    def take(self, count=1):
+        """Return count new codes.
+
+        A block reserved inside a transaction is undone if it rolls back,
+        so only this call uses it until then; the rest of the block is
+        handed back to the pool from an on_commit callback.
+        """
+        if self.pid != os.getpid():
+            self.next = self.end = 0  # Forked since reserving: the parent hands out the same values
+        reserved_in_transaction = False
+        values = []
+        while len(values) < count:
+            if self.next >= self.end:
+                self.reserve(max(self.block_size, count - len(values)))
+                reserved_in_transaction = connection.in_atomic_block
+            taken = min(count - len(values), self.end - self.next)
+            values.extend(range(self.next, self.next + taken))
+            self.next += taken
+        if reserved_in_transaction:
+            rest = (self.next, self.end)
+            self.next = self.end = 0
+            transaction.on_commit(lambda: self.restore(*rest))
+        return [encode(permute(value)) for value in values]
+
+    def restore(self, start, end):
+        """Make the committed values start..end available again."""
+        if self.next >= self.end and self.pid == os.getpid():
+            self.next, self.end = start, end
+
+
+pool = CodePool()
+
+
+def next_referral_code():
+    """Return a new unique referral code."""
+    return pool.take()[0]
+
+
+def referral_codes(count):
+    """Return count new unique referral codes, e.g. for a batch of invitations."""
+    return pool.take(count)
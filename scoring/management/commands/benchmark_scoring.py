@@ -0,0 +1,103 @@
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from scoring.engine import recompute_scores
+from scoring.models import ScoreLog
+
+User = get_user_model()
+
+# Rule values the test users were scored with, and the change to apply
+OLD_POINTS = {'referral': 10, 'phone_bill': 20, 'kyc_level_1': 5}
+NEW_POINTS = {'referral': 15, 'phone_bill': 20, 'kyc_level_1': 5, 'kyc_level_2': 10}
+LOGGED_REASONS = ('referral', 'phone_bill', 'admin_adjustment')
+ADJUSTMENT_POINTS = 7
+
+
+class Command(BaseCommand):
+    help = 'Create test users with score logs and time a full score recomputation after a rule change'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=1000000,
+            help='Number of test users',
+        )
+        parser.add_argument(
+            '--logs-per-user',
+            type=int,
+            default=3,
+            help='Number of score log rows per test user',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=900,
+            help='Number of users updated per query',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the test users and their score logs afterwards',
+        )
+
+    def handle(self, *args, **options):
+        prefix = f"+score{uuid.uuid4().hex[:6]}"
+        started = time.perf_counter()
+        self.create_users(prefix, options['users'], options['logs_per_user'])
+        self.stdout.write(
+            f"Created {options['users']} user(s) with {options['logs_per_user']} log(s) each "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+        users = User.objects.filter(phone_number__startswith=prefix)
+
+        try:
+            unchanged = recompute_scores(users, points=OLD_POINTS, dry_run=True, kyc_bonus=True)
+            if unchanged['changed']:
+                raise CommandError(f"{unchanged['changed']} score(s) changed before any rule did")
+
+            stats = recompute_scores(users, points=NEW_POINTS, batch_size=options['batch_size'], kyc_bonus=True)
+            total = stats['load_seconds'] + stats['compute_seconds'] + stats['write_seconds']
+            self.stdout.write(
+                f"Recomputed {stats['users']} score(s) in {total:.2f}s "
+                f"({stats['users'] / max(total, 1e-9):.0f} users/s): "
+                f"load {stats['load_seconds']:.2f}s, compute {stats['compute_seconds']:.3f}s, "
+                f"write {stats['write_seconds']:.2f}s, {stats['changed']} changed"
+            )
+
+            again = recompute_scores(users, points=NEW_POINTS, dry_run=True, kyc_bonus=True)
+            if again['changed']:
+                raise CommandError(f"{again['changed']} score(s) still differ after recomputing")
+        finally:
+            if not options['keep']:
+                ScoreLog.objects.filter(user__in=users).delete()
+                users.delete()
+
+        self.stdout.write(self.style.SUCCESS("Every score matches the new rules"))
+
+    def create_users(self, prefix, count, logs_per_user, batch_size=5000):
+        """Create count users with logs_per_user score logs each, scored with OLD_POINTS."""
+        for start in range(0, count, batch_size):
+            users = []
+            for i in range(start, min(start + batch_size, count)):
+                kyc_level = i % 3
+                reasons = [LOGGED_REASONS[(i + j) % len(LOGGED_REASONS)] for j in range(logs_per_user)]
+                score = sum(OLD_POINTS.get(reason, ADJUSTMENT_POINTS) for reason in reasons)
+                score += OLD_POINTS['kyc_level_1'] if kyc_level >= 1 else 0
+                user = User(phone_number=f"{prefix}{i:07d}", password='!', kyc_level=kyc_level, score=score)
+                user.reasons = reasons
+                users.append(user)
+            User.objects.bulk_create(users)
+            ScoreLog.objects.bulk_create([
+                ScoreLog(
+                    user_id=user.pk,
+                    reason=reason,
+                    points_added=OLD_POINTS.get(reason, ADJUSTMENT_POINTS),
+                    previous_score=0,
+                    new_score=0,
+                )
+                for user in users
+                for reason in user.reasons
+            ])
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from scoring.engine import KYC_RULES, recompute_scores
+from scoring.rules import active_rule_points
+
+
+class Command(BaseCommand):
+    help = 'Recompute every user score from the score logs and the active scoring rules'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=900,
+            help='Number of users updated per query',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many scores would change',
+        )
+        parser.add_argument(
+            '--kyc-bonus',
+            action='store_true',
+            help='Add the kyc_level_1/kyc_level_2 rule points to users at those levels '
+                 '(never awarded otherwise, so this raises existing scores)',
+        )
+
+    def handle(self, *args, **options):
+        points = active_rule_points()
+        rules = ", ".join(f"{rule_type}={value}" for rule_type, value in sorted(points.items())) or "none"
+        self.stdout.write(f"Active rules: {rules}")
+        kyc_rules = [rule_type for _, rule_type in KYC_RULES if rule_type in points]
+        if options['kyc_bonus']:
+            self.stdout.write(self.style.WARNING(
+                f"KYC bonus included: {', '.join(kyc_rules) or 'no active KYC rule'} added to verified users"
+            ))
+        elif kyc_rules:
+            self.stdout.write(f"KYC bonus not included ({', '.join(kyc_rules)}); pass --kyc-bonus to add it")
+
+        stats = recompute_scores(
+            points=points,
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+            kyc_bonus=options['kyc_bonus'],
+        )
+
+        self.stdout.write(
+            f"Loaded {stats['users']} user(s) in {stats['load_seconds']:.2f}s, "
+            f"computed in {stats['compute_seconds']:.2f}s, wrote in {stats['write_seconds']:.2f}s"
+        )
+        verb = "would change" if options['dry_run'] else "changed"
+        self.stdout.write(self.style.SUCCESS(f"{stats['changed']} score(s) {verb}"))
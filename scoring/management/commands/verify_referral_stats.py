@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from scoring.models import Referral, ReferralStats
+from scoring.referrals import count_referrals
+
+COUNTERS = ('invites_count', 'direct_count', 'downstream_count')
+
+
+class Command(BaseCommand):
+    help = 'Check the precomputed referral counts against the referral graph'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Rewrite drifted counters from the referral graph',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rows written per batch',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            expected = count_referrals(
+                Referral.objects.order_by().values_list('referrer_id', 'referred_user_id').iterator(chunk_size=5000)
+            )
+            stored = {
+                user_id: counts
+                for user_id, *counts in ReferralStats.objects.values_list('user_id', *COUNTERS).iterator(chunk_size=5000)
+            }
+
+        drifted = []
+        for user_id in expected.keys() | stored.keys():
+            counts = expected.get(user_id, (0, 0, 0))
+            if tuple(stored.get(user_id, (0, 0, 0))) != counts:
+                self.stdout.write(self.style.WARNING(
+                    f"User {user_id}: stored {tuple(stored.get(user_id, (0, 0, 0)))} != counted {counts}"
+                ))
+                drifted.append(ReferralStats(user_id=user_id, **dict(zip(COUNTERS, counts))))
+
+        self.stdout.write(f"Checked {len(expected)} referrer(s): {len(drifted)} drifted")
+
+        if not options['fix']:
+            if drifted:
+                raise CommandError("Referral stats do not match the referral graph")
+            self.stdout.write(self.style.SUCCESS("Referral stats are consistent"))
+            return
+
+        ReferralStats.objects.bulk_create(
+            drifted,
+            batch_size=options['batch_size'],
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=list(COUNTERS),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Rewrote {len(drifted)} user(s)"))
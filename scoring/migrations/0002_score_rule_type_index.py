@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-17 03:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scoring', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='scorerule',
+            index=models.Index(fields=['rule_type', 'is_active'], name='score_rule_type_idx'),
+        ),
+    ]
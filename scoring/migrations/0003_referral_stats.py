@@ -0,0 +1,49 @@
+# Generated by Django 5.0.1 on 2026-10-17 03:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from scoring.referrals import count_referrals
+
+
+def build_referral_stats(apps, schema_editor):
+    """Count the referrals that exist before the counters are maintained."""
+    Referral = apps.get_model('scoring', 'Referral')
+    ReferralStats = apps.get_model('scoring', 'ReferralStats')
+    counts = count_referrals(Referral.objects.values_list('referrer_id', 'referred_user_id').iterator())
+    ReferralStats.objects.bulk_create(
+        [
+            ReferralStats(user_id=user_id, invites_count=invites, direct_count=direct, downstream_count=downstream)
+            for user_id, (invites, direct, downstream) in counts.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_remove_user_email_remove_user_is_email_verified_and_more'),
+        ('scoring', '0002_score_rule_type_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferralStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='referral_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('invites_count', models.IntegerField(default=0)),
+                ('direct_count', models.IntegerField(default=0)),
+                ('downstream_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Referral Stats',
+                'verbose_name_plural': 'Referral Stats',
+                'db_table': 'referral_stats',
+                'indexes': [models.Index(fields=['-downstream_count', 'user'], name='referral_stats_downstream_idx'), models.Index(fields=['-direct_count', 'user'], name='referral_stats_direct_idx')],
+            },
+        ),
+        migrations.RunPython(build_referral_stats, migrations.RunPython.noop),
+    ]
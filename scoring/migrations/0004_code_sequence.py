@@ -0,0 +1,31 @@
+# Generated by Django 5.0.1 on 2026-10-17 03:18
+
+from django.db import migrations, models
+
+
+def create_referral_sequence(apps, schema_editor):
+    CodeSequence = apps.get_model('scoring', 'CodeSequence')
+    CodeSequence.objects.get_or_create(name='referral')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scoring', '0003_referral_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodeSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Code Sequence',
+                'verbose_name_plural': 'Code Sequences',
+                'db_table': 'code_sequence',
+            },
+        ),
+        migrations.RunPython(create_referral_sequence, migrations.RunPython.noop),
+    ]
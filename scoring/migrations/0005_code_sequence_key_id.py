@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-17 03:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scoring', '0004_code_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codesequence',
+            name='key_id',
+            field=models.CharField(blank=True, max_length=16),
+        ),
+    ]
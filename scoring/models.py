@@ -71,13 +71,57 @@ class Referral(models.Model):
         verbose_name_plural = 'Referrals'
         ordering = ['-created_at']
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember which user the stored referral was used by."""
+        instance = super().from_db(db, field_names, values)
+        stored = dict(zip(field_names, values))
+        instance._stored_referred_user_id = stored.get('referred_user_id')
+        return instance
+
     @staticmethod
     def generate_referral_code(user):
-        """Generate unique referral code."""
-        import hashlib
-        import uuid
-        data = f"{user.phone_number}_{uuid.uuid4()}"
-        return hashlib.md5(data.encode()).hexdigest()[:8]
+        """Generate a unique referral code, see scoring.codes."""
+        from .codes import next_referral_code
+        return next_referral_code()
+
+
+class CodeSequence(models.Model):
+    """A named counter from which processes reserve blocks of values."""
+
+    name = models.CharField(max_length=50, primary_key=True)
+    next_value = models.BigIntegerField(default=0)
+    key_id = models.CharField(max_length=16, blank=True)  # Fingerprint of the key values are permuted with
+
+    def __str__(self):
+        return f"{self.name} - {self.next_value}"
+
+    class Meta:
+        db_table = 'code_sequence'
+        verbose_name = 'Code Sequence'
+        verbose_name_plural = 'Code Sequences'
+
+
+class ReferralStats(models.Model):
+    """Precomputed referral counts of a user, kept current by scoring.referrals."""
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='referral_stats')
+    invites_count = models.IntegerField(default=0)  # Referrals created by the user
+    direct_count = models.IntegerField(default=0)  # Invited users who joined
+    downstream_count = models.IntegerField(default=0)  # Users who joined below the user, at any depth
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Referrals - {self.user_id}"
+
+    class Meta:
+        db_table = 'referral_stats'
+        verbose_name = 'Referral Stats'
+        verbose_name_plural = 'Referral Stats'
+        indexes = [
+            models.Index(fields=['-downstream_count', 'user'], name='referral_stats_downstream_idx'),
+            models.Index(fields=['-direct_count', 'user'], name='referral_stats_direct_idx'),
+        ]
 
 
 class ScoreRule(models.Model):
@@ -106,3 +150,6 @@ class ScoreRule(models.Model):
         db_table = 'score_rule'
         verbose_name = 'Score Rule'
         verbose_name_plural = 'Score Rules'
+        indexes = [
+            models.Index(fields=['rule_type', 'is_active'], name='score_rule_type_idx'),
+        ]
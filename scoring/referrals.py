@@ -0,0 +1,229 @@
+"""Referral graph.
+
+Every Referral whose code was used links the referrer to the referred
+user, so referrals form a tree of who brought in whom. ReferralStats
+keeps, per user, the number of invites, of direct referrals who joined
+and of users who joined anywhere below them. The counters are moved
+incrementally when a referral is created, used or deleted: linking a
+user adds their own subtree to the referrer and to every ancestor,
+found with one recursive query. Deleting a user cascades to their
+referrals after the links above them are gone, so the counters of
+their former ancestors are recounted from the graph instead.
+verify_referral_stats rebuilds the counters from scratch.
+
+Tree and ancestor queries use WITH RECURSIVE, which SQLite, PostgreSQL
+and MySQL 8 all support.
+"""
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Referral, ReferralStats
+from .signals import referral_stats_changed
+
+User = get_user_model()
+
+# UNION rather than UNION ALL stops at users already seen, so even a
+# malformed cycle terminates
+ANCESTORS_SQL = """
+    WITH RECURSIVE ancestors(user_id) AS (
+        SELECT referrer_id FROM referral WHERE referred_user_id = %s
+        UNION
+        SELECT r.referrer_id FROM referral r JOIN ancestors a ON r.referred_user_id = a.user_id
+    )
+    SELECT user_id FROM ancestors
+"""
+
+TREE_SQL = """
+    WITH RECURSIVE tree(user_id, referrer_id, depth) AS (
+        SELECT referred_user_id, referrer_id, 1 FROM referral
+        WHERE referrer_id = %s AND referred_user_id IS NOT NULL
+        UNION ALL
+        SELECT r.referred_user_id, r.referrer_id, t.depth + 1 FROM referral r
+        JOIN tree t ON r.referrer_id = t.user_id
+        WHERE r.referred_user_id IS NOT NULL AND t.depth < %s
+    )
+    SELECT t.user_id, t.referrer_id, t.depth, u.phone_number
+    FROM tree t JOIN accounts_user u ON u.id = t.user_id
+    ORDER BY t.depth, t.referrer_id, t.user_id
+"""
+
+TREE_COLUMNS = ('user_id', 'referrer_id', 'depth', 'phone_number')
+
+DOWNSTREAM_SQL = """
+    WITH RECURSIVE tree(root_id, user_id) AS (
+        SELECT referrer_id, referred_user_id FROM referral
+        WHERE referrer_id IN ({}) AND referred_user_id IS NOT NULL
+        UNION
+        SELECT t.root_id, r.referred_user_id FROM referral r
+        JOIN tree t ON r.referrer_id = t.user_id
+        WHERE r.referred_user_id IS NOT NULL
+    )
+    SELECT root_id, COUNT(*) FROM tree WHERE user_id != root_id GROUP BY root_id
+"""
+
+LEADERBOARD_ORDERS = {
+    'downstream': 'downstream_count',
+    'direct': 'direct_count',
+}
+
+
+def ancestors(user_id):
+    """Return the ids of everyone above user_id in the referral tree, nearest first."""
+    with connection.cursor() as cursor:
+        cursor.execute(ANCESTORS_SQL, [user_id])
+        return [row[0] for row in cursor.fetchall() if row[0] != user_id]
+
+
+def referral_tree(user_id, max_depth=3):
+    """Return the users who joined below user_id, at most max_depth levels down.
+
+    Each row is a dict with the TREE_COLUMNS keys, shallowest first.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(TREE_SQL, [user_id, max_depth])
+        return [dict(zip(TREE_COLUMNS, row)) for row in cursor.fetchall()]
+
+
+def top_referrers(limit=10, by='downstream'):
+    """Return the ReferralStats of the users with the most referrals, with users loaded."""
+    field = LEADERBOARD_ORDERS[by]
+    return list(
+        ReferralStats.objects.select_related('user')
+        .filter(**{f"{field}__gt": 0})
+        .order_by(f"-{field}", 'user_id')[:limit]
+    )
+
+
+def _create_stats(user_ids):
+    ReferralStats.objects.bulk_create([ReferralStats(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+
+
+def add_invites(referrer_id, delta):
+    """Move the invite count of referrer_id by delta; returns the changed user ids."""
+    if delta > 0:
+        _create_stats([referrer_id])
+    ReferralStats.objects.filter(pk=referrer_id).update(
+        invites_count=F('invites_count') + delta, updated_at=timezone.now(),
+    )
+    return {referrer_id}
+
+
+def move_subtree(referrer_id, user_id, sign):
+    """Attach (sign=1) or detach (sign=-1) user_id and their subtree below referrer_id.
+
+    Returns the changed user ids. A link that would close a cycle is not
+    counted.
+    """
+    above = [referrer_id, *ancestors(referrer_id)]
+    if user_id in above:
+        return set()
+    size = 1 + (ReferralStats.objects.filter(pk=user_id).values_list('downstream_count', flat=True).first() or 0)
+    if sign > 0:
+        # Decrements only touch existing rows, so cascades never recreate them
+        _create_stats(above)
+    now = timezone.now()
+    ReferralStats.objects.filter(pk=referrer_id).update(direct_count=F('direct_count') + sign)
+    ReferralStats.objects.filter(pk__in=above).update(
+        downstream_count=F('downstream_count') + sign * size, updated_at=now,
+    )
+    return set(above)
+
+
+def recount(user_ids):
+    """Recompute the direct and downstream counts of user_ids from the graph.
+
+    Costs a walk of each user's whole subtree, so it is only used where
+    the incremental moves cannot be applied. Returns the changed user ids.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return set()
+    direct = dict(
+        Referral.objects.filter(referrer_id__in=user_ids, referred_user__isnull=False)
+        .exclude(referred_user_id=F('referrer_id'))
+        .order_by().values_list('referrer_id').annotate(count=Count('id'))
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(DOWNSTREAM_SQL.format(", ".join(["%s"] * len(user_ids))), user_ids)
+        downstream = dict(cursor.fetchall())
+    now = timezone.now()
+    for user_id in user_ids:
+        ReferralStats.objects.filter(pk=user_id).update(
+            direct_count=direct.get(user_id, 0), downstream_count=downstream.get(user_id, 0), updated_at=now,
+        )
+    return set(user_ids)
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    # Found while the user's own referral still links them to the tree
+    instance._referral_ancestors = ancestors(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    above = getattr(instance, '_referral_ancestors', None)
+    if above:
+        referral_stats_changed.send(sender=ReferralStats, user_ids=sorted(recount(above)))
+
+
+@receiver(post_save, sender=Referral)
+def referral_saved(sender, instance, created, **kwargs):
+    stored = getattr(instance, '_stored_referred_user_id', None)
+    changed = set()
+    with transaction.atomic():
+        if created:
+            changed |= add_invites(instance.referrer_id, 1)
+        if stored != instance.referred_user_id:
+            if stored is not None:
+                changed |= move_subtree(instance.referrer_id, stored, -1)
+            if instance.referred_user_id is not None:
+                changed |= move_subtree(instance.referrer_id, instance.referred_user_id, 1)
+        if changed:
+            referral_stats_changed.send(sender=ReferralStats, user_ids=sorted(changed))
+    instance._stored_referred_user_id = instance.referred_user_id
+
+
+@receiver(post_delete, sender=Referral)
+def referral_deleted(sender, instance, **kwargs):
+    with transaction.atomic():
+        changed = add_invites(instance.referrer_id, -1)
+        if instance.referred_user_id is not None:
+            changed |= move_subtree(instance.referrer_id, instance.referred_user_id, -1)
+        referral_stats_changed.send(sender=ReferralStats, user_ids=sorted(changed))
+
+
+def count_referrals(rows):
+    """Compute {user_id: (invites, direct, downstream)} from (referrer_id, referred_user_id) rows.
+
+    Used to rebuild ReferralStats from scratch.
+    """
+    invites = {}
+    children = {}
+    for referrer_id, referred_user_id in rows:
+        invites[referrer_id] = invites.get(referrer_id, 0) + 1
+        if referred_user_id is not None and referred_user_id != referrer_id:
+            children.setdefault(referrer_id, []).append(referred_user_id)
+
+    # Post-order walk without recursion; users already seen end a cycle
+    downstream = {}
+    seen = set()
+    for root in children:
+        stack = [(root, False)]
+        while stack:
+            user_id, expanded = stack.pop()
+            if expanded:
+                downstream[user_id] = sum(1 + downstream.get(child, 0) for child in children.get(user_id, ()))
+            elif user_id not in seen:
+                seen.add(user_id)
+                stack.append((user_id, True))
+                stack.extend((child, False) for child in children.get(user_id, ()))
+
+    return {
+        user_id: (invites.get(user_id, 0), len(children.get(user_id, ())), downstream.get(user_id, 0))
+        for user_id in invites.keys() | downstream.keys()
+    }
@@ -0,0 +1,86 @@
+"""Process-local cache of the active scoring rules.
+
+Rules change rarely but are read on every award, so each process loads
+them once and keeps them until the rules version in the shared cache
+moves. Saving or deleting a rule bumps that version when the
+transaction commits, which makes every process reload on its next
+lookup; a lookup otherwise costs one cache read and no query.
+
+Loaded rules are also reloaded once they are SCORE_RULES_CACHE_TTL
+seconds old, which bounds how long a process serves old rules when it
+misses a bump: with a process-local cache backend (the LocMemCache
+default) other processes never see it, and a shared one may evict it.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import ScoreRule
+
+VERSION_KEY = 'scoring:rules:version'
+
+# (version, monotonic load time, {rule_type: rule}) of the rules loaded by this process
+_loaded = None
+
+
+def get_rules_version():
+    """Return the current rules version, starting one if needed."""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Start from the clock so a version lost to eviction is never reused
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def active_rules():
+    """Return {rule_type: rule} of the active rules.
+
+    If several rules of one type are active the most recently updated wins.
+    """
+    global _loaded
+    # Read the version first: rules committed after it only make the load newer
+    version = get_rules_version()
+    now = time.monotonic()
+    loaded = _loaded
+    if loaded is not None and loaded[0] == version and now - loaded[1] < getattr(settings, 'SCORE_RULES_CACHE_TTL', 60):
+        return loaded[2]
+    rules = {
+        rule.rule_type: rule
+        for rule in ScoreRule.objects.filter(is_active=True).order_by('updated_at', 'id')
+    }
+    _loaded = (version, now, rules)
+    return rules
+
+
+def active_rule(rule_type):
+    """Return the active rule of rule_type, or None."""
+    return active_rules().get(rule_type)
+
+
+def active_rule_points():
+    """Return {rule_type: points_value} of the active rules."""
+    return {rule_type: rule.points_value for rule_type, rule in active_rules().items()}
+
+
+def invalidate_rules():
+    """Make every process reload the rules once the transaction commits."""
+    transaction.on_commit(_bump_version)
+
+
+def _bump_version():
+    global _loaded
+    _loaded = None
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        pass  # No version yet; the next read starts a fresh one
+
+
+@receiver([post_save, post_delete], sender=ScoreRule)
+def score_rule_changed(sender, **kwargs):
+    invalidate_rules()
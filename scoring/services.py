@@ -0,0 +1,107 @@
+"""Score awards.
+
+An award adds points to User.score with a single UPDATE that returns the
+new score (UPDATE ... RETURNING where the database supports it) and
+records the ScoreLog row in the same transaction. The score is never
+read first, so concurrent awards cannot overwrite each other and every
+log's previous_score/new_score matches the update that produced it.
+"""
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import F
+
+from .engine import RULE_REASONS
+from .models import ScoreLog
+from .rules import active_rule
+from .signals import points_awarded
+
+User = get_user_model()
+
+
+def can_return_from_update():
+    # MySQL and MariaDB have no UPDATE ... RETURNING
+    return connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert
+
+
+def add_to_scores(user_ids, points):
+    """Add points to the scores of user_ids and return {user_id: new_score}.
+
+    Must run inside a transaction, which keeps the rows locked until the
+    logs are written.
+    """
+    if can_return_from_update():
+        qn = connection.ops.quote_name
+        score = qn(User._meta.get_field('score').column)
+        pk = qn(User._meta.pk.column)
+        sql = "UPDATE {} SET {} = {} + %s WHERE {} IN ({}) RETURNING {}, {}".format(
+            qn(User._meta.db_table), score, score, pk, ", ".join(["%s"] * len(user_ids)), pk, score,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [points, *user_ids])
+            return dict(cursor.fetchall())
+    users = User.objects.filter(pk__in=user_ids)
+    users.update(score=F('score') + points)
+    return dict(users.values_list('pk', 'score'))
+
+
+def award_points(user, points, reason, notes=''):
+    """Add points to user's score and log the award; returns the ScoreLog.
+
+    user.score is set to the new score.
+    """
+    with transaction.atomic():
+        new_score = add_to_scores([user.pk], points).get(user.pk)
+        if new_score is None:
+            raise User.DoesNotExist(f"User {user.pk} does not exist")
+        log = ScoreLog.objects.create(
+            user=user,
+            reason=reason,
+            points_added=points,
+            previous_score=new_score - points,
+            new_score=new_score,
+            notes=notes,
+        )
+        points_awarded.send(sender=ScoreLog, user_ids=[user.pk])
+    user.score = new_score
+    return log
+
+
+def award_rule_points(user, reason, notes=''):
+    """Award the points of the active rule for reason; returns the ScoreLog, or None without an active rule."""
+    if reason not in RULE_REASONS:
+        raise ValueError(f"No scoring rule applies to {reason!r}")
+    rule = active_rule(reason)
+    if rule is None:
+        return None
+    return award_points(user, rule.points_value, reason, notes=notes or rule.rule_name)
+
+
+def award_points_bulk(awards, reason, notes='', batch_size=900):
+    """Award {user_id: points} and log every award in one transaction.
+
+    Users awarded the same points share one UPDATE per batch. Returns the
+    created ScoreLog rows; ids of users that do not exist are skipped.
+    """
+    by_points = {}
+    for user_id, points in awards.items():
+        by_points.setdefault(points, []).append(user_id)
+
+    logs = []
+    with transaction.atomic():
+        for points, user_ids in by_points.items():
+            for start in range(0, len(user_ids), batch_size):
+                new_scores = add_to_scores(user_ids[start:start + batch_size], points)
+                logs.extend(
+                    ScoreLog(
+                        user_id=user_id,
+                        reason=reason,
+                        points_added=points,
+                        previous_score=new_score - points,
+                        new_score=new_score,
+                        notes=notes,
+                    )
+                    for user_id, new_score in new_scores.items()
+                )
+        ScoreLog.objects.bulk_create(logs, batch_size=batch_size)
+        points_awarded.send(sender=ScoreLog, user_ids=[log.user_id for log in logs])
+    return logs
@@ -0,0 +1,13 @@
+from django.dispatch import Signal
+
+# Sent with user_ids after the scores of those users were rewritten in
+# bulk by the scoring engine, since bulk writes do not send post_save
+scores_recomputed = Signal()
+
+# Sent with user_ids after points were awarded to those users with an
+# UPDATE, which does not send post_save either
+points_awarded = Signal()
+
+# Sent with user_ids after the ReferralStats of those users changed, since
+# the counters are moved with UPDATEs that do not send post_save
+referral_stats_changed = Signal()
@@ -1,3 +1,375 @@
-from django.test import TestCase
+import time
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from dashboard.models import DashboardSummary
+from . import codes, referrals, services
+from .engine import compute_scores, load_scoring_rows, recompute_scores, write_score_deltas
+from .models import CodeSequence, Referral, ReferralStats, ScoreLog, ScoreRule
+from .rules import VERSION_KEY, active_rule, active_rule_points
+
+User = get_user_model()
+
+
+class ScoreEngineTests(TestCase):
+    """Scores are recomputed from the logs and the active rules in bulk."""
+
+    def setUp(self):
+        cache.clear()
+        self.referral = ScoreRule.objects.create(rule_name='Referral', rule_type='referral', points_value=10)
+        ScoreRule.objects.create(rule_name='KYC 1', rule_type='kyc_level_1', points_value=3)
+        self.user = User.objects.create_user(phone_number='+10000000300', kyc_level=1)
+        self.other = User.objects.create_user(phone_number='+10000000301')
+        self.log(self.user, 'referral', 10)
+        self.log(self.user, 'referral', 10)
+        self.log(self.user, 'admin_adjustment', 5)
+        self.log(self.other, 'phone_bill', 4)
+
+    def log(self, user, reason, points):
+        ScoreLog.objects.create(user=user, reason=reason, points_added=points, previous_score=0, new_score=0)
+
+    def scores(self):
+        return dict(User.objects.order_by('pk').values_list('phone_number', 'score'))
+
+    def test_rule_change_reprices_logged_awards(self):
+        stats = recompute_scores()
+        self.assertEqual(stats['changed'], 2)
+        self.assertEqual(self.scores(), {'+10000000300': 25, '+10000000301': 4})
+
+        self.referral.points_value = 15
+        with self.captureOnCommitCallbacks(execute=True):
+            self.referral.save()
+        recompute_scores()
+        self.assertEqual(self.scores(), {'+10000000300': 35, '+10000000301': 4})
+
+        self.referral.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.referral.save()
+        recompute_scores()
+        self.assertEqual(self.scores(), {'+10000000300': 25, '+10000000301': 4})
+
+    def test_compute_is_vectorized_over_rows(self):
+        rows = load_scoring_rows(User.objects.all(), {'referral': 10, 'kyc_level_1': 3})
+        self.assertEqual(rows['referral'].tolist(), [2, 0])
+        self.assertEqual(rows['logged'].tolist(), [5, 4])
+        self.assertEqual(compute_scores(rows, {'referral': 1, 'kyc_level_1': 3}).tolist(), [7, 4])
+        self.assertEqual(compute_scores(rows, {'referral': 1, 'kyc_level_1': 3}, kyc_bonus=True).tolist(), [10, 4])
+
+    def test_writes_deltas_so_later_awards_are_kept(self):
+        rows = load_scoring_rows(User.objects.all(), {'referral': 10})
+        User.objects.filter(pk=self.user.pk).update(score=50)  # Awarded after loading
+        deltas = compute_scores(rows, {'referral': 10}) - rows['score']
+        write_score_deltas(rows['id'], deltas, batch_size=1)
+        self.assertEqual(self.scores(), {'+10000000300': 75, '+10000000301': 4})
+
+    def test_dry_run_and_summaries(self):
+        DashboardSummary.objects.build(self.user.pk)
+        stats = recompute_scores(dry_run=True)
+        self.assertEqual(stats['changed'], 2)
+        self.assertEqual(self.scores(), {'+10000000300': 0, '+10000000301': 0})
+
+        recompute_scores(users=User.objects.filter(pk=self.user.pk))
+        self.assertEqual(self.scores(), {'+10000000300': 25, '+10000000301': 0})
+        self.assertEqual(DashboardSummary.objects.get(pk=self.user.pk).score, 25)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('recompute_scores', stdout=out)
+        self.assertIn('Active rules: kyc_level_1=3, referral=10', out.getvalue())
+        self.assertIn('KYC bonus not included (kyc_level_1)', out.getvalue())
+        self.assertIn('2 score(s) changed', out.getvalue())
+        self.assertEqual(self.scores(), {'+10000000300': 25, '+10000000301': 4})
+
+    def test_kyc_bonus_is_opt_in(self):
+        out = StringIO()
+        call_command('recompute_scores', kyc_bonus=True, stdout=out)
+        self.assertIn('KYC bonus included: kyc_level_1 added to verified users', out.getvalue())
+        self.assertEqual(self.scores(), {'+10000000300': 28, '+10000000301': 4})
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_scoring', users=30, logs_per_user=4, stdout=out)
+        self.assertIn('Every score matches the new rules', out.getvalue())
+        self.assertFalse(User.objects.filter(phone_number__startswith='+score').exists())
+
+
+class RuleCacheTests(TestCase):
+    """Active rules are read from a process-local cache invalidated on change."""
+
+    def setUp(self):
+        cache.clear()
+        self.rule = ScoreRule.objects.create(rule_name='Phone bill', rule_type='phone_bill', points_value=20)
+
+    def test_lookups_after_the_first_do_not_query(self):
+        self.assertEqual(active_rule('phone_bill'), self.rule)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(active_rule_points(), {'phone_bill': 20})
+            self.assertIsNone(active_rule('referral'))
+        self.assertEqual(len(queries), 0)
+
+    def test_saving_or_deleting_a_rule_reloads(self):
+        before = active_rule_points()
+        self.rule.points_value = 25
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rule.save()
+            ScoreRule.objects.create(rule_name='Referral', rule_type='referral', points_value=10)
+            # Not committed yet, so other processes keep using the old rules
+            self.assertEqual(active_rule_points(), before)
+        self.assertEqual(active_rule_points(), {'phone_bill': 25, 'referral': 10})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rule.delete()
+        self.assertEqual(active_rule_points(), {'referral': 10})
+
+    def test_version_bumped_by_another_process_reloads(self):
+        active_rule_points()
+        ScoreRule.objects.filter(pk=self.rule.pk).update(points_value=30)
+        self.assertEqual(active_rule_points(), {'phone_bill': 20})
+        cache.incr(VERSION_KEY)
+        self.assertEqual(active_rule_points(), {'phone_bill': 30})
+
+    @override_settings(SCORE_RULES_CACHE_TTL=60)
+    def test_missed_bump_is_picked_up_after_the_ttl(self):
+        active_rule_points()
+        # Changed by another process whose bump never reached this one
+        ScoreRule.objects.filter(pk=self.rule.pk).update(points_value=30)
+        later = time.monotonic() + 61
+        self.assertEqual(active_rule_points(), {'phone_bill': 20})
+        with mock.patch('scoring.rules.time.monotonic', return_value=later):
+            self.assertEqual(active_rule_points(), {'phone_bill': 30})
+
+
+class AwardTests(TestCase):
+    """Awards update the score with one UPDATE and log it in the same transaction."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(phone_number='+10000000310', score=3)
+        self.other = User.objects.create_user(phone_number='+10000000311')
+
+    def logs(self, user):
+        return list(user.score_logs.order_by('id').values_list('points_added', 'previous_score', 'new_score'))
+
+    def test_award_points(self):
+        DashboardSummary.objects.build(self.user.pk)
+        with CaptureQueriesContext(connection) as queries:
+            log = services.award_points(self.user, 5, 'admin_adjustment', notes='Welcome')
+        user_queries = [q['sql'] for q in queries if 'accounts_user' in q['sql'] and 'dashboard' not in q['sql']]
+        self.assertEqual(len(user_queries), 1)
+        self.assertTrue(user_queries[0].startswith('UPDATE'))
+
+        services.award_points(self.user, -2, 'admin_adjustment')
+        self.assertEqual((log.previous_score, log.new_score, log.notes), (3, 8, 'Welcome'))
+        self.assertEqual(self.user.score, 6)
+        self.assertEqual(self.logs(self.user), [(5, 3, 8), (-2, 8, 6)])
+        self.assertEqual(DashboardSummary.objects.get(pk=self.user.pk).score, 6)
+
+    def test_award_points_without_returning(self):
+        with mock.patch.object(services, 'can_return_from_update', return_value=False):
+            services.award_points(self.user, 4, 'other')
+            with self.assertRaises(User.DoesNotExist):
+                services.award_points(User(pk=0), 4, 'other')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.score, 7)
+        self.assertEqual(self.logs(self.user), [(4, 3, 7)])
+
+    def test_award_rule_points(self):
+        self.assertIsNone(services.award_rule_points(self.user, 'referral'))
+        with self.captureOnCommitCallbacks(execute=True):
+            ScoreRule.objects.create(rule_name='Referral bonus', rule_type='referral', points_value=10)
+        log = services.award_rule_points(self.user, 'referral')
+        self.assertEqual((log.reason, log.new_score, log.notes), ('referral', 13, 'Referral bonus'))
+        with self.assertRaises(ValueError):
+            services.award_rule_points(self.user, 'other')
+
+    def test_award_points_bulk(self):
+        third = User.objects.create_user(phone_number='+10000000312')
+        logs = services.award_points_bulk(
+            {self.user.pk: 5, self.other.pk: 5, third.pk: 2, 0: 5}, 'phone_bill', batch_size=1,
+        )
+        self.assertEqual(len(logs), 3)
+        self.assertEqual(
+            dict(User.objects.filter(pk__in=[self.user.pk, self.other.pk, third.pk]).values_list('pk', 'score')),
+            {self.user.pk: 8, self.other.pk: 5, third.pk: 2},
+        )
+        self.assertEqual(self.logs(self.user), [(5, 3, 8)])
+        self.assertEqual(ScoreLog.objects.filter(reason='phone_bill').count(), 3)
+
+
+class ReferralGraphTests(TestCase):
+    """Referral counts are maintained incrementally and the tree can be queried."""
+
+    def setUp(self):
+        self.users = {
+            name: User.objects.create_user(phone_number=f"+1000000032{i}")
+            for i, name in enumerate('abcde')
+        }
+
+    def refer(self, referrer, referred=None):
+        return Referral.objects.create(
+            referrer=self.users[referrer],
+            referred_user=self.users[referred] if referred else None,
+            referral_code=f"{referrer}{referred or Referral.objects.count()}",
+            referred_phone='+19999999999',
+        )
+
+    def stats(self, name):
+        row = ReferralStats.objects.filter(user=self.users[name]).first()
+        return (row.invites_count, row.direct_count, row.downstream_count) if row else (0, 0, 0)
+
+    def test_counts_follow_the_graph(self):
+        DashboardSummary.objects.build(self.users['a'].pk)
+        self.refer('a', 'b')
+        self.refer('b', 'c')
+        self.refer('c', 'd')
+        invite = self.refer('a')
+        self.assertEqual(self.stats('a'), (2, 1, 3))
+        self.assertEqual(self.stats('b'), (1, 1, 2))
+        self.assertEqual(DashboardSummary.objects.get(pk=self.users['a'].pk).referrals_count, 2)
+
+        invite.referred_user = self.users['e']
+        invite.save()
+        self.assertEqual(self.stats('a'), (2, 2, 4))
+
+        Referral.objects.get(referrer=self.users['b']).delete()
+        self.assertEqual(self.stats('a'), (2, 2, 2))
+        self.assertEqual(self.stats('b'), (0, 0, 0))
+        self.assertEqual(self.stats('c'), (1, 1, 1))
+        call_command('verify_referral_stats', stdout=StringIO())
+
+    def test_deleting_a_user_in_the_middle(self):
+        self.refer('e', 'a')
+        self.refer('a', 'b')
+        self.refer('b', 'c')
+        self.refer('c', 'd')
+        self.refer('a')
+        self.assertEqual(self.stats('e'), (1, 1, 4))
+
+        self.users['b'].delete()
+        self.assertEqual(self.stats('e'), (1, 1, 1))
+        self.assertEqual(self.stats('a'), (1, 0, 0))
+        self.assertEqual(self.stats('c'), (1, 1, 1))
+        call_command('verify_referral_stats', stdout=StringIO())
+
+        self.users['a'].delete()  # Cascades to a's referrals and stats
+        self.assertEqual(self.stats('c'), (1, 1, 1))
+        call_command('verify_referral_stats', stdout=StringIO())
+
+    def test_tree_and_leaderboard(self):
+        self.refer('a', 'b')
+        self.refer('a', 'e')
+        self.refer('b', 'c')
+        self.refer('c', 'd')
+        self.refer('d')
+
+        with CaptureQueriesContext(connection) as queries:
+            tree = referrals.referral_tree(self.users['a'].pk, max_depth=2)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(
+            [(row['phone_number'], row['depth']) for row in tree],
+            [('+10000000321', 1), ('+10000000324', 1), ('+10000000322', 2)],
+        )
+        self.assertEqual(len(referrals.referral_tree(self.users['a'].pk, max_depth=10)), 4)
+        self.assertEqual(referrals.ancestors(self.users['d'].pk), [self.users[n].pk for n in 'cba'])
+
+        with CaptureQueriesContext(connection) as queries:
+            leaders = [stats.user.phone_number for stats in referrals.top_referrers(limit=3)]
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(leaders, ['+10000000320', '+10000000321', '+10000000322'])
+        self.assertEqual(
+            [stats.user_id for stats in referrals.top_referrers(by='direct')],
+            [self.users[n].pk for n in 'abc'],
+        )
+
+    def test_verify_command_repairs_drift(self):
+        self.refer('a', 'b')
+        self.refer('b', 'c')
+        ReferralStats.objects.filter(user=self.users['a']).update(downstream_count=7)
+        with self.assertRaises(CommandError):
+            call_command('verify_referral_stats', stdout=StringIO())
+        call_command('verify_referral_stats', fix=True, stdout=StringIO())
+        self.assertEqual(self.stats('a'), (1, 1, 2))
+        call_command('verify_referral_stats', stdout=StringIO())
+
+
+class ReferralCodeTests(TestCase):
+    """Referral codes are a keyed permutation of a sequence, reserved in blocks."""
+
+    def reserves(self, queries):
+        return sum(1 for query in queries if 'code_sequence' in query['sql'] and query['sql'].startswith('UPDATE'))
+
+    def test_permutation_is_a_bijection(self):
+        space = 1 << codes.CODE_BITS
+        values = [codes.permute(value, key='test') for value in [*range(5000), *range(space - 5000, space)]]
+        self.assertEqual(len(set(values)), 10000)
+        self.assertTrue(all(0 <= value < space for value in values))
+        self.assertNotEqual(codes.permute(1, key='test'), codes.permute(1, key='other'))
+        with self.assertRaises(ValueError):
+            codes.permute(space)
+
+        code = codes.encode(codes.permute(0, key='test'))
+        self.assertEqual(len(code), 9)
+        self.assertTrue(set(code) <= set(codes.CODE_ALPHABET))
+        self.assertEqual(codes.encode(space - 1), 'ZZZZZZZZZ')
+
+    def test_pool_reserves_blocks(self):
+        pool = codes.CodePool(block_size=10)
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                issued = pool.take(25)
+            for _ in range(5):
+                with self.captureOnCommitCallbacks(execute=True):
+                    issued.append(pool.take()[0])
+        self.assertEqual(self.reserves(queries), 2)
+        self.assertEqual(len(set(issued)), 30)
+        self.assertEqual(CodeSequence.objects.get(pk='referral').next_value, 35)
+
+        other = codes.CodePool(block_size=10)
+        self.assertFalse(set(other.take(10)) & set(issued))
+
+    def test_rolled_back_block_is_not_reused(self):
+        pool = codes.CodePool(block_size=10)
+        try:
+            with transaction.atomic():
+                rolled_back = pool.take()
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(pool.take(), rolled_back)  # The reservation was undone too
+            pool.take()  # The rest of the block waits for the commit
+        self.assertEqual(self.reserves(queries), 2)
+
+        pool.pid = -1  # As if forked after reserving
+        with CaptureQueriesContext(connection) as queries:
+            pool.take()
+        self.assertEqual(self.reserves(queries), 1)
+
+    def test_key_change_stops_reservations(self):
+        codes.CodePool(block_size=10).take()
+        sequence = CodeSequence.objects.get(pk='referral')
+        self.assertEqual(sequence.key_id, codes.key_id(codes.code_key()))
+
+        with override_settings(REFERRAL_CODE_KEY='rotated'):
+            with self.assertRaises(codes.CodeKeyChanged):
+                codes.CodePool(block_size=10).take()
+        self.assertEqual(CodeSequence.objects.get(pk='referral').next_value, sequence.next_value)
+
+        # A sequence from before keys were recorded adopts the current one
+        CodeSequence.objects.update(key_id='')
+        with override_settings(REFERRAL_CODE_KEY='rotated'):
+            codes.CodePool(block_size=10).take()
+        self.assertEqual(CodeSequence.objects.get(pk='referral').key_id, codes.key_id('rotated'))
+
+    def test_generate_referral_code(self):
+        user = User.objects.create_user(phone_number='+10000000330')
+        generated = {Referral.generate_referral_code(user) for _ in range(200)}
+        self.assertEqual(len(generated), 200)
+        self.assertTrue(all(len(code) == 9 for code in generated))